@@ -3,29 +3,38 @@
 
 import click
 from .benchmark import Benchmark
+from .scheduler import Scheduler, POLICIES
+from .response_cache import ResponseCache
+from .image_cache import image_cache, DEFAULT_MAX_BYTES
+from .payloads import payload_compiler
+from .batch import BatchRun, create_backend
+from .budget import BudgetTracker, report_usage
+from .preflight import probe_models, apply_baselines, report_probes
+from .media import media_registry
+from .journal import Journal
+from .metrics import summarize
+from .merge import merge_results
+from .report import render_pages
+from .results import ResultStream, FORMATS, EXTENSIONS, dump_result, load_result
+from .selection import Selection, Filter, Shard
+from .work_queue import WorkQueue, Worker, PENDING, LEASED, DONE, FAILED
+from .tracing import Tracer, TRACE_FORMATS
+from .mock_server import MockServer, MockBehaviour, DISTRIBUTIONS
+from .harness_benchmark import DEFAULT_SIZES
+from . import harness_benchmark as harness
+from .verdict_cache import VerdictCache
 from pathlib import Path
-from .implementations import PythonImplementation
 from dotenv import load_dotenv
 import time
 import json
 from typing import Any, Callable
 import logging
+import threading
+import os
+import socket
 from .parse_context import ParseContext
 
 
-def sanitize_json_output(o) -> Any:
-    """Removes function type from json output"""
-    temp = vars(o)
-    if type(o) == PythonImplementation:
-        temp = vars(o)
-        if "func" in temp:
-            del temp["func"]
-    elif "access_token" in temp:
-        temp["access_token"] = "### REDACTED ###"
-
-    return temp
-
-
 def extract_jinja2_extension(path: Path) -> str:
     """Extracts the extension of the Jinja2 template"""
     parts = str(path.name).split(".")
@@ -36,8 +45,12 @@ def extract_jinja2_extension(path: Path) -> str:
     return parts[-2]
 
 
+_stdout_lock = threading.Lock()
+
+
 def stdout_reporter(pc: ParseContext, message: str) -> None:
-    print(f"{pc}: {message}")
+    with _stdout_lock:
+        print(f"{pc}: {message}")
 
 
 def logger_reporter(pc: ParseContext, message: str) -> None:
@@ -133,10 +146,26 @@ def cli(
 )
 @click.option(
     "--jinja2",
-    type=click.Path(dir_okay=False, path_type=Path),
+    type=click.Path(path_type=Path),
     default=Path("."),
     show_default=True,
-    help="Path to the Jinja2 template and the output file",
+    help="Path to the Jinja2 template and the output file, or to a directory with "
+    "the templates `index.<ext>.j2` and `taskset.<ext>.j2` of a paginated report",
+)
+@click.option(
+    "--page-size",
+    type=click.IntRange(min=1),
+    default=50,
+    show_default=True,
+    help="Number of tasks per page of a paginated report",
+)
+@click.option(
+    "-w",
+    "--workers",
+    type=click.IntRange(min=1),
+    default=os.cpu_count() or 1,
+    show_default=True,
+    help="Number of processes rendering the pages of a paginated report",
 )
 @click.pass_context
 def report(
@@ -144,6 +173,8 @@ def report(
     dest_dir: Path,
     json_input: Path,
     jinja2: Path,
+    page_size: int,
+    workers: int,
 ) -> None:
     """Generates an report based on the benchmark result and report template."""
 
@@ -152,8 +183,26 @@ def report(
             json_base_name = json_input.stem
 
             rc.report(f"Reading json `{json_input}`")
-            with json_input.open("r") as f:
-                content = json.load(f)
+            content = load_result(json_input)
+
+            if jinja2.is_dir():
+                indices = sorted(jinja2.glob("index.*.j2"))
+                if not indices:
+                    raise BaseException(
+                        f"The directory `{jinja2}` contains no `index.<doc_ext>.j2`"
+                    )
+                with rc.context("pages") as rc:
+                    index_file = render_pages(
+                        rc,
+                        content,
+                        jinja2,
+                        extract_jinja2_extension(indices[0]),
+                        dest_dir / json_base_name,
+                        page_size,
+                        workers,
+                    )
+                rc.report(f"Stored paginated report with index `{index_file}`")
+                return
 
             with rc.context("jinja2") as rc:
                 from jinja2 import Environment, FileSystemLoader
@@ -199,29 +248,627 @@ def report(
     show_default=True,
     help="Path where the output files should be placed",
 )
+@click.option(
+    "-w",
+    "--workers",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="Maximum number of model evaluations running concurrently",
+)
+@click.option(
+    "--grader-workers",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="Maximum number of graders of a single answer running concurrently",
+)
+@click.option(
+    "--cache-dir",
+    type=click.Path(file_okay=False, path_type=Path),
+    default=None,
+    help="Directory of the response cache, answers of identical requests are reused",
+)
+@click.option(
+    "--cache-max-size",
+    type=click.FloatRange(min=0),
+    default=None,
+    help="Maximum size of the response cache in megabytes",
+)
+@click.option(
+    "--cache-max-age",
+    type=click.FloatRange(min=0),
+    default=None,
+    help="Maximum age of response cache entries in days",
+)
+@click.option(
+    "--verdict-cache",
+    type=click.Path(dir_okay=False, path_type=Path),
+    default=None,
+    help="File storing the verdicts of LLM judges, identical gradings are reused",
+)
+@click.option(
+    "--image-cache-size",
+    type=click.FloatRange(min=0),
+    default=DEFAULT_MAX_BYTES / (1024 * 1024),
+    show_default=True,
+    help="Memory budget for encoded images in megabytes",
+)
+@click.option(
+    "--resume",
+    type=bool,
+    is_flag=True,
+    default=False,
+    help="Skip evaluations already stored in the journal of a previous run",
+)
+@click.option(
+    "--shard",
+    type=str,
+    default=None,
+    help="Evaluate only part `i` of `N` parts of the evaluations, e.g. `2/4`",
+)
+@click.option(
+    "--filter",
+    "filters",
+    type=str,
+    multiple=True,
+    help="Evaluate only evaluations matching the expression, e.g. "
+    "`task_type=extraction`, `model=gpt*` or `complexity.input_amount>=2`",
+)
+@click.option(
+    "--config-cache",
+    type=click.Path(file_okay=False, path_type=Path),
+    default=None,
+    help="Directory caching the parsed configuration files by their content",
+)
+@click.option(
+    "--trace-file",
+    type=click.Path(dir_okay=False, path_type=Path),
+    default=None,
+    help="File storing the timing spans of the run",
+)
+@click.option(
+    "--trace-format",
+    type=click.Choice(TRACE_FORMATS, case_sensitive=False),
+    default="chrome",
+    show_default=True,
+    help="Format of the trace file, Chrome trace events or OTLP JSON",
+)
+@click.option(
+    "--format",
+    "output_format",
+    type=click.Choice(FORMATS, case_sensitive=False),
+    default="json",
+    show_default=True,
+    help="Format of the result file, indented or compact JSON, or JSON lines "
+    "written while the evaluations complete",
+)
+@click.option(
+    "--schedule",
+    type=click.Choice(POLICIES, case_sensitive=False),
+    default="order",
+    show_default=True,
+    help="Order of the evaluations, `affinity` evaluates the models sharing a host "
+    "which loads them on demand (e.g. Ollama) one after another",
+)
+@click.option(
+    "--preflight",
+    type=bool,
+    is_flag=True,
+    default=False,
+    help="Probe all models before the run, stop if one of them fails",
+)
+@click.option(
+    "--batch",
+    type=bool,
+    is_flag=True,
+    default=False,
+    help="Request the answers via the batch API of the models, then grade them",
+)
+@click.option(
+    "--batch-backend",
+    type=str,
+    default="openai",
+    show_default=True,
+    help="Batch API, `openai`, `local` (executes the batch directly against the "
+    "endpoints) or a `module:Class`",
+)
+@click.option(
+    "--batch-poll-interval",
+    type=click.FloatRange(min=0),
+    default=60.0,
+    show_default=True,
+    help="Seconds between polling the state of the batches",
+)
 @click.pass_context
-def execute(ctx, config: Path, dest_dir: Path):
+def execute(
+    ctx,
+    config: Path,
+    dest_dir: Path,
+    workers: int,
+    grader_workers: int,
+    cache_dir: Path | None,
+    cache_max_size: float | None,
+    cache_max_age: float | None,
+    verdict_cache: Path | None,
+    image_cache_size: float,
+    resume: bool,
+    shard: str | None,
+    filters: tuple[str, ...],
+    config_cache: Path | None,
+    trace_file: Path | None,
+    trace_format: str,
+    output_format: str,
+    schedule: str,
+    preflight: bool,
+    batch: bool,
+    batch_backend: str,
+    batch_poll_interval: float,
+):
     """Executes the specified multimodal LLM benchmark."""
 
+    tracer = Tracer() if trace_file else None
+    output_format = output_format.lower()
+    writer = None
     try:
-        with ParseContext.root("[execute]", ctx.obj["reporter"]) as pc:
+        with ParseContext.root("[execute]", ctx.obj["reporter"], tracer) as pc:
+            selection = None
+            stem = config.stem
+            if shard or filters:
+                selection = Selection(
+                    tuple(Filter.parse(expression) for expression in filters),
+                    Shard.parse(shard) if shard else None,
+                )
+                if selection.shard:
+                    count = selection.shard.count
+                    stem = f"{stem}.shard-{selection.shard.index}-of-{count}"
+
             with pc.context("parse") as pc:
-                benchmark = Benchmark.parse(pc, config)
+                benchmark = Benchmark.parse(pc, config, config_cache)
+
+            probes = None
+            latencies = None
+            if preflight:
+                with pc.context("preflight") as pc:
+                    pc.report(f"Probing {len(benchmark.models)} models")
+                    probes = probe_models(pc, benchmark.models)
+                    failed = report_probes(pc, probes)
+                    if failed:
+                        pc.raise_error(f"Preflight failed for models {failed}")
+                    latencies = apply_baselines(benchmark.models, probes)
+
+            cache = None
+            if cache_dir:
+                with pc.context("cache") as pc:
+                    cache = ResponseCache(
+                        cache_dir,
+                        int(cache_max_size * 1024 * 1024) if cache_max_size else None,
+                        cache_max_age * 24 * 60 * 60 if cache_max_age else None,
+                    )
+                    pc.report(f"Evicted {cache.evict()} entries from `{cache_dir}`")
+                    for model in benchmark.models.values():
+                        model.use_response_cache(cache)
+
+            image_cache.resize(int(image_cache_size * 1024 * 1024))
+
+            journal_file = dest_dir / f"{stem}.journal.jsonl"
+            if resume and not journal_file.exists():
+                pc.report(f"No journal `{journal_file}` found, starting from scratch")
+            journal = Journal(journal_file, resume)
+
+            grader_context: dict[str, Any] = {}
+            if verdict_cache:
+                pc.report(f"Using verdict cache `{verdict_cache}`")
+                grader_context["verdict_cache"] = VerdictCache(verdict_cache)
+
+            dest_dir.mkdir(parents=True, exist_ok=True)
+            dest_file = dest_dir / f"{stem}.{EXTENSIONS[output_format]}"
+            if output_format == "jsonl":
+                pc.report(f"Streaming evaluations as JSON lines to `{dest_file}`")
+                writer = ResultStream(dest_file, benchmark, benchmark.models)
+
+            units = benchmark.units()
+            if selection is not None:
+                units = selection.select(units)
+            units = [unit for unit in units if journal.get(unit) is None]
+
+            budget = BudgetTracker(benchmark.models, benchmark.budget)
+            with pc.context("budget") as pc:
+                report_usage(pc, budget.estimate_units(units), "estimated")
+                for exceeded in budget.exceeded_estimates():
+                    pc.report(
+                        f"The estimate exceeds the budget {exceeded}, its "
+                        "evaluations stop before the budget is spent"
+                    )
+
+            batch_run = None
+            if batch:
+                with pc.context("batch") as pc:
+                    batch_dir = dest_dir / f"{stem}.batches"
+                    batch_run = BatchRun(
+                        create_backend(batch_backend, batch_dir),
+                        batch_dir,
+                        batch_poll_interval,
+                        resume,
+                    )
+                    answers = batch_run.run(pc, units, benchmark.models, cache, budget)
+                    for model in benchmark.models.values():
+                        model.use_response_cache(answers)
 
             with pc.context("evaluate") as pc:
+                pc.report(f"Recording completed evaluations in `{journal_file}`")
                 start = time.time()
-                result = benchmark.evaluate(pc)
+                scheduler = Scheduler(
+                    workers,
+                    journal,
+                    grader_workers,
+                    writer,
+                    latencies,
+                    schedule.lower(),
+                    budget,
+                )
+                try:
+                    result = benchmark.evaluate(
+                        pc,
+                        scheduler,
+                        grader_context,
+                        selection,
+                    )
+                finally:
+                    journal.close()
+                    if verdict_cache:
+                        grader_context["verdict_cache"].close()
                 duration = time.time() - start
 
                 pc.report(f"Evaluation took {duration:.2f} seconds")
 
-            output = {"config": benchmark, "evaluation": result}
+            output: dict[str, Any] = {"config": benchmark, "evaluation": result}
+            if selection:
+                output["selection"] = selection.describe()
+            if probes:
+                output["preflight"] = probes
+
+            # the streamed evaluations are not kept, only their metrics
+            output["metrics"] = writer.metrics() if writer else summarize(result)
+            if scheduler.swaps:
+                output["swaps"] = scheduler.swaps
+                for host, swaps in scheduler.swaps.items():
+                    pc.report(
+                        f"{host}: {swaps.switches} model switches, "
+                        f"{swaps.load_duration:.2f}s loading models"
+                    )
+            for model_name, metrics in output["metrics"].items():
+                if metrics.latency_p50 is not None:
+                    pc.report(
+                        f"{model_name}: p50 {metrics.latency_p50:.2f}s, "
+                        f"p99 {metrics.latency_p99:.2f}s, "
+                        f"{metrics.total_tokens} tokens, {metrics.retries} retries"
+                    )
+
+            output["budget"] = budget.stats()
+            with pc.context("budget") as pc:
+                spent = output["budget"]["models"]
+                report_usage(
+                    pc, {name: usage["spent"] for name, usage in spent.items()}, "spent"
+                )
+                for model_name, usage in spent.items():
+                    if usage["skipped"]:
+                        pc.report(
+                            f"{model_name}: skipped {usage['skipped']} evaluations"
+                        )
+
+            if verdict_cache:
+                stats = grader_context["verdict_cache"].stats()
+                output["verdict_cache"] = stats
+                pc.report(f"{stats['judge_calls_avoided']} judge calls avoided")
+
+            output["media"] = media_registry.stats() | {
+                "files": {asset.digest: asset for asset in media_registry.assets()}
+            }
+            output["image_cache"] = image_cache.stats()
+            pc.report(
+                f"Image cache: {image_cache.hits} hits, "
+                f"{image_cache.bytes_saved / (1024 * 1024):.1f} MB not read again"
+            )
+            output["payloads"] = payload_compiler.stats()
+            if batch_run:
+                output["batch"] = batch_run.stats()
+
+            if cache:
+                with pc.context("cache") as pc:
+                    output["response_cache"] = cache.stats()
+                    pc.report(
+                        f"{cache.hits} cache hits, {cache.misses} cache misses, "
+                        f"evicted {cache.evict()} entries"
+                    )
+
+            if writer:
+                pc.report(f"Storing summary in `{dest_file}`")
+                writer.finish(
+                    {
+                        name: value
+                        for name, value in output.items()
+                        if name not in ("config", "evaluation")
+                    }
+                )
+            else:
+                pc.report(f"Storing config and evaluation as JSON in `{dest_file}`")
+                dump_result(output, dest_file, output_format)
+
+    except Exception as e:
+        if ctx.obj["show_stacktrace"]:
+            raise e
+        else:
+            print(f"Error: {e}")
+    finally:
+        if writer:
+            writer.close()
+        if tracer and trace_file:
+            tracer.write(trace_file, trace_format.lower())
+
+
+@cli.command()
+@click.option(
+    "-c",
+    "--config",
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+    default="benchmark.yml",
+    show_default=True,
+    help="Path to the benchmark configuration file",
+)
+@click.option(
+    "--rounds",
+    type=click.IntRange(min=1),
+    default=2,
+    show_default=True,
+    help="Number of probes per model, the first one opens the connection",
+)
+@click.option(
+    "--timeout",
+    type=click.FloatRange(min=0),
+    default=60.0,
+    show_default=True,
+    help="Seconds the probes of a model may take",
+)
+@click.option(
+    "-o",
+    "--output",
+    type=click.Path(dir_okay=False, path_type=Path),
+    default=None,
+    help="File storing the probe results as JSON",
+)
+@click.pass_context
+def probe(ctx, config: Path, rounds: int, timeout: float, output: Path | None) -> None:
+    """Checks that all models of the benchmark answer and measures their latency."""
+
+    try:
+        with ParseContext.root("[probe]", ctx.obj["reporter"]) as pc:
+            with pc.context("parse") as pc:
+                benchmark = Benchmark.parse(pc, config)
+
+            pc.report(f"Probing {len(benchmark.models)} models")
+            results = probe_models(pc, benchmark.models, rounds, timeout)
+            failed = report_probes(pc, results)
+
+            if output:
+                output.parent.mkdir(parents=True, exist_ok=True)
+                pc.report(f"Storing probe results as JSON in `{output}`")
+                dump_result({"preflight": results}, output)
+            if failed:
+                pc.raise_error(f"Probing failed for models {failed}")
+
+    except Exception as e:
+        if ctx.obj["show_stacktrace"]:
+            raise e
+        else:
+            print(f"Error: {e}")
+
+
+@cli.command()
+@click.option(
+    "-c",
+    "--config",
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+    default="benchmark.yml",
+    show_default=True,
+    help="Path to the benchmark configuration file",
+)
+@click.option(
+    "--filter",
+    "filters",
+    type=str,
+    multiple=True,
+    help="Estimate only evaluations matching the expression, e.g. "
+    "`task_type=extraction`, `model=gpt*` or `complexity.input_amount>=2`",
+)
+@click.option(
+    "-o",
+    "--output",
+    type=click.Path(dir_okay=False, path_type=Path),
+    default=None,
+    help="File storing the estimates as JSON",
+)
+@click.pass_context
+def estimate(ctx, config: Path, filters: tuple[str, ...], output: Path | None) -> None:
+    """Estimates the tokens, requests and cost of the benchmark without sending
+    any request."""
+
+    try:
+        with ParseContext.root("[estimate]", ctx.obj["reporter"]) as pc:
+            with pc.context("parse") as pc:
+                benchmark = Benchmark.parse(pc, config)
+
+            units = benchmark.units()
+            if filters:
+                units = Selection(
+                    tuple(Filter.parse(expression) for expression in filters)
+                ).select(units)
+            budget = BudgetTracker(benchmark.models, benchmark.budget)
+            report_usage(pc, budget.estimate_units(units), "estimated")
+            exceeded = budget.exceeded_estimates()
+            for limit in exceeded:
+                pc.report(f"The estimate exceeds the budget {limit}")
+
+            if output:
+                output.parent.mkdir(parents=True, exist_ok=True)
+                pc.report(f"Storing estimates as JSON in `{output}`")
+                dump_result({"budget": budget.stats()}, output)
+            if exceeded:
+                pc.raise_error(f"The estimate exceeds the budgets {exceeded}")
+
+    except Exception as e:
+        if ctx.obj["show_stacktrace"]:
+            raise e
+        else:
+            print(f"Error: {e}")
+
+
+@cli.command()
+@click.option(
+    "-o",
+    "--output",
+    type=click.Path(dir_okay=False, path_type=Path),
+    required=True,
+    help="Path of the merged result file",
+)
+@click.argument(
+    "results",
+    nargs=-1,
+    required=True,
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+)
+@click.pass_context
+def merge(ctx, output: Path, results: tuple[Path, ...]) -> None:
+    """Merges the result files of the shards of a benchmark into one result."""
+
+    try:
+        with ParseContext.root("[merge]", ctx.obj["reporter"]) as pc:
+            contents = []
+            for result in results:
+                pc.report(f"Reading json `{result}`")
+                contents.append(load_result(result))
+
+            merged = merge_results(contents)
+
+            output.parent.mkdir(parents=True, exist_ok=True)
+            pc.report(f"Storing merged result as JSON in `{output}`")
+            dump_result(merged, output)
+
+    except Exception as e:
+        if ctx.obj["show_stacktrace"]:
+            raise e
+        else:
+            print(f"Error: {e}")
+
+
+@cli.command()
+@click.option(
+    "-c",
+    "--config",
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+    default="benchmark.yml",
+    show_default=True,
+    help="Path to the benchmark configuration file",
+)
+@click.option(
+    "-d",
+    "--dest-dir",
+    type=click.Path(dir_okay=True, path_type=Path),
+    default=".",
+    show_default=True,
+    help="Path where the output files should be placed",
+)
+@click.option(
+    "--queue",
+    "queue_file",
+    type=click.Path(dir_okay=False, path_type=Path),
+    default=None,
+    help="SQLite file of the work queue  [default: <dest-dir>/<config>.queue.sqlite]",
+)
+@click.option(
+    "--filter",
+    "filters",
+    type=str,
+    multiple=True,
+    help="Queue only evaluations matching the expression, see `execute`",
+)
+@click.option(
+    "--wait/--no-wait",
+    default=True,
+    show_default=True,
+    help="Wait for the workers and store the result",
+)
+@click.option(
+    "--poll-interval",
+    type=click.FloatRange(min=0.1),
+    default=10.0,
+    show_default=True,
+    help="Seconds between two checks of the progress",
+)
+@click.pass_context
+def coordinate(
+    ctx,
+    config: Path,
+    dest_dir: Path,
+    queue_file: Path | None,
+    filters: tuple[str, ...],
+    wait: bool,
+    poll_interval: float,
+) -> None:
+    """Queues the evaluations of the benchmark for `worker` processes and collects
+    their results."""
+
+    try:
+        with ParseContext.root("[coordinate]", ctx.obj["reporter"]) as pc:
+            with pc.context("parse") as pc:
+                benchmark = Benchmark.parse(pc, config)
+
+            units = benchmark.units()
+            selection = None
+            if filters:
+                selection = Selection(
+                    tuple(Filter.parse(expression) for expression in filters)
+                )
+                units = selection.select(units)
 
             dest_dir.mkdir(parents=True, exist_ok=True)
+            queue_file = queue_file or dest_dir / f"{config.stem}.queue.sqlite"
+            queue = WorkQueue(queue_file)
+            queue.set_meta("config", str(config.resolve()))
+            added = queue.add(units)
+            pc.report(f"Queued {added} of {len(units)} evaluations in `{queue_file}`")
+            if not wait:
+                return
+
+            while True:
+                counts = queue.counts()
+                pc.report(
+                    f"{counts[DONE]} done, {counts[LEASED]} running, "
+                    f"{counts[PENDING]} pending, {counts[FAILED]} failed"
+                )
+                if counts[PENDING] == 0 and counts[LEASED] == 0:
+                    break
+                time.sleep(poll_interval)
+
+            for key, error in queue.failures().items():
+                pc.report(f"Evaluation {'/'.join(key)} failed: {error}")
+
+            completed = queue.results()
+            done = [unit for unit in units if unit.key in completed]
+            result = benchmark.assemble(done, [completed[unit.key] for unit in done])
+            queue.close()
+
+            output: dict[str, Any] = {"config": benchmark, "evaluation": result}
+            if selection:
+                output["selection"] = selection.describe()
+            output["metrics"] = summarize(result)
+            output["media"] = media_registry.stats() | {
+                "files": {asset.digest: asset for asset in media_registry.assets()}
+            }
+
             dest_file = dest_dir / f"{config.stem}.json"
             pc.report(f"Storing config and evaluation as JSON in `{dest_file}`")
-            with dest_file.open("w", encoding="utf-8") as f:
-                json.dump(output, f, default=sanitize_json_output, indent=2)
+            dump_result(output, dest_file)
 
     except Exception as e:
         if ctx.obj["show_stacktrace"]:
@@ -230,5 +877,304 @@ def execute(ctx, config: Path, dest_dir: Path):
             print(f"Error: {e}")
 
 
+@cli.command()
+@click.option(
+    "--queue",
+    "queue_file",
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+    required=True,
+    help="SQLite file of the work queue created by `coordinate`",
+)
+@click.option(
+    "-w",
+    "--workers",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="Maximum number of model evaluations running concurrently",
+)
+@click.option(
+    "--grader-workers",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="Maximum number of graders of a single answer running concurrently",
+)
+@click.option(
+    "--lease-time",
+    type=click.FloatRange(min=1),
+    default=600.0,
+    show_default=True,
+    help="Seconds after which the evaluations of an unresponsive worker are "
+    "given to other workers",
+)
+@click.option(
+    "--max-attempts",
+    type=click.IntRange(min=1),
+    default=3,
+    show_default=True,
+    help="Number of failed attempts after which an evaluation is given up",
+)
+@click.option(
+    "--cache-dir",
+    type=click.Path(file_okay=False, path_type=Path),
+    default=None,
+    help="Directory of the response cache, answers of identical requests are reused",
+)
+@click.option(
+    "--config-cache",
+    type=click.Path(file_okay=False, path_type=Path),
+    default=None,
+    help="Directory caching the parsed configuration files by their content",
+)
+@click.pass_context
+def worker(
+    ctx,
+    queue_file: Path,
+    workers: int,
+    grader_workers: int,
+    lease_time: float,
+    max_attempts: int,
+    cache_dir: Path | None,
+    config_cache: Path | None,
+) -> None:
+    """Evaluates the queued evaluations of a `coordinate` run until none is left."""
+
+    try:
+        with ParseContext.root("[worker]", ctx.obj["reporter"]) as pc:
+            queue = WorkQueue(queue_file)
+            config = queue.get_meta("config")
+            if config is None:
+                pc.raise_error(f"`{queue_file}` is no work queue")
+
+            with pc.context("parse") as pc:
+                benchmark = Benchmark.parse(pc, Path(config), config_cache)
+
+            if cache_dir:
+                cache = ResponseCache(cache_dir)
+                for model in benchmark.models.values():
+                    model.use_response_cache(cache)
+
+            name = f"{socket.gethostname()}-{os.getpid()}"
+            pc.report(f"Working on `{queue_file}` as `{name}`")
+            evaluator = Worker(queue, name, workers, lease_time, max_attempts)
+            start = time.time()
+            try:
+                evaluator.run(
+                    pc,
+                    benchmark.units(),
+                    benchmark.models,
+                    {"models": benchmark.models, "grader_workers": grader_workers},
+                )
+            finally:
+                queue.close()
+            pc.report(
+                f"Evaluated {evaluator.evaluated} units "
+                f"({evaluator.failed} failed attempts) "
+                f"in {time.time() - start:.2f} seconds"
+            )
+
+    except Exception as e:
+        if ctx.obj["show_stacktrace"]:
+            raise e
+        else:
+            print(f"Error: {e}")
+
+
+@cli.command("mock-server")
+@click.option("--host", type=str, default="127.0.0.1", show_default=True)
+@click.option("--port", type=int, default=8000, show_default=True)
+@click.option(
+    "--latency",
+    type=click.FloatRange(min=0),
+    default=0.0,
+    show_default=True,
+    help="Mean latency of the answers in seconds",
+)
+@click.option(
+    "--latency-distribution",
+    type=click.Choice(DISTRIBUTIONS, case_sensitive=False),
+    default="constant",
+    show_default=True,
+    help="Distribution of the latency",
+)
+@click.option(
+    "--latency-spread",
+    type=click.FloatRange(min=0),
+    default=0.0,
+    show_default=True,
+    help="Spread (standard deviation or half width) of the latency in seconds",
+)
+@click.option(
+    "--rate-limit-probability",
+    type=click.FloatRange(min=0, max=1),
+    default=0.0,
+    show_default=True,
+    help="Share of the requests rejected with HTTP 429",
+)
+@click.option(
+    "--retry-after",
+    type=click.FloatRange(min=0),
+    default=1.0,
+    show_default=True,
+    help="Seconds of the `Retry-After` header of rejected requests",
+)
+@click.option(
+    "--answer",
+    type=str,
+    default=MockBehaviour.answer,
+    show_default=True,
+    help="Answer of every request",
+)
+@click.option("--seed", type=int, default=None, help="Seed of the random generator")
+@click.option(
+    "--swap-time",
+    type=click.FloatRange(min=0),
+    default=0.0,
+    show_default=True,
+    help="Seconds to load a model which is not loaded, like a local Ollama host",
+)
+@click.option(
+    "--max-loaded-models",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="Number of models loaded at the same time with `--swap-time`",
+)
+@click.pass_context
+def mock_server(
+    ctx,
+    host: str,
+    port: int,
+    latency: float,
+    latency_distribution: str,
+    latency_spread: float,
+    rate_limit_probability: float,
+    retry_after: float,
+    answer: str,
+    seed: int | None,
+    swap_time: float,
+    max_loaded_models: int,
+) -> None:
+    """Serves a local OpenAI compatible mock endpoint for testing."""
+
+    with ParseContext.root("[mock-server]", ctx.obj["reporter"]) as pc:
+        behaviour = MockBehaviour(
+            latency,
+            latency_distribution.lower(),
+            latency_spread,
+            rate_limit_probability,
+            retry_after,
+            answer,
+            seed,
+            swap_time,
+            max_loaded_models,
+        )
+        server = MockServer(host, port, behaviour)
+        pc.report(f"Serving `{server.url}`, press Ctrl-C to stop")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            stats = server.stats()
+            pc.report(
+                f"Answered {stats['requests']} requests, "
+                f"{stats['rate_limited']} rate limited, {stats['swaps']} model swaps"
+            )
+
+
+@cli.command("harness-benchmark")
+@click.option(
+    "--sizes",
+    type=str,
+    default=",".join(str(size) for size in DEFAULT_SIZES),
+    show_default=True,
+    help="Comma separated numbers of synthetic tasks",
+)
+@click.option(
+    "-w",
+    "--workers",
+    type=click.IntRange(min=1),
+    default=8,
+    show_default=True,
+    help="Maximum number of model evaluations running concurrently",
+)
+@click.option(
+    "--latency",
+    type=click.FloatRange(min=0),
+    default=0.0,
+    show_default=True,
+    help="Mean latency of the mock answers in seconds",
+)
+@click.option(
+    "--rate-limit-probability",
+    type=click.FloatRange(min=0, max=1),
+    default=0.0,
+    show_default=True,
+    help="Share of the mock requests rejected with HTTP 429",
+)
+@click.option(
+    "-o",
+    "--output",
+    type=click.Path(dir_okay=False, path_type=Path),
+    default=None,
+    help="File storing the results as JSON, e.g. as future baseline",
+)
+@click.option(
+    "--baseline",
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+    default=None,
+    help="Results of a previous run, slower units per second fail the command",
+)
+@click.option(
+    "--tolerance",
+    type=click.FloatRange(min=0, max=1),
+    default=0.1,
+    show_default=True,
+    help="Accepted relative slowdown against the baseline",
+)
+@click.pass_context
+def harness_benchmark(
+    ctx,
+    sizes: str,
+    workers: int,
+    latency: float,
+    rate_limit_probability: float,
+    output: Path | None,
+    baseline: Path | None,
+    tolerance: float,
+) -> None:
+    """Measures the overhead of the benchmark harness against a local mock server."""
+
+    with ParseContext.root("[harness-benchmark]", ctx.obj["reporter"]) as pc:
+        task_counts = tuple(int(size) for size in sizes.split(","))
+        behaviour = MockBehaviour(
+            latency, rate_limit_probability=rate_limit_probability, retry_after=0.0
+        )
+        results = harness.run(task_counts, workers, behaviour)
+        for result in results:
+            peak_rss = f"{result.peak_rss:.1f} MB" if result.peak_rss else "unknown"
+            pc.report(
+                f"{result.tasks} tasks: {result.units_per_second:.1f} units/s, "
+                f"{result.cpu_per_request * 1000:.2f} ms CPU per request, "
+                f"peak RSS {peak_rss}, {result.rate_limited} rate limited"
+            )
+
+        if output:
+            output.parent.mkdir(parents=True, exist_ok=True)
+            with output.open("w", encoding="utf-8") as f:
+                json.dump(harness.to_json(results), f, indent=2)
+
+        if baseline:
+            with baseline.open("r", encoding="utf-8") as f:
+                regressions = harness.compare(results, json.load(f), tolerance)
+            for regression in regressions:
+                pc.report(f"Regression: {regression}")
+            if regressions:
+                ctx.exit(1)
+
+
 if __name__ == "__main__":
     cli()
@@ -5,6 +5,7 @@ from typing import Any
 import logging
 from inspect import cleandoc as dedent
 from ..parse_context import ParseContext as EvalContext
+from ..verdict_cache import VerdictCache
 
 logger = logging.getLogger(__name__)
 
@@ -38,13 +39,29 @@ def expected_answer(
     if user_prompt.index("{expected_answer}") < 0:
         raise ValueError("User prompt does not contain '{expected_answer}'")
 
+    verdict_cache = context.get("verdict_cache", None)
+    if verdict_cache is not None:
+        key = VerdictCache.key(
+            actual_answer,
+            expected_answer,
+            grader_model,
+            system_prompt,
+            user_prompt,
+            actual_model.cache_identity(),
+        )
+        verdict = verdict_cache.get(key)
+        if verdict is not None:
+            logger.debug(f"expected_answer grader: using cached verdict '{verdict}'")
+            return float(verdict)
+
     user_prompt = user_prompt.replace("{actual_answer}", actual_answer).replace(
         "{expected_answer}", expected_answer
     )
 
-    answer = actual_model.execute_prompt(
-        ec, {"text": system_prompt}, [{"text": user_prompt}]
-    )
+    with actual_model.grading_slot():
+        answer = actual_model.prompt(
+            ec, {"text": system_prompt}, [{"text": user_prompt}]
+        )
 
     logger.debug(
         dedent(f"""expected_answer grader:
@@ -54,4 +71,11 @@ def expected_answer(
                     """)
     )
 
-    return float(answer.value)
+    budget = context.get("budget", None)
+    if budget is not None:
+        budget.charge_answer(grader_model, answer)
+
+    result = float(answer.value)
+    if verdict_cache is not None:
+        verdict_cache.put(key, answer.value)
+    return result
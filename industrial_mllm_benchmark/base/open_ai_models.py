@@ -2,11 +2,34 @@
 # SPDX-License-Identifier: MIT
 
 from ..models import Model, Answer
-import requests
-import re
+from ..transport import (
+    HttpTransport,
+    AsyncHttpTransport,
+    HttpResponse,
+    DEFAULT_POOL_SIZE,
+)
+from ..rate_limit import RateLimiter, parse_retry_after
+from ..payloads import CompiledPayload, RequestBody, payload_compiler
+from ..batch import BatchApi
+from contextlib import nullcontext
+from dataclasses import replace
+import asyncio
+import json
 import time
+import logging
 from ..parse_context import ParseContext
-from typing import Any, Self
+from typing import Any, Self, Iterator
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+# statuses of responses which are retried in addition to rate limited ones
+RETRYABLE_STATUS = (500, 502, 503, 504)
+
+
+def _timed_out(error: TimeoutError) -> HttpResponse:
+    # a request exceeding the timeout of the model is retried like a gateway timeout
+    return HttpResponse(504, {}, str(error).encode("utf-8"))
 
 
 class OpenAICompatibleModel(Model):
@@ -16,65 +39,376 @@ class OpenAICompatibleModel(Model):
         endpoint: str,
         headers: dict[str, Any],
         parameters: dict[str, Any],
+        pool_size: int = DEFAULT_POOL_SIZE,
+        rate_limit: dict[str, Any] | None = None,
+        stream: bool = False,
+        sample_batching: bool = True,
     ) -> None:
         super().__init__(name)
         self.headers = headers
         self.endpoint = endpoint
         self.parameters = parameters
+        self.pool_size = pool_size
+        self.rate_limit = rate_limit or {}
+        self.stream = stream
+        self.sample_batching = sample_batching
+        self._transport = HttpTransport.shared(endpoint, pool_size)
+        self._async_transport = AsyncHttpTransport.shared(endpoint, pool_size)
+        self._rate_limiter, self._retry_policy = RateLimiter.from_config(
+            endpoint, self.rate_limit
+        )
+
+    def cache_identity(self) -> dict[str, Any]:
+        return {
+            "endpoint": self.endpoint,
+            "model": getattr(self, "model", None),
+            "parameters": self.parameters,
+        } | self._preprocessing_identity()
+
+    def _retry_after(self, response: HttpResponse) -> float | None:
+        """Seconds to wait before a failed request can be retried, None if the
+        request should not be retried"""
+        message = ""
+        rate_limited = response.status == 429
+        try:
+            response_json = response.json()
+            if isinstance(response_json, dict) and "error" in response_json:
+                error = response_json["error"]
+                if isinstance(error, dict):
+                    rate_limited |= str(error.get("code", None)) == "429"
+                    message = str(error.get("message", ""))
+        except ValueError:
+            pass
+
+        if not rate_limited and response.status not in RETRYABLE_STATUS:
+            return None
+        return parse_retry_after(response.headers, message) or 0.0
+
+    def _next_attempt(
+        self, pc: ParseContext, response: HttpResponse, attempt: int
+    ) -> float | None:
+        """Seconds to back off before the next attempt, None if the response is final"""
+        retry_after = self._retry_after(response)
+        if retry_after is None:
+            return None
+        if attempt >= self._retry_policy.max_retries:
+            pc.report(f"Giving up after {attempt} retries")
+            return None
+
+        if retry_after > 0:
+            self._rate_limiter.pause(retry_after)
+        delay = self._retry_policy.delay(attempt, retry_after or None)
+        pc.report(
+            f"Request failed with status {response.status}. "
+            f"Retrying in {delay:.1f} seconds..."
+        )
+        return delay
 
     def _retrying_call_open_ai(
-        self, pc: ParseContext, headers: dict[str, Any], payload: dict[str, Any]
+        self, pc: ParseContext, headers: dict[str, Any], payload: CompiledPayload
     ) -> Answer:
-        response = requests.post(self.endpoint, headers=headers, json=payload)
-        response_json = response.json()
-        if "error" in response_json:
-            if response_json["error"]["code"] == "429":
-                error_message = response_json["error"]["message"]
-                retry_time = re.search(
-                    r"Please retry after (\d+) seconds", error_message
-                )
-                if retry_time:
-                    retry_seconds = int(retry_time.group(1))
-                    pc.report(f"Rate limited. Retrying in {retry_seconds} seconds...")
-                    time.sleep(retry_seconds + 1)
-                    return self._retrying_call_open_ai(pc, headers, payload)
+        return self._retrying_call_choices(pc, headers, payload)[0]
+
+    def _retrying_call_choices(
+        self, pc: ParseContext, headers: dict[str, Any], payload: CompiledPayload
+    ) -> list[Answer]:
+        """Answers of all choices of the response, the token usage and the number
+        of requests are attributed to the first one"""
+        estimate = payload.estimate_tokens()
+        throttled = 0.0
+        attempt = 0
+        while True:
+            wait = self._rate_limiter.reserve(estimate)
+            if wait > 0:
+                logger.debug(f"{self.name}: pacing request for {wait:.2f} seconds")
+                with pc.span("throttle"):
+                    time.sleep(wait)
+                throttled += wait
+
+            with pc.span("http", attempt=attempt) as pc:
+                sent = time.time()
+                try:
+                    response = self._transport.post(
+                        self.endpoint,
+                        headers,
+                        payload.body(),
+                        payload.get("stream", False),
+                        self.request_timeout(),
+                    )
+                except TimeoutError as e:
+                    response = _timed_out(e)
+                pc.annotate(status=response.status)
+                self._rate_limiter.update(response.headers)
+                delay = self._next_attempt(pc, response, attempt)
+                if delay is None:
+                    if response.lines is not None:
+                        answers = [self._parse_stream(response.lines, sent)]
+                    else:
+                        answers = self._parse_answers(response)
+                    pc.annotate(total_tokens=answers[0].total_tokens)
+                    self._rate_limiter.commit(estimate, answers[0].total_tokens)
+                    return [
+                        replace(
+                            answer,
+                            retries=attempt,
+                            throttled=throttled,
+                            requests=attempt + 1 if index == 0 else 0,
+                        )
+                        for index, answer in enumerate(answers)
+                    ]
+
+            # the pool blocks when full, a retried stream must not keep its connection
+            response.close()
+            self._rate_limiter.commit(estimate, 0)
+            with pc.span("backoff"):
+                time.sleep(delay)
+            throttled += delay
+            attempt += 1
+
+    async def _retrying_call_open_ai_async(
+        self, pc: ParseContext, headers: dict[str, Any], payload: CompiledPayload
+    ) -> Answer:
+        """Asynchronous `_retrying_call_open_ai`, paced by the same rate limiter"""
+        estimate = payload.estimate_tokens()
+        throttled = 0.0
+        attempt = 0
+        while True:
+            wait = self._rate_limiter.reserve(estimate)
+            if wait > 0:
+                logger.debug(f"{self.name}: pacing request for {wait:.2f} seconds")
+                with pc.span("throttle"):
+                    await asyncio.sleep(wait)
+                throttled += wait
 
+            with pc.span("http", attempt=attempt) as pc:
+                try:
+                    response = await self._async_transport.post(
+                        self.endpoint, headers, payload.body(), self.request_timeout()
+                    )
+                except TimeoutError as e:
+                    response = _timed_out(e)
+                pc.annotate(status=response.status)
+                self._rate_limiter.update(response.headers)
+                delay = self._next_attempt(pc, response, attempt)
+                if delay is None:
+                    answer = self._parse_answer(response)
+                    pc.annotate(total_tokens=answer.total_tokens)
+                    self._rate_limiter.commit(estimate, answer.total_tokens)
+                    return replace(
+                        answer,
+                        retries=attempt,
+                        throttled=throttled,
+                        requests=attempt + 1,
+                    )
+
+            self._rate_limiter.commit(estimate, 0)
+            with pc.span("backoff"):
+                await asyncio.sleep(delay)
+            throttled += delay
+            attempt += 1
+
+    def _parse_answer(self, response: HttpResponse) -> Answer:
+        return self._parse_answers(response)[0]
+
+    def _parse_answers(self, response: HttpResponse) -> list[Answer]:
+        try:
+            response_json = response.json()
+        except ValueError:
+            raise Exception(
+                f"Unexpected response with status {response.status}: "
+                f"{response.body[:200]!r}"
+            )
+        return self._answers_of(response_json)
+
+    def _answers_of(self, response_json: dict[str, Any]) -> list[Answer]:
+        if "error" in response_json:
             raise Exception(response_json["error"])
 
-        answer = response_json["choices"][0]["message"]["content"]
+        choices = sorted(
+            response_json["choices"], key=lambda choice: choice.get("index", 0)
+        )
         tokens = response_json["usage"]
 
+        answers = [
+            Answer(
+                choices[0]["message"]["content"],
+                tokens["completion_tokens"],
+                tokens["prompt_tokens"],
+                tokens["total_tokens"],
+                0.0,
+            )
+        ]
+        answers.extend(
+            Answer(choice["message"]["content"], 0, 0, 0, 0.0) for choice in choices[1:]
+        )
+        return answers
+
+    def _parse_stream(self, lines: Iterator[bytes], sent: float) -> Answer:
+        """Consumes the server-sent events of a streamed completion and measures
+        the time to the first token and the decoding speed"""
+        parts: list[str] = []
+        arrivals: list[float] = []
+        usage = None
+        for line in lines:
+            if not line.startswith(b"data:"):
+                continue
+            data = line[5:].strip()
+            if data == b"[DONE]":
+                continue
+            chunk = json.loads(data)
+            if "error" in chunk:
+                raise Exception(chunk["error"])
+            if chunk.get("usage", None):
+                usage = chunk["usage"]
+            for choice in chunk.get("choices", None) or []:
+                content = (choice.get("delta", None) or {}).get("content", None)
+                if content:
+                    arrivals.append(time.time())
+                    parts.append(content)
+
+        if usage:
+            completion_tokens = usage["completion_tokens"]
+            prompt_tokens = usage["prompt_tokens"]
+            total_tokens = usage["total_tokens"]
+        else:
+            # without usage in the stream every content chunk counts as one token
+            completion_tokens = len(arrivals)
+            prompt_tokens = 0
+            total_tokens = completion_tokens
+
+        time_to_first_token = arrivals[0] - sent if arrivals else None
+        inter_token_latency = None
+        tokens_per_second = None
+        if len(arrivals) > 1 and arrivals[-1] > arrivals[0]:
+            decoding = arrivals[-1] - arrivals[0]
+            inter_token_latency = decoding / (len(arrivals) - 1)
+            tokens_per_second = max(completion_tokens - 1, 1) / decoding
+
         return Answer(
-            answer,
-            tokens["completion_tokens"],
-            tokens["prompt_tokens"],
-            tokens["total_tokens"],
+            "".join(parts),
+            completion_tokens,
+            prompt_tokens,
+            total_tokens,
             0.0,
+            time_to_first_token=time_to_first_token,
+            inter_token_latency=inter_token_latency,
+            tokens_per_second=tokens_per_second,
         )
 
-    def _create_payload(
-        self, system_prompt: dict[str, str], user_prompts: list[tuple[str, str]]
-    ) -> dict[str, Any]:
+    def _payload_fields(self) -> dict[str, Any]:
+        """Fields of the request body besides the `messages`"""
         raise NotImplementedError
 
+    def _compile_payload(
+        self, system_prompt: dict[str, str], user_prompts: list[tuple[str, str]]
+    ) -> CompiledPayload:
+        """Request of the prompt, the messages are compiled once and shared by all
+        models with the same image preprocessing"""
+        messages = payload_compiler.messages(
+            [self._extract_prompt(system_prompt)],
+            self._prompt_tuples(user_prompts),
+            self.image_preprocessing,
+        )
+        return CompiledPayload(messages, self._payload_fields())
+
+    def completion_limit(self) -> int | None:
+        limit = self.parameters.get("max_tokens", None) or self.parameters.get(
+            "max_completion_tokens", None
+        )
+        return int(limit) if limit else None
+
+    def requests_per_prompt(self, samples: int) -> int:
+        # with `sample_batching` the prompt is sent, and charged, once
+        return 1 if self.sample_batching else samples
+
+    def batch_api(self) -> BatchApi | None:
+        parts = urlsplit(self.endpoint)
+        return BatchApi(
+            self.endpoint,
+            self.endpoint.partition("?")[0].removesuffix("/chat/completions"),
+            f"?{parts.query}" if parts.query else "",
+            self.headers,
+            parts.path,
+        )
+
+    def batch_request(
+        self, system_prompt: dict[str, str], user_prompts: list[tuple[str, str]]
+    ) -> RequestBody:
+        return self._compile_payload(system_prompt, user_prompts).body()
+
+    def parse_batch_answer(self, body: dict[str, Any]) -> Answer:
+        return self._answers_of(body)[0]
+
     def execute_prompt(
         self,
         ec: ParseContext,
         system_prompt: dict[str, str],
         user_prompts: list[tuple[str, str]],
     ) -> Answer:
-        payload = self._create_payload(system_prompt, user_prompts)
+        with ec.span("encode"):
+            payload = self._compile_payload(system_prompt, user_prompts)
+        if self.stream:
+            # endpoints only report the token usage of a stream if asked to, only
+            # streamed requests accept `stream_options`
+            payload = payload.with_fields(
+                stream=True,
+                stream_options=payload.get("stream_options", {})
+                | {"include_usage": True},
+            )
 
         start = time.time()
         answer = self._retrying_call_open_ai(ec, self.headers, payload)
         duration = time.time() - start
-        return Answer(
-            answer.value,
-            answer.completion_tokens,
-            answer.prompt_tokens,
-            answer.total_tokens,
-            duration,
-        )
+        return replace(answer, duration=duration)
+
+    async def execute_prompt_async(
+        self,
+        ec: ParseContext,
+        system_prompt: dict[str, str],
+        user_prompts: list[tuple[str, str]],
+    ) -> Answer:
+        """Executes the prompt on the event loop, the answer is not streamed"""
+        with ec.span("encode"):
+            payload = self._compile_payload(system_prompt, user_prompts)
+
+        start = time.time()
+        answer = await self._retrying_call_open_ai_async(ec, self.headers, payload)
+        duration = time.time() - start
+        return replace(answer, duration=duration)
+
+    def execute_samples(
+        self,
+        ec: ParseContext,
+        system_prompt: dict[str, str],
+        user_prompts: list[tuple[str, str]],
+        count: int,
+    ) -> list[Answer]:
+        """Requests all samples at once with the parameter `n`. Samples missing in
+        the response, e.g. of servers ignoring `n`, are requested concurrently."""
+        if count == 1 or not self.sample_batching:
+            return super().execute_samples(ec, system_prompt, user_prompts, count)
+
+        with ec.span("encode"):
+            payload = self._compile_payload(system_prompt, user_prompts)
+        # the choices of a streamed response are interleaved, request them at once
+        payload = payload.with_fields(n=count, stream=False)
+
+        start = time.time()
+        with self._slots or nullcontext():
+            answers = self._retrying_call_choices(ec, self.headers, payload)
+        duration = time.time() - start
+        answers = [replace(answer, duration=duration) for answer in answers[:count]]
+
+        if len(answers) < count:
+            ec.report(
+                f"Received {len(answers)} of {count} samples, requesting the others"
+            )
+            answers.extend(
+                super().execute_samples(
+                    ec, system_prompt, user_prompts, count - len(answers)
+                )
+            )
+        return answers
 
 
 class OpenAIModel(OpenAICompatibleModel):
@@ -86,10 +420,27 @@ class OpenAIModel(OpenAICompatibleModel):
         model: str,
         version: str | None,
         parameters: dict[str, Any],
+        pool_size: int = DEFAULT_POOL_SIZE,
+        rate_limit: dict[str, Any] | None = None,
+        stream: bool = False,
+        sample_batching: bool = True,
     ) -> None:
+        resource = endpoint
         endpoint = f"{endpoint}/openai/deployments/{model}/chat/completions?api-version={version}"
         headers = {"Content-Type": "application/json", "api-key": access_token}
-        super().__init__(name, endpoint, headers, parameters)
+        super().__init__(
+            name,
+            endpoint,
+            headers,
+            parameters,
+            pool_size,
+            rate_limit,
+            stream,
+            sample_batching,
+        )
+        self._resource = resource
+        self._deployment = model
+        self._version = version
 
     @staticmethod
     def parse_instance(
@@ -101,19 +452,43 @@ class OpenAIModel(OpenAICompatibleModel):
             model = pc.get_value(config, "model")
             version = config.get("version", None)
             parameters = config.get("parameters", {})
-            return OpenAIModel(name, access_token, endpoint, model, version, parameters)
+            pool_size = int(config.get("pool_size", DEFAULT_POOL_SIZE))
+            rate_limit = config.get("rate_limit", None)
+            stream = bool(config.get("stream", False))
+            sample_batching = bool(config.get("sample_batching", True))
+            return OpenAIModel(
+                name,
+                access_token,
+                endpoint,
+                model,
+                version,
+                parameters,
+                pool_size,
+                rate_limit,
+                stream,
+                sample_batching,
+            )
         except Exception as e:
             pc.raise_error(cause=e)
 
-    def _create_payload(
+    def _payload_fields(self) -> dict[str, Any]:
+        return dict(self.parameters)
+
+    def batch_api(self) -> BatchApi | None:
+        # batches are submitted to the resource, the deployment is given per request
+        return BatchApi(
+            self.endpoint,
+            f"{self._resource}/openai",
+            f"?api-version={self._version}",
+            self.headers,
+            "/chat/completions",
+        )
+
+    def batch_request(
         self, system_prompt: dict[str, str], user_prompts: list[tuple[str, str]]
-    ) -> dict[str, Any]:
-        return {
-            "messages": [
-                {"role": "system", "content": self._extends([system_prompt])},
-                {"role": "user", "content": self._extends(user_prompts)},
-            ]
-        } | self.parameters
+    ) -> RequestBody:
+        payload = self._compile_payload(system_prompt, user_prompts)
+        return payload.with_fields(model=self._deployment).body()
 
 
 class OllamaModel(OpenAICompatibleModel):
@@ -123,11 +498,28 @@ class OllamaModel(OpenAICompatibleModel):
         endpoint: str,
         model: str,
         parameters: dict[str, Any],
+        pool_size: int = DEFAULT_POOL_SIZE,
+        rate_limit: dict[str, Any] | None = None,
+        stream: bool = False,
+        sample_batching: bool = False,
+        keep_alive: str | int | None = None,
+        max_loaded_models: int = 1,
     ) -> None:
         super().__init__(
-            name, endpoint, {"Content-Type": "application/json"}, parameters
+            name,
+            endpoint,
+            {"Content-Type": "application/json"},
+            parameters,
+            pool_size,
+            rate_limit,
+            stream,
+            sample_batching,
         )
         self.model = model
+        self.keep_alive = keep_alive
+        if max_loaded_models < 1:
+            raise ValueError("`max_loaded_models` must be at least 1")
+        self.max_loaded_models = max_loaded_models
 
     @staticmethod
     def parse_instance(
@@ -137,17 +529,60 @@ class OllamaModel(OpenAICompatibleModel):
             endpoint = pc.get_value(config, "endpoint")
             model = pc.get_value(config, "model")
             parameters = config.get("parameters", {})
-            return OllamaModel(name, endpoint, model, parameters)
+            pool_size = int(config.get("pool_size", DEFAULT_POOL_SIZE))
+            rate_limit = config.get("rate_limit", None)
+            stream = bool(config.get("stream", False))
+            # the OpenAI compatible API of Ollama ignores `n`
+            sample_batching = bool(config.get("sample_batching", False))
+            keep_alive = config.get("keep_alive", None)
+            max_loaded_models = int(config.get("max_loaded_models", 1))
+            return OllamaModel(
+                name,
+                endpoint,
+                model,
+                parameters,
+                pool_size,
+                rate_limit,
+                stream,
+                sample_batching,
+                keep_alive,
+                max_loaded_models,
+            )
         except Exception as e:
             pc.raise_error(cause=e)
 
-    def _create_payload(
-        self, system_prompt: dict[str, str], user_prompts: list[tuple[str, str]]
-    ) -> dict[str, Any]:
-        return {
-            "model": self.model,
-            "messages": [
-                {"role": "system", "content": self._extends([system_prompt])},
-                {"role": "user", "content": self._extends(user_prompts)},
-            ],
-        } | self.parameters
+    def _payload_fields(self) -> dict[str, Any]:
+        fields: dict[str, Any] = {"model": self.model}
+        if self.keep_alive is not None:
+            fields["keep_alive"] = self.keep_alive
+        return fields | self.parameters
+
+    def batch_api(self) -> BatchApi | None:
+        # Ollama serves no `files` and `batches` API
+        return None
+
+    def loading_host(self) -> str | None:
+        parts = urlsplit(self.endpoint)
+        return f"{parts.scheme}://{parts.netloc}"
+
+    def _generate(self, ec: ParseContext, keep_alive: str | int | None) -> None:
+        # a request of the native API without prompt only loads or unloads
+        payload: dict[str, Any] = {"model": self.model}
+        if keep_alive is not None:
+            payload["keep_alive"] = keep_alive
+        response = self._transport.post(
+            f"{self.loading_host()}/api/generate", self.headers, payload
+        )
+        if response.status != 200:
+            raise Exception(
+                f"Ollama answered with status {response.status}: "
+                f"{response.body[:200]!r}"
+            )
+
+    def load(self, ec: ParseContext) -> None:
+        with ec.span("load", model=self.name):
+            self._generate(ec, self.keep_alive)
+
+    def unload(self, ec: ParseContext) -> None:
+        with ec.span("unload", model=self.name):
+            self._generate(ec, 0)
@@ -0,0 +1,557 @@
+# SPDX-FileCopyrightText: Copyright 2024 Siemens AG
+# SPDX-License-Identifier: MIT
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, IO, TYPE_CHECKING
+from .models import Answer, Model
+from .parse_context import ParseContext
+from .response_cache import ResponseCache, prompt_key
+from .transport import HttpTransport
+import hashlib
+import importlib
+import json
+import os
+import re
+import requests
+import shutil
+import time
+import logging
+
+if TYPE_CHECKING:
+    from .budget import BudgetTracker
+    from .tasks import EvalUnit
+
+logger = logging.getLogger(__name__)
+
+# limits of a batch file of the OpenAI Batch API are 50000 requests and 200 MB
+MAX_BATCH_REQUESTS = 50000
+MAX_BATCH_BYTES = 190 * 1024 * 1024
+
+TERMINAL_STATES = ("completed", "failed", "expired", "cancelled")
+
+
+@dataclass(frozen=True)
+class BatchApi:
+    """Batch API of a model: the base URL of its `files` and `batches` endpoints
+    with the query appended to them, the headers and the `url` of the requests in
+    a batch file. `endpoint` is the chat completions endpoint of the model."""
+
+    endpoint: str
+    base_url: str
+    query: str
+    headers: dict[str, Any]
+    url: str
+
+
+@dataclass(frozen=True)
+class BatchStatus:
+    state: str
+    total: int = 0
+    completed: int = 0
+    failed: int = 0
+    output_file: str | None = None
+    error_file: str | None = None
+
+    @property
+    def done(self) -> bool:
+        return self.state in TERMINAL_STATES
+
+
+def custom_id(unit: "EvalUnit", sample: int = 0) -> str:
+    """Identifier of a request in a batch, stable across runs of a configuration"""
+    digest = hashlib.sha256(json.dumps(unit.key).encode("utf-8")).hexdigest()
+    return f"{digest[:24]}-{sample}"
+
+
+def _digest(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class BatchBackend:
+    """Submits batch files and downloads their output. Backends are created with
+    the directory of the batch files of a run."""
+
+    def __init__(self, directory: Path) -> None:
+        self.directory = directory
+
+    def submit(self, api: BatchApi, path: Path) -> str:
+        """Submits the batch file and returns the id of the batch"""
+        raise NotImplementedError
+
+    def status(self, api: BatchApi, batch_id: str) -> BatchStatus:
+        raise NotImplementedError
+
+    def download(self, api: BatchApi, file_id: str, dest: Path) -> None:
+        raise NotImplementedError
+
+
+class OpenAIBatchBackend(BatchBackend):
+    """Batch API of OpenAI and Azure OpenAI: the batch file is uploaded with the
+    purpose `batch` and executed within the completion window"""
+
+    def __init__(self, directory: Path, completion_window: str = "24h") -> None:
+        super().__init__(directory)
+        self.completion_window = completion_window
+        self._session = requests.Session()
+
+    def _headers(self, api: BatchApi) -> dict[str, Any]:
+        return {
+            key: value
+            for key, value in api.headers.items()
+            if key.lower() != "content-type"
+        }
+
+    def _check(self, response: requests.Response, action: str) -> requests.Response:
+        if response.status_code >= 400:
+            raise Exception(
+                f"{action} failed with status {response.status_code}: "
+                f"{response.text[:200]}"
+            )
+        return response
+
+    def submit(self, api: BatchApi, path: Path) -> str:
+        with path.open("rb") as f:
+            response = self._session.post(
+                f"{api.base_url}/files{api.query}",
+                headers=self._headers(api),
+                data={"purpose": "batch"},
+                files={"file": (path.name, f, "application/jsonl")},
+            )
+        file_id = self._check(response, f"Uploading `{path}`").json()["id"]
+
+        response = self._session.post(
+            f"{api.base_url}/batches{api.query}",
+            headers=self._headers(api),
+            json={
+                "input_file_id": file_id,
+                "endpoint": api.url,
+                "completion_window": self.completion_window,
+            },
+        )
+        return self._check(response, "Creating the batch").json()["id"]
+
+    def status(self, api: BatchApi, batch_id: str) -> BatchStatus:
+        response = self._session.get(
+            f"{api.base_url}/batches/{batch_id}{api.query}",
+            headers=self._headers(api),
+        )
+        batch = self._check(response, f"Polling batch `{batch_id}`").json()
+        counts = batch.get("request_counts", None) or {}
+        return BatchStatus(
+            batch["status"],
+            counts.get("total", 0),
+            counts.get("completed", 0),
+            counts.get("failed", 0),
+            batch.get("output_file_id", None),
+            batch.get("error_file_id", None),
+        )
+
+    def download(self, api: BatchApi, file_id: str, dest: Path) -> None:
+        response = self._session.get(
+            f"{api.base_url}/files/{file_id}/content{api.query}",
+            headers=self._headers(api),
+            stream=True,
+        )
+        self._check(response, f"Downloading `{file_id}`")
+        temp = dest.with_suffix(".tmp")
+        with temp.open("wb") as f:
+            for chunk in response.iter_content(chunk_size=1024 * 1024):
+                f.write(chunk)
+        os.replace(temp, dest)
+
+
+class LocalBatchBackend(BatchBackend):
+    """Stand-in for a batch API without discount: the requests of a batch file are
+    sent to the chat completions endpoint of the model when it is submitted, e.g.
+    of the mock server. The batches are stored as files in the directory."""
+
+    def __init__(self, directory: Path, workers: int = 4) -> None:
+        super().__init__(directory)
+        self.workers = workers
+
+    def _execute(self, api: BatchApi, line: bytes) -> dict[str, Any]:
+        request = json.loads(line)
+        try:
+            response = HttpTransport.shared(api.endpoint).post(
+                api.endpoint, api.headers, request["body"]
+            )
+            try:
+                body = response.json()
+            except ValueError:
+                body = {"error": response.body[:200].decode("utf-8", "replace")}
+            return {
+                "custom_id": request["custom_id"],
+                "response": {"status_code": response.status, "body": body},
+                "error": None,
+            }
+        except Exception as e:
+            return {
+                "custom_id": request["custom_id"],
+                "response": None,
+                "error": {"code": "request_failed", "message": str(e)},
+            }
+
+    def submit(self, api: BatchApi, path: Path) -> str:
+        batch_id = f"local-{_digest(path)[:16]}"
+
+        output_file = f"{batch_id}.output.jsonl"
+        error_file = f"{batch_id}.errors.jsonl"
+        total = completed = failed = 0
+        with (
+            path.open("rb") as lines,
+            (self.directory / output_file).open("w", encoding="utf-8") as output,
+            (self.directory / error_file).open("w", encoding="utf-8") as errors,
+            ThreadPoolExecutor(self.workers, thread_name_prefix="batch") as executor,
+        ):
+            for result in executor.map(
+                lambda line: self._execute(api, line), filter(bytes.strip, lines)
+            ):
+                total += 1
+                response = result["response"]
+                if response is not None and response["status_code"] == 200:
+                    completed += 1
+                    output.write(json.dumps(result) + "\n")
+                else:
+                    failed += 1
+                    errors.write(json.dumps(result) + "\n")
+
+        status = BatchStatus(
+            "completed", total, completed, failed, output_file, error_file
+        )
+        with (self.directory / f"{batch_id}.json").open("w", encoding="utf-8") as f:
+            json.dump(asdict(status), f)
+        return batch_id
+
+    def status(self, api: BatchApi, batch_id: str) -> BatchStatus:
+        with (self.directory / f"{batch_id}.json").open("r", encoding="utf-8") as f:
+            return BatchStatus(**json.load(f))
+
+    def download(self, api: BatchApi, file_id: str, dest: Path) -> None:
+        shutil.copyfile(self.directory / file_id, dest)
+
+
+BATCH_BACKENDS: dict[str, type[BatchBackend]] = {
+    "openai": OpenAIBatchBackend,
+    "local": LocalBatchBackend,
+}
+
+
+def create_backend(name: str, directory: Path) -> BatchBackend:
+    """Backend registered under the name, or a `BatchBackend` subclass given as
+    `module:Class`"""
+    backend = BATCH_BACKENDS.get(name, None)
+    if backend is None:
+        module, _, class_name = name.partition(":")
+        if not class_name:
+            raise ValueError(
+                f"Unknown batch backend `{name}`, use one of "
+                f"{list(BATCH_BACKENDS)} or `module:Class`"
+            )
+        backend = getattr(importlib.import_module(module), class_name)
+    return backend(directory)
+
+
+class BatchAnswers:
+    """Answers ingested from the output of batches, looked up by the models like
+    the response cache. Prompts not answered by a batch, e.g. of LLM judges or
+    of failed requests, are passed on to the response cache or executed."""
+
+    def __init__(
+        self, answers: dict[str, Answer], cache: ResponseCache | None = None
+    ) -> None:
+        self.answers = answers
+        self.cache = cache
+
+    def key(
+        self,
+        model: Model,
+        system_prompt: dict[str, Any],
+        user_prompts: list[tuple[str, str]],
+        sample: int = 0,
+    ) -> str:
+        return prompt_key(model, system_prompt, user_prompts, sample)
+
+    def get(self, key: str) -> Answer | None:
+        answer = self.answers.get(key, None)
+        if answer is None and self.cache is not None:
+            return self.cache.get(key)
+        return answer
+
+    def put(self, key: str, answer: Answer) -> None:
+        if self.cache is not None:
+            self.cache.put(key, answer)
+
+
+@dataclass
+class _BatchFile:
+    model: str
+    path: Path
+    requests: int = 0
+    size: int = 0
+    batch_id: str | None = None
+    status: BatchStatus | None = None
+
+
+def _slug(value: str) -> str:
+    """Readable file name of a model, the hash of the full name keeps the names
+    apart which only differ in replaced characters (e.g. `a/b` and `a b`)"""
+    readable = re.sub(r"[^\w.-]+", "_", value).strip("_") or "model"
+    digest = hashlib.sha256(value.encode("utf-8")).hexdigest()[:8]
+    return f"{readable}-{digest}"
+
+
+class BatchRun:
+    """Evaluates the prompts of evaluation units via batches: writes the requests
+    per model into batch files with stable custom ids, submits them, polls until
+    they are done and ingests the answers of their output files.
+
+    The submitted batches are recorded in `batches.json` of the directory, with
+    `resume` batches of identical files are polled again instead of submitted."""
+
+    def __init__(
+        self,
+        backend: BatchBackend,
+        directory: Path,
+        poll_interval: float = 60.0,
+        resume: bool = False,
+    ) -> None:
+        self.backend = backend
+        self.directory = directory
+        self.poll_interval = poll_interval
+        self.resume = resume
+        self.requests = 0
+        self.answered = 0
+        self.failed = 0
+        self.interactive = 0
+        self._files: list[_BatchFile] = []
+        # custom id -> key of the answer, model
+        self._ids: dict[str, tuple[str, str]] = {}
+
+    def _write(
+        self,
+        pc: ParseContext,
+        units: list["EvalUnit"],
+        models: dict[str, Model],
+        cache: ResponseCache | None,
+        budget: "BudgetTracker | None",
+    ) -> None:
+        keys: set[str] = set()
+        current: dict[str, _BatchFile] = {}
+        streams: dict[str, IO[bytes]] = {}
+        # models whose remaining units exceed their budget or the one of the run
+        stopped: set[str] = set()
+        try:
+            for unit in units:
+                model = models[unit.model]
+                api = model.batch_api()
+                if api is None:
+                    self.interactive += 1
+                    continue
+
+                if budget is not None:
+                    # requests in a batch are paid for, leave out the units the
+                    # evaluation would skip
+                    if unit.model in stopped:
+                        budget.refuse(unit)
+                        continue
+                    exceeded = budget.hold(unit, unit.estimate_usage(models))
+                    if exceeded is not None:
+                        pc.report(
+                            f"Leaving the remaining units of `{unit.model}` out, "
+                            f"they would exceed the {exceeded}"
+                        )
+                        stopped.add(unit.model)
+                        continue
+
+                samples = unit.task.samples or model.samples or 1
+                for sample in range(samples):
+                    key = prompt_key(
+                        model, unit.system_prompts, unit.task.user_prompt, sample
+                    )
+                    if key in keys or (cache is not None and key in cache):
+                        continue
+                    keys.add(key)
+
+                    identifier = custom_id(unit, sample)
+                    body = model.batch_request(
+                        unit.system_prompts, unit.task.user_prompt
+                    )
+                    head = (
+                        f'{{"custom_id":"{identifier}","method":"POST",'
+                        f'"url":{json.dumps(api.url)},"body":'
+                    ).encode("utf-8")
+                    size = len(head) + len(body) + 2
+
+                    batch = current.get(unit.model, None)
+                    if batch is None or (
+                        batch.requests >= MAX_BATCH_REQUESTS
+                        or batch.size + size > MAX_BATCH_BYTES
+                    ):
+                        if batch is not None:
+                            streams.pop(unit.model).close()
+                        part = sum(
+                            1 for file in self._files if file.model == unit.model
+                        )
+                        batch = _BatchFile(
+                            unit.model,
+                            self.directory / f"{_slug(unit.model)}-{part + 1}.jsonl",
+                        )
+                        self._files.append(batch)
+                        current[unit.model] = batch
+                        streams[unit.model] = batch.path.open("wb")
+
+                    streams[unit.model].writelines([head, *body, b"}\n"])
+                    batch.requests += 1
+                    batch.size += size
+                    self._ids[identifier] = (key, unit.model)
+        finally:
+            for stream in streams.values():
+                stream.close()
+
+        self.requests = len(self._ids)
+        for batch in self._files:
+            pc.report(f"Wrote {batch.requests} requests to `{batch.path}`")
+
+    def _submit(self, pc: ParseContext, models: dict[str, Model]) -> None:
+        state_file = self.directory / "batches.json"
+        submitted: dict[str, str] = {}
+        if self.resume and state_file.exists():
+            with state_file.open("r", encoding="utf-8") as f:
+                submitted = json.load(f)
+
+        for batch in self._files:
+            digest = _digest(batch.path)
+            batch.batch_id = submitted.get(digest, None)
+            if batch.batch_id is not None:
+                pc.report(f"Resuming batch `{batch.batch_id}` of `{batch.path}`")
+                continue
+            batch.batch_id = self.backend.submit(
+                models[batch.model].batch_api(), batch.path
+            )
+            pc.report(f"Submitted `{batch.path}` as batch `{batch.batch_id}`")
+            submitted[digest] = batch.batch_id
+            # recorded immediately, an interrupted run can poll the batches again
+            with state_file.open("w", encoding="utf-8") as f:
+                json.dump(submitted, f, indent=2)
+
+    def _poll(self, pc: ParseContext, models: dict[str, Model]) -> None:
+        while True:
+            for batch in self._files:
+                if batch.status is None or not batch.status.done:
+                    batch.status = self.backend.status(
+                        models[batch.model].batch_api(), batch.batch_id
+                    )
+            pending = [batch for batch in self._files if not batch.status.done]
+            if not pending:
+                return
+            completed = sum(batch.status.completed for batch in self._files)
+            pc.report(
+                f"{len(pending)} of {len(self._files)} batches running, "
+                f"{completed} of {self.requests} requests completed"
+            )
+            time.sleep(self.poll_interval)
+
+    def _ingest(
+        self,
+        pc: ParseContext,
+        models: dict[str, Model],
+        cache: ResponseCache | None,
+    ) -> dict[str, Answer]:
+        answers: dict[str, Answer] = {}
+        for batch in self._files:
+            status = batch.status
+            if status.state != "completed":
+                pc.report(f"Batch `{batch.batch_id}` ended as `{status.state}`")
+            api = models[batch.model].batch_api()
+            for file_id, suffix in (
+                (status.output_file, "output"),
+                (status.error_file, "errors"),
+            ):
+                if not file_id:
+                    continue
+                dest = batch.path.with_suffix(f".{suffix}.jsonl")
+                self.backend.download(api, file_id, dest)
+                with dest.open("rb") as f:
+                    for line in f:
+                        if not line.strip():
+                            continue
+                        entry = json.loads(line)
+                        key, model_name = self._ids.get(
+                            entry.get("custom_id", None), (None, None)
+                        )
+                        response = entry.get("response", None) or {}
+                        if key is None or response.get("status_code", None) != 200:
+                            continue
+                        try:
+                            answer = models[model_name].parse_batch_answer(
+                                response["body"]
+                            )
+                        except Exception as e:
+                            logger.warning(
+                                f"Ignoring answer `{entry['custom_id']}`: {e}"
+                            )
+                            continue
+                        answers[key] = answer
+                        if cache is not None:
+                            cache.put(key, answer)
+
+        self.answered = len(answers)
+        self.failed = self.requests - self.answered
+        pc.report(f"Ingested {self.answered} of {self.requests} answers")
+        if self.failed:
+            pc.report(f"{self.failed} requests were not answered, executing them")
+        return answers
+
+    def run(
+        self,
+        pc: ParseContext,
+        units: list["EvalUnit"],
+        models: dict[str, Model],
+        cache: ResponseCache | None = None,
+        budget: "BudgetTracker | None" = None,
+    ) -> BatchAnswers:
+        """Answers of the prompts of the units, prompts already in the response
+        cache are not part of the batches. Ingested answers are added to it.
+
+        With a `budget` the estimate of every unit is reserved before it is
+        written, the units exceeding it are left out and skipped by the scheduler
+        later."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with pc.context("write") as pc:
+            self._write(pc, units, models, cache, budget)
+        if self.interactive:
+            pc.report(f"{self.interactive} evaluations of models without batch API")
+
+        answers: dict[str, Answer] = {}
+        if self._files:
+            with pc.context("submit") as pc:
+                self._submit(pc, models)
+            with pc.context("poll") as pc:
+                self._poll(pc, models)
+            with pc.context("ingest") as pc:
+                answers = self._ingest(pc, models, cache)
+        return BatchAnswers(answers, cache)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "batches": [
+                {
+                    "model": batch.model,
+                    "file": batch.path.name,
+                    "id": batch.batch_id,
+                    "state": batch.status.state if batch.status else None,
+                    "requests": batch.requests,
+                }
+                for batch in self._files
+            ],
+            "requests": self.requests,
+            "answered": self.answered,
+            "failed": self.failed,
+            "interactive": self.interactive,
+        }
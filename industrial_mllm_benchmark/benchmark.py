@@ -3,11 +3,14 @@
 
 from pathlib import Path
 from dataclasses import dataclass
-from .models import Model
+from .budget import Budget
+from .models import Model, ModelEvalResult
 from .graders import Grader
 from .env_yaml import load_yaml
 from .tasksets import Tasksets
-from .tasks import TaskEvalResult
+from .tasks import TaskEvalResult, EvalUnit
+from .scheduler import Scheduler
+from .selection import Selection
 import os
 from .system_prompts import parse_system_prompt
 from .parse_context import ParseContext
@@ -17,9 +20,11 @@ import logging
 logger = logging.getLogger(__name__)
 
 
-def _import_config(pc: ParseContext, config: Path) -> dict[str, Any]:
+def _import_config(
+    pc: ParseContext, config: Path, cache_dir: Path | None = None
+) -> dict[str, Any]:
     try:
-        value = load_yaml(config)
+        value = load_yaml(config, cache_dir=cache_dir)
         with pc.context("includes") as pc:
             pc.report("Parsing includes")
             includes = value.get("includes", None)
@@ -38,7 +43,7 @@ def _import_config(pc: ParseContext, config: Path) -> dict[str, Any]:
                             )
 
                         try:
-                            include_value = load_yaml(include_path)
+                            include_value = load_yaml(include_path, cache_dir=cache_dir)
                             value.update(include_value)
                         except Exception as e:
                             pc.raise_error(
@@ -58,12 +63,18 @@ class Benchmark:
     graders: dict[str, Grader]
     system_prompts: dict[str, dict[str, str]]
     tasksets: dict[str, Tasksets]
+    # limits of the usage of all models together
+    budget: Budget | None = None
 
     @staticmethod
-    def parse(pc: ParseContext, config_path: Path) -> "Benchmark":
+    def parse(
+        pc: ParseContext, config_path: Path, cache_dir: Path | None = None
+    ) -> "Benchmark":
+        """Parses the benchmark configuration, with `cache_dir` the parsed YAML
+        files are cached by their content"""
         with pc.context(f"[{config_path}]") as pc:
             pc.report("Parsing benchmark configuration")
-            config = _import_config(pc, config_path)
+            config = _import_config(pc, config_path, cache_dir)
 
             models = pc.get_value(config, "models")
             with pc.context("models") as pc:
@@ -88,17 +99,52 @@ class Benchmark:
                     pc, config_path.parent, tasksets, models, graders
                 )
 
-            return Benchmark(models, graders, system_prompts, tasksets)
+            with pc.context("budget") as pc:
+                budget = Budget.parse(pc, config.get("budget", None))
 
-    def evaluate(self, ec: ParseContext) -> dict[str, dict[str, TaskEvalResult]]:
+            return Benchmark(models, graders, system_prompts, tasksets, budget)
+
+    def units(self) -> list[EvalUnit]:
+        """All evaluation units in taskset, task, model order"""
+        units: list[EvalUnit] = []
+        for taskset in self.tasksets.values():
+            units.extend(taskset.units(self.system_prompts))
+        return units
+
+    def assemble(
+        self, units: list[EvalUnit], results: list[ModelEvalResult | None]
+    ) -> dict[str, dict[str, TaskEvalResult]]:
+        """Results of the units in the structure of the benchmark, every taskset
+        and task is contained even if none of its units was evaluated. Units
+        without result, e.g. skipped for their budget, are left out."""
         # task.name -> model.name -> grading-result
         task_set_result: dict[str, dict[str, TaskEvalResult]] = {}
+        for taskset_name, taskset in self.tasksets.items():
+            task_set_result[taskset_name] = {
+                task.name: TaskEvalResult(task.name, {}) for task in taskset.tasks
+            }
 
-        with ec.context("tasksets") as ec:
-            for taskset_name, taskset in self.tasksets.items():
-                with ec.context(f"[{taskset_name}]") as ec:
-                    task_set_result[taskset_name] = taskset.evaluate(
-                        ec, self.system_prompts, self.models
-                    )
+        for unit, result in zip(units, results):
+            if result is None:
+                continue
+            task_set_result[unit.taskset][unit.task.name].models[unit.model] = result
 
         return task_set_result
+
+    def evaluate(
+        self,
+        ec: ParseContext,
+        scheduler: Scheduler | None = None,
+        grader_context: dict[str, Any] | None = None,
+        selection: Selection | None = None,
+    ) -> dict[str, dict[str, TaskEvalResult]]:
+        units = self.units()
+        if selection is not None:
+            units = selection.select(units)
+            ec.report(f"Selected {len(units)} evaluations")
+        grader_context = {"models": self.models} | (grader_context or {})
+
+        ec.report("Evaluating tasksets")
+        results = (scheduler or Scheduler()).run(ec, units, self.models, grader_context)
+
+        return self.assemble(units, results)
@@ -0,0 +1,314 @@
+# SPDX-FileCopyrightText: Copyright 2024 Siemens AG
+# SPDX-License-Identifier: MIT
+
+from dataclasses import dataclass
+from typing import Any, TYPE_CHECKING
+from .image_preprocessing import ImagePreprocessing
+from .media import media_registry
+from .parse_context import ParseContext
+from .payloads import IMAGE_TOKEN_ESTIMATE
+import math
+import threading
+
+if TYPE_CHECKING:
+    from .models import Answer, Model
+    from .tasks import EvalUnit
+
+UnitKey = tuple[str, str, str]
+
+# completion tokens assumed per answer of models without `max_tokens`
+DEFAULT_COMPLETION_TOKENS = 512
+
+# tokens of an image in low detail and per 512px tile in high detail (OpenAI)
+IMAGE_BASE_TOKENS = 85
+IMAGE_TILE_TOKENS = 170
+
+LIMITS = ("prompt_tokens", "completion_tokens", "requests", "cost")
+
+
+@dataclass(frozen=True)
+class Usage:
+    """Prompt and completion tokens, requests and cost (in the currency of the
+    pricing) of evaluations, as estimated or as reported by the models"""
+
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    requests: int = 0
+    cost: float = 0.0
+
+    def __add__(self, other: "Usage") -> "Usage":
+        return Usage(
+            self.prompt_tokens + other.prompt_tokens,
+            self.completion_tokens + other.completion_tokens,
+            self.requests + other.requests,
+            self.cost + other.cost,
+        )
+
+    def __sub__(self, other: "Usage") -> "Usage":
+        return Usage(
+            self.prompt_tokens - other.prompt_tokens,
+            self.completion_tokens - other.completion_tokens,
+            self.requests - other.requests,
+            self.cost - other.cost,
+        )
+
+
+@dataclass(frozen=True)
+class Pricing:
+    """Prices of a model per million prompt and completion tokens"""
+
+    prompt_tokens: float = 0.0
+    completion_tokens: float = 0.0
+
+    def cost(self, prompt_tokens: int, completion_tokens: int) -> float:
+        return (
+            prompt_tokens * self.prompt_tokens
+            + completion_tokens * self.completion_tokens
+        ) / 1_000_000
+
+    @staticmethod
+    def parse(pc: ParseContext, config: dict[str, Any] | None) -> "Pricing | None":
+        if config is None:
+            return None
+        try:
+            unknown = set(config) - {"prompt_tokens", "completion_tokens"}
+            if unknown:
+                pc.raise_error(f"Unknown prices {sorted(unknown)}")
+            pricing = Pricing(
+                float(config.get("prompt_tokens", 0.0)),
+                float(config.get("completion_tokens", 0.0)),
+            )
+            if pricing.prompt_tokens < 0 or pricing.completion_tokens < 0:
+                pc.raise_error("Prices must not be negative")
+            return pricing
+        except Exception as e:
+            pc.raise_error("Invalid pricing", e)
+
+
+@dataclass(frozen=True)
+class Budget:
+    """Limits of the usage of a model or of a whole run, None for no limit"""
+
+    prompt_tokens: int | None = None
+    completion_tokens: int | None = None
+    requests: int | None = None
+    cost: float | None = None
+
+    @staticmethod
+    def parse(pc: ParseContext, config: dict[str, Any] | None) -> "Budget | None":
+        if config is None:
+            return None
+        try:
+            # a misspelled limit would silently not be enforced
+            unknown = set(config) - set(LIMITS)
+            if unknown:
+                pc.raise_error(f"Unknown budget limits {sorted(unknown)}")
+            values = {
+                name: float(value) if name == "cost" else int(value)
+                for name, value in config.items()
+                if value is not None
+            }
+            if any(value < 0 for value in values.values()):
+                pc.raise_error("Budget limits must not be negative")
+            return Budget(**values)
+        except Exception as e:
+            pc.raise_error("Invalid budget", e)
+
+    def exceeded_by(self, usage: Usage) -> str | None:
+        """Name of the first limit the usage exceeds, None if it fits"""
+        for name in LIMITS:
+            limit = getattr(self, name)
+            if limit is not None and getattr(usage, name) > limit:
+                return name
+        return None
+
+
+def image_tokens(width: int | None, height: int | None, detail: str | None) -> int:
+    """Prompt tokens of an image as computed by OpenAI: a base amount plus the
+    512px tiles of the image fitted into 2048x2048 and to 768px on its short
+    side. Images of unknown dimensions are assumed to be large."""
+    if detail == "low":
+        return IMAGE_BASE_TOKENS
+    if not width or not height:
+        return IMAGE_TOKEN_ESTIMATE
+    scale = min(1.0, 2048 / max(width, height))
+    scale *= min(1.0, 768 / (min(width, height) * scale))
+    tiles = math.ceil(width * scale / 512) * math.ceil(height * scale / 512)
+    return IMAGE_BASE_TOKENS + IMAGE_TILE_TOKENS * tiles
+
+
+def estimate_prompt_tokens(
+    prompts: list[tuple[str, str]], preprocessing: ImagePreprocessing | None
+) -> int:
+    """Prompt tokens of a request estimated from the length of its texts and the
+    dimensions of its images, which are read from the headers of the files"""
+    tokens = 0
+    for key, value in prompts:
+        if key == "text":
+            tokens += len(value) // 4 + 1
+        elif key == "image":
+            asset = media_registry.asset(value)
+            width, height = asset.width, asset.height
+            if preprocessing and preprocessing.max_edge and width and height:
+                scale = min(1.0, preprocessing.max_edge / max(width, height))
+                width, height = round(width * scale), round(height * scale)
+            tokens += image_tokens(
+                width, height, preprocessing.detail if preprocessing else None
+            )
+    return tokens
+
+
+class BudgetTracker:
+    """Enforces the budgets of the models and of the run while evaluating. Every
+    evaluation reserves its estimated usage before it is started and is charged
+    with the usage reported by the model when it completed. Evaluations of a
+    model which would exceed a budget are not started. Answers of LLM judges are
+    charged, but never refused."""
+
+    def __init__(self, models: dict[str, "Model"], budget: Budget | None = None):
+        self.models = models
+        self.budget = budget
+        self.estimates: dict[str, Usage] = {}
+        self.spent: dict[str, Usage] = {}
+        self.skipped: dict[str, int] = {}
+        self._reserved: dict[str, Usage] = {}
+        # reservations made ahead of the evaluation of units, e.g. when their
+        # prompts were written into a batch, and the units refused then
+        self._held: dict[UnitKey, Usage] = {}
+        self._refused: set[UnitKey] = set()
+        self._lock = threading.Lock()
+
+    def estimate_units(self, units: list["EvalUnit"]) -> dict[str, Usage]:
+        """Estimated usage of the units per model, without any request"""
+        estimates: dict[str, Usage] = {}
+        for unit in units:
+            estimates[unit.model] = estimates.get(
+                unit.model, Usage()
+            ) + unit.estimate_usage(self.models)
+        self.estimates = estimates
+        return estimates
+
+    def exceeded_estimates(self) -> list[str]:
+        """Budgets the estimated usage exceeds"""
+        exceeded = []
+        for name, estimate in self.estimates.items():
+            budget = self.models[name].budget
+            limit = budget.exceeded_by(estimate) if budget else None
+            if limit is not None:
+                exceeded.append(f"`{limit}` of model `{name}`")
+        total = sum(self.estimates.values(), Usage())
+        limit = self.budget.exceeded_by(total) if self.budget else None
+        if limit is not None:
+            exceeded.append(f"`{limit}` of the run")
+        return exceeded
+
+    def reserve(self, name: str, estimate: Usage) -> str | None:
+        """Reserves the estimated usage of an evaluation of the model. Returns the
+        budget it would exceed instead, nothing is reserved then."""
+        with self._lock:
+            reserved = self._reserved.get(name, Usage()) + estimate
+            budget = self.models[name].budget
+            limit = (
+                budget.exceeded_by(self.spent.get(name, Usage()) + reserved)
+                if budget
+                else None
+            )
+            if limit is not None:
+                return f"`{limit}` budget of model `{name}`"
+            if self.budget is not None:
+                total = sum(
+                    [*self.spent.values(), *self._reserved.values(), estimate],
+                    Usage(),
+                )
+                limit = self.budget.exceeded_by(total)
+                if limit is not None:
+                    return f"`{limit}` budget of the run"
+            self._reserved[name] = reserved
+            return None
+
+    def hold(self, unit: "EvalUnit", estimate: Usage) -> str | None:
+        """Reserves the estimated usage of a unit ahead of its evaluation, which
+        takes the reservation over. Returns the budget it would exceed instead,
+        the unit is refused then."""
+        exceeded = self.reserve(unit.model, estimate)
+        with self._lock:
+            if exceeded is None:
+                self._held[unit.key] = estimate
+            else:
+                self._refused.add(unit.key)
+        return exceeded
+
+    def refuse(self, unit: "EvalUnit") -> None:
+        """Marks the unit to be skipped when it is evaluated"""
+        with self._lock:
+            self._refused.add(unit.key)
+
+    def refused(self, unit: "EvalUnit") -> bool:
+        with self._lock:
+            return unit.key in self._refused
+
+    def take(self, unit: "EvalUnit") -> Usage | None:
+        """Reservation held for the unit, None if there is none"""
+        with self._lock:
+            return self._held.pop(unit.key, None)
+
+    def release(self, name: str, estimate: Usage) -> None:
+        """Releases the reservation of an evaluation, completed or failed"""
+        with self._lock:
+            self._reserved[name] = self._reserved.get(name, Usage()) - estimate
+
+    def _spend(self, name: str, usage: Usage) -> None:
+        with self._lock:
+            self.spent[name] = self.spent.get(name, Usage()) + usage
+
+    def charge_answer(self, name: str, answer: "Answer") -> None:
+        """Charges the model with the usage of an answer, including retried
+        requests, e.g. of a sample or of an LLM judge. Answers from the response
+        cache are free."""
+        if not answer.cached and name in self.models:
+            self._spend(
+                name,
+                self.models[name].usage(
+                    answer.prompt_tokens, answer.completion_tokens, answer.requests
+                ),
+            )
+
+    def skip(self, name: str, count: int) -> None:
+        with self._lock:
+            self.skipped[name] = self.skipped.get(name, 0) + count
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            names = [
+                name
+                for name in self.models
+                if name in self.estimates or name in self.spent
+            ]
+            return {
+                "models": {
+                    name: {
+                        "budget": self.models[name].budget,
+                        "estimate": self.estimates.get(name, Usage()),
+                        "spent": self.spent.get(name, Usage()),
+                        "skipped": self.skipped.get(name, 0),
+                    }
+                    for name in names
+                },
+                "run": {
+                    "budget": self.budget,
+                    "estimate": sum(self.estimates.values(), Usage()),
+                    "spent": sum(self.spent.values(), Usage()),
+                    "skipped": sum(self.skipped.values()),
+                },
+            }
+
+
+def report_usage(pc: ParseContext, usages: dict[str, Usage], label: str) -> None:
+    """Reports the usage of every model and of all of them together"""
+    for name, usage in [*usages.items(), ("total", sum(usages.values(), Usage()))]:
+        cost = f", cost {usage.cost:.2f}" if usage.cost else ""
+        pc.report(
+            f"{name}: {label} {usage.prompt_tokens} prompt tokens, "
+            f"{usage.completion_tokens} completion tokens, "
+            f"{usage.requests} requests{cost}"
+        )
@@ -1,12 +1,109 @@
 # SPDX-FileCopyrightText: Copyright 2024 Siemens AG
 # SPDX-License-Identifier: MIT
 
+from dataclasses import dataclass
+from functools import cache
+from pathlib import Path
+from typing import Any
+import hashlib
 import os
+import pickle
+import threading
 import yaml
 import re
 
+try:
+    from yaml import CSafeLoader as _BaseLoader
+except ImportError:
+    # PyYAML without LibYAML bindings
+    from yaml import SafeLoader as _BaseLoader  # type: ignore[assignment]
 
-def load_yaml(path=None, data=None, tag="!ENV"):
+# pattern for global vars: look for ${word}
+_ENV_PATTERN = re.compile(r".*?\$\{(\w+)\}.*")
+
+# changes whenever the format of the cached configurations changes
+_CACHE_VERSION = 1
+
+
+@dataclass(frozen=True)
+class EnvTemplate:
+    """Scalar marked for the substitution of environment variables"""
+
+    value: str
+
+    def resolve(self) -> str:
+        """
+        Extracts the environment variable from the value
+        :return: the parsed string that contains the value of the environment
+        variable
+        """
+        match = _ENV_PATTERN.findall(self.value)  # to find all env variables in line
+        if match:
+            full_value = self.value
+            for g in match:
+                full_value = full_value.replace(f"${{{g}}}", os.environ.get(g, g))
+            return full_value
+        return self.value
+
+
+def _construct_env_variables(loader, node) -> str:
+    return EnvTemplate(loader.construct_scalar(node)).resolve()
+
+
+def _construct_env_template(loader, node) -> EnvTemplate:
+    return EnvTemplate(loader.construct_scalar(node))
+
+
+@cache
+def env_loader(tag: str = "!ENV", resolve: bool = True) -> type:
+    """Loader class for the tag, created once per tag. Without `resolve` the
+    tagged values are kept as `EnvTemplate`."""
+    loader = type("EnvLoader", (_BaseLoader,), {})
+    # the tag will be used to mark where to start searching for the pattern
+    # e.g. somekey: !ENV somestring${MYENVVAR}blah blah blah
+    loader.add_implicit_resolver(tag, _ENV_PATTERN, None)
+    loader.add_constructor(
+        tag, _construct_env_variables if resolve else _construct_env_template
+    )
+    return loader
+
+
+def resolve_env(value: Any) -> Any:
+    """Substitutes the environment variables of all `EnvTemplate` in the value"""
+    if isinstance(value, EnvTemplate):
+        return value.resolve()
+    if isinstance(value, dict):
+        return {resolve_env(key): resolve_env(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [resolve_env(item) for item in value]
+    return value
+
+
+def _load_cached(path: Path, tag: str, cache_dir: Path) -> Any:
+    """Parsed YAML file, taken from the cache if the file content did not change.
+    The environment variables are not substituted, so their values are never
+    stored in the cache."""
+    data = path.read_bytes()
+    identity = f"{_CACHE_VERSION}-{yaml.__version__}-{_BaseLoader.__name__}-{tag}"
+    digest = hashlib.sha256(identity.encode("utf-8") + b"\0" + data).hexdigest()
+    cache_file = cache_dir / f"{digest}.pickle"
+    try:
+        with cache_file.open("rb") as f:
+            return pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        pass
+
+    value = yaml.load(data, Loader=env_loader(tag, False))
+
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    temp = cache_file.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+    with temp.open("wb") as f:
+        pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temp, cache_file)
+    return value
+
+
+def load_yaml(path=None, data=None, tag="!ENV", cache_dir: Path | None = None):
     """
     Load a yaml configuration file and resolve any environment variables
     The environment variables must have !ENV before them and be in this format
@@ -21,40 +118,16 @@ def load_yaml(path=None, data=None, tag="!ENV"):
     :param str path: the path to the yaml file
     :param str data: the yaml data itself as a stream
     :param str tag: the tag to look for
+    :param Path cache_dir: directory caching the parsed files by their content
     :return: the dict configuration
     :rtype: dict[str, T]
     """
-    # pattern for global vars: look for ${word}
-    pattern = re.compile(r".*?\$\{(\w+)\}.*")
-    loader = yaml.SafeLoader
-
-    # the tag will be used to mark where to start searching for the pattern
-    # e.g. somekey: !ENV somestring${MYENVVAR}blah blah blah
-    loader.add_implicit_resolver(tag, pattern, None)
-
-    def constructor_env_variables(loader, node):
-        """
-        Extracts the environment variable from the node's value
-        :param yaml.Loader loader: the yaml loader
-        :param node: the current node in the yaml
-        :return: the parsed string that contains the value of the environment
-        variable
-        """
-        value = loader.construct_scalar(node)
-        match = pattern.findall(value)  # to find all env variables in line
-        if match:
-            full_value = value
-            for g in match:
-                full_value = full_value.replace(f"${{{g}}}", os.environ.get(g, g))
-            return full_value
-        return value
-
-    loader.add_constructor(tag, constructor_env_variables)
-
     if path:
+        if cache_dir is not None:
+            return resolve_env(_load_cached(Path(path), tag, Path(cache_dir)))
         with open(path) as conf_data:
-            return yaml.load(conf_data, Loader=loader)
+            return yaml.load(conf_data, Loader=env_loader(tag))
     elif data:
-        return yaml.load(data, Loader=loader)
+        return yaml.load(data, Loader=env_loader(tag))
     else:
         raise ValueError("Either a path or data should be defined as input")
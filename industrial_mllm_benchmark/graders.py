@@ -4,6 +4,7 @@
 from .implementations import Implementation
 from dataclasses import dataclass
 from typing import Any
+from concurrent.futures import ThreadPoolExecutor
 import time
 from .parse_context import ParseContext
 
@@ -58,6 +59,15 @@ class GraderResults:
     status: str
     results: list[GraderResult]
 
+    @staticmethod
+    def from_dict(value: dict[str, Any]) -> "GraderResults":
+        return GraderResults(
+            value["threshold"],
+            value["combined_result"],
+            value["status"],
+            [GraderResult(**result) for result in value["results"]],
+        )
+
 
 @dataclass(frozen=True)
 class GraderHolders:
@@ -90,47 +100,77 @@ class GraderHolders:
         except Exception as e:
             pc.raise_error(cause=e)
 
+    def _grade(
+        self,
+        ec: ParseContext,
+        holder: GraderHolder,
+        context: dict[str, Any],
+        actual_answer: str,
+    ) -> tuple[float, bool]:
+        """Returns the result of the grader and whether it failed with an exception"""
+        with ec.context(f"{holder.name}") as ec:
+            args = {
+                "ec": ec,
+                "context": context,
+                "actual_answer": actual_answer,
+                "expected_answer": holder.expected_answer,
+            }
+            grader = holder.grader
+            failed = False
+
+            start = time.time()
+            ## TODO: capture exception and report them during eval
+            ## QUESTIONS: How to handle if a grader fails? Fail the test?
+            try:
+                result = grader.implementation.invoke(args)
+                if isinstance(result, bool):
+                    result = 1.0 if result else 0.0
+
+            except Exception as error:
+                ec.report(str(error))
+                failed = True
+                result = 0.0  # fail
+
+            duration = time.time() - start
+            ec.report(f"grading took {duration:.2f} seconds, result: {result}")
+            ec.annotate(grader=holder.name, result=result, failed=failed)
+
+            return result, failed
+
     def evaluate(
-        self, ec: ParseContext, context: dict[str, Any], actual_answer: str
+        self,
+        ec: ParseContext,
+        context: dict[str, Any],
+        actual_answer: str,
+        max_workers: int = 1,
     ) -> GraderResults:
         total = 0.0
         sum_weight = 0.0
         grader_results = []
         exception_happened = False
         total_start = time.time()
-        for holder in self.graders:
-            name = holder.name
-            with ec.context(f"{name}") as ec:
-                weight = holder.weight
-                sum_weight += weight
-                expected_answer = holder.expected_answer
-
-                args = {
-                    "ec": ec,
-                    "context": context,
-                    "actual_answer": actual_answer,
-                    "expected_answer": expected_answer,
-                }
-                grader = holder.grader
-
-                start = time.time()
-                ## TODO: capture exception and report them during eval
-                ## QUESTIONS: How to handle if a grader fails? Fail the test?
-                try:
-                    result = grader.implementation.invoke(args)
-                    if isinstance(result, bool):
-                        result = 1.0 if result else 0.0
-
-                except Exception as error:
-                    ec.report(str(error))
-                    exception_happened = True
-                    result = 0.0  # fail
 
-                duration = time.time() - start
-                ec.report(f"grading took {duration:.2f} seconds, result: {result}")
-
-                grader_results.append(GraderResult(name, result))
-                total += weight * float(result)
+        if max_workers > 1 and len(self.graders) > 1:
+            with ThreadPoolExecutor(min(max_workers, len(self.graders))) as executor:
+                futures = [
+                    executor.submit(
+                        self._grade, ec.fork(), holder, context, actual_answer
+                    )
+                    for holder in self.graders
+                ]
+                outcomes = [future.result() for future in futures]
+        else:
+            outcomes = [
+                self._grade(ec, holder, context, actual_answer)
+                for holder in self.graders
+            ]
+
+        # combined in the order of the graders, independent of their completion
+        for holder, (result, failed) in zip(self.graders, outcomes):
+            sum_weight += holder.weight
+            exception_happened |= failed
+            grader_results.append(GraderResult(holder.name, result))
+            total += holder.weight * float(result)
 
         total /= sum_weight
         if exception_happened:
@@ -0,0 +1,185 @@
+# SPDX-FileCopyrightText: Copyright 2024 Siemens AG
+# SPDX-License-Identifier: MIT
+
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Any
+from .benchmark import Benchmark
+from .mock_server import MockServer, MockBehaviour
+from .parse_context import ParseContext
+from .scheduler import Scheduler
+import json
+import multiprocessing
+import sys
+import tempfile
+import time
+
+DEFAULT_SIZES = (10, 100, 1000, 10000)
+
+
+@dataclass(frozen=True)
+class HarnessResult:
+    tasks: int
+    units: int
+    workers: int
+    duration: float
+    units_per_second: float
+    # CPU time of the benchmark process (user and system) per model request
+    cpu_per_request: float
+    # peak resident set size of the benchmark process in megabytes
+    peak_rss: float | None
+    requests: int
+    rate_limited: int
+
+
+def synthetic_config(directory: Path, tasks: int, endpoint: str) -> Path:
+    """Writes a benchmark configuration with `tasks` text tasks against a single
+    model behind `endpoint`"""
+    config = {
+        "models": {
+            "mock": {
+                "implementation": {
+                    "language": "python",
+                    "module": "industrial_mllm_benchmark",
+                    "class": "OllamaModel",
+                    "function": "parse_instance",
+                },
+                "endpoint": endpoint,
+                "model": "mock",
+                "rate_limit": {"backoff": 0.01, "max_backoff": 0.1},
+            }
+        },
+        "graders": {
+            "contains": {
+                "description": "Checks whether the answer contains the expected text",
+                "implementation": {
+                    "language": "python",
+                    "module": "industrial_mllm_benchmark",
+                    "function": "contains",
+                },
+            }
+        },
+        "system_prompts": {"default": "Answer briefly."},
+        "tasksets": [
+            {
+                "name": "synthetic",
+                "tasks": [
+                    {
+                        "name": f"task-{index}",
+                        "user_prompt": [{"text": f"Question {index}"}],
+                        "graders": {
+                            "threshold": 0.5,
+                            "use": [
+                                {"name": "contains", "weight": 1, "answer": "mock"}
+                            ],
+                        },
+                    }
+                    for index in range(tasks)
+                ],
+            }
+        ],
+    }
+    path = directory / f"synthetic-{tasks}.yml"
+    # JSON is valid YAML and much faster to write for large configurations
+    path.write_text(json.dumps(config), encoding="utf-8")
+    return path
+
+
+def _peak_rss() -> float | None:
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _evaluate(config: Path, workers: int, queue: Any) -> None:
+    try:
+        with ParseContext.root("[harness]") as pc:
+            benchmark = Benchmark.parse(pc, config)
+            units = len(benchmark.units())
+            cpu_start = time.process_time()
+            start = time.perf_counter()
+            benchmark.evaluate(pc, Scheduler(workers))
+            duration = time.perf_counter() - start
+            cpu = time.process_time() - cpu_start
+        queue.put(
+            {"units": units, "duration": duration, "cpu": cpu, "rss": _peak_rss()}
+        )
+    except Exception as e:
+        queue.put({"error": str(e)})
+
+
+def run(
+    sizes: tuple[int, ...] = DEFAULT_SIZES,
+    workers: int = 8,
+    behaviour: MockBehaviour | None = None,
+) -> list[HarnessResult]:
+    """Runs synthetic benchmarks of the given sizes against a local mock server.
+    Every size is evaluated in a fresh process, so the CPU time and peak memory
+    are those of the harness alone."""
+    server = MockServer(behaviour=behaviour)
+    endpoint = server.start()
+    context = multiprocessing.get_context("spawn")
+    results = []
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            for size in sizes:
+                config = synthetic_config(Path(directory), size, endpoint)
+                before = server.stats()
+                queue = context.Queue()
+                process = context.Process(
+                    target=_evaluate, args=(config, workers, queue)
+                )
+                process.start()
+                measured = queue.get()
+                process.join()
+                if "error" in measured:
+                    raise RuntimeError(
+                        f"Synthetic benchmark of {size} tasks failed: "
+                        f"{measured['error']}"
+                    )
+                after = server.stats()
+
+                requests = after["requests"] - before["requests"]
+                results.append(
+                    HarnessResult(
+                        size,
+                        measured["units"],
+                        workers,
+                        measured["duration"],
+                        measured["units"] / measured["duration"],
+                        measured["cpu"] / max(requests, 1),
+                        measured["rss"],
+                        requests,
+                        after["rate_limited"] - before["rate_limited"],
+                    )
+                )
+    finally:
+        server.stop()
+    return results
+
+
+def compare(
+    results: list[HarnessResult], baseline: list[dict[str, Any]], tolerance: float
+) -> list[str]:
+    """Regressions of the units per second against a baseline of a previous run"""
+    previous = {entry["tasks"]: entry for entry in baseline}
+    regressions = []
+    for result in results:
+        entry = previous.get(result.tasks, None)
+        if entry is None:
+            continue
+        limit = entry["units_per_second"] * (1 - tolerance)
+        if result.units_per_second < limit:
+            regressions.append(
+                f"{result.tasks} tasks: {result.units_per_second:.1f} units/s, "
+                f"baseline {entry['units_per_second']:.1f} units/s"
+            )
+    return regressions
+
+
+def to_json(results: list[HarnessResult]) -> list[dict[str, Any]]:
+    return [asdict(result) for result in results]
@@ -0,0 +1,112 @@
+# SPDX-FileCopyrightText: Copyright 2024 Siemens AG
+# SPDX-License-Identifier: MIT
+
+from collections import OrderedDict
+from dataclasses import dataclass
+from .image_preprocessing import ImagePreprocessing
+from .media import MediaAsset, media_registry
+import base64
+import threading
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+@dataclass(frozen=True)
+class EncodedImage:
+    # base64 encoded as ASCII bytes, ready to be written into request bodies
+    payload: bytes
+    mime_type: str
+    original_size: int
+    size: int
+
+    @property
+    def data_url(self) -> str:
+        return f"data:{self.mime_type};base64,{self.payload.decode('ascii')}"
+
+
+class ImageCache:
+    """Process wide cache of base64 encoded image files, keyed by the content hash of
+    the media asset and the preprocessing. The least recently used entries are
+    dropped when the encoded payloads exceed the byte budget."""
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES) -> None:
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[tuple[str, str], EncodedImage] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes_read = 0
+        self.bytes_saved = 0
+
+    def resize(self, max_bytes: int) -> None:
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._shrink()
+
+    def _shrink(self) -> None:
+        while self._entries and self._bytes > self.max_bytes:
+            _, encoded = self._entries.popitem(last=False)
+            self._bytes -= len(encoded.payload)
+            self.evictions += 1
+
+    def encoded(
+        self,
+        image: MediaAsset | str,
+        preprocessing: ImagePreprocessing | None = None,
+        count: bool = True,
+    ) -> EncodedImage:
+        """Base64 encoded (and preprocessed) content of the image, given as asset or
+        path. With `count` disabled the lookup is not recorded in the statistics."""
+        asset = media_registry.asset(image) if isinstance(image, str) else image
+        variant = preprocessing.key if preprocessing else ""
+        key = (asset.digest, variant)
+        with self._lock:
+            encoded = self._entries.get(key, None)
+            if encoded is not None:
+                self._entries.move_to_end(key)
+                if count:
+                    self.hits += 1
+                    self.bytes_saved += asset.size
+                return encoded
+
+        data = asset.read()
+        if preprocessing is None:
+            preprocessing = ImagePreprocessing()
+        processed, mime_type = preprocessing.process(data, asset.digest)
+        encoded = EncodedImage(
+            base64.b64encode(processed),
+            mime_type,
+            len(data),
+            len(processed),
+        )
+
+        with self._lock:
+            if count:
+                self.misses += 1
+                self.bytes_read += len(data)
+            if len(encoded.payload) <= self.max_bytes and key not in self._entries:
+                self._entries[key] = encoded
+                self._bytes += len(encoded.payload)
+                self._shrink()
+        return encoded
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "bytes_read": self.bytes_read,
+                "bytes_saved": self.bytes_saved,
+                "bytes_cached": self._bytes,
+            }
+
+
+image_cache = ImageCache()
@@ -0,0 +1,137 @@
+# SPDX-FileCopyrightText: Copyright 2024 Siemens AG
+# SPDX-License-Identifier: MIT
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+from io import BytesIO
+from .parse_context import ParseContext
+import hashlib
+import os
+import threading
+
+FORMATS = {"jpeg": "image/jpeg", "png": "image/png"}
+DETAILS = ("low", "high", "auto")
+
+
+def detect_mime_type(data: bytes) -> str:
+    """Mime type of the image based on its signature, JPEG if unknown"""
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if data[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    return "image/jpeg"
+
+
+@dataclass(frozen=True)
+class ImagePreprocessing:
+    """Downscaling and re-encoding of images before they are sent to a model"""
+
+    max_edge: int | None = None
+    format: str | None = None
+    quality: int = 85
+    detail: str | None = None
+    cache_dir: str | None = None
+
+    @staticmethod
+    def parse(
+        pc: ParseContext, config: dict[str, Any] | None
+    ) -> "ImagePreprocessing | None":
+        if config is None:
+            return None
+        try:
+            max_edge = config.get("max_edge", None)
+            image_format = config.get("format", None)
+            detail = config.get("detail", None)
+            if image_format is not None and image_format not in FORMATS:
+                pc.raise_error(f"Unsupported image format `{image_format}`")
+            if detail is not None and detail not in DETAILS:
+                pc.raise_error(f"Unsupported image detail `{detail}`")
+            preprocessing = ImagePreprocessing(
+                int(max_edge) if max_edge is not None else None,
+                image_format,
+                int(config.get("quality", 85)),
+                detail,
+                config.get("cache_dir", None),
+            )
+            if preprocessing.transforms:
+                _import_pillow()
+            return preprocessing
+        except Exception as e:
+            pc.raise_error("Invalid image preprocessing", e)
+
+    @property
+    def transforms(self) -> bool:
+        """Whether the image content is changed, not only annotated"""
+        return self.max_edge is not None or self.format is not None
+
+    @property
+    def key(self) -> str:
+        return f"{self.max_edge}-{self.format}-{self.quality}"
+
+    def process(self, data: bytes, digest: str | None = None) -> tuple[bytes, str]:
+        """Preprocessed image and its mime type, cached on disk by content hash
+        (the SHA-256 `digest` of the data, if already known)"""
+        if not self.transforms:
+            return data, detect_mime_type(data)
+
+        cache_file = None
+        if self.cache_dir:
+            digest = digest or hashlib.sha256(data).hexdigest()
+            cache_file = Path(self.cache_dir) / f"{digest}-{self.key}"
+            try:
+                cached = cache_file.read_bytes()
+                return cached, detect_mime_type(cached)
+            except FileNotFoundError:
+                pass
+
+        processed = self._transform(data)
+
+        if cache_file is not None:
+            cache_file.parent.mkdir(parents=True, exist_ok=True)
+            temp = cache_file.with_suffix(f".{threading.get_ident()}.tmp")
+            temp.write_bytes(processed)
+            os.replace(temp, cache_file)
+
+        return processed, detect_mime_type(processed)
+
+    def _transform(self, data: bytes) -> bytes:
+        image_module, image_ops = _import_pillow()
+
+        image = image_module.open(BytesIO(data))
+        image = image_ops.exif_transpose(image)
+        resized = False
+        if self.max_edge is not None and max(image.size) > self.max_edge:
+            image.thumbnail((self.max_edge, self.max_edge), image_module.LANCZOS)
+            resized = True
+
+        image_format = self.format
+        if image_format is None:
+            image_format = "png" if detect_mime_type(data) == "image/png" else "jpeg"
+
+        output = BytesIO()
+        if image_format == "jpeg":
+            if image.mode not in ("RGB", "L"):
+                image = image.convert("RGB")
+            image.save(output, "JPEG", quality=self.quality, optimize=True)
+        else:
+            image.save(output, "PNG", optimize=True)
+        processed = output.getvalue()
+
+        # re-encoding alone must not make the upload larger
+        if not resized and len(processed) >= len(data):
+            return data
+        return processed
+
+
+def _import_pillow() -> tuple[Any, Any]:
+    try:
+        from PIL import Image, ImageOps
+
+        return Image, ImageOps
+    except ImportError as e:
+        raise ImportError(
+            "Image preprocessing requires Pillow, please install it (`pip install pillow`)"
+        ) from e
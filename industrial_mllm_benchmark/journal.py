@@ -0,0 +1,78 @@
+# SPDX-FileCopyrightText: Copyright 2024 Siemens AG
+# SPDX-License-Identifier: MIT
+
+from dataclasses import asdict
+from pathlib import Path
+from .models import ModelEvalResult
+from .tasks import EvalUnit
+import json
+import os
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Journal:
+    """Append-only file of completed evaluation units, one JSON object per line.
+    Every unit is flushed to disk as soon as it is completed, so an interrupted
+    run can be resumed."""
+
+    def __init__(self, path: Path, resume: bool = False) -> None:
+        self.path = path
+        self.completed: dict[tuple[str, str, str], ModelEvalResult] = {}
+        if resume and path.exists():
+            self.completed = Journal.load(path)
+            Journal._truncate_partial_line(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = path.open("a" if resume else "w", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def load(path: Path) -> dict[tuple[str, str, str], ModelEvalResult]:
+        completed = {}
+        with path.open("r", encoding="utf-8") as f:
+            for number, line in enumerate(f, start=1):
+                try:
+                    entry = json.loads(line)
+                    key = (entry["taskset"], entry["task"], entry["model"])
+                    completed[key] = ModelEvalResult.from_dict(entry["result"])
+                except Exception as e:
+                    # e.g. a partially written line of an interrupted run
+                    logger.warning(f"Ignoring line {number} of journal `{path}`: {e}")
+        return completed
+
+    @staticmethod
+    def _truncate_partial_line(path: Path, chunk_size: int = 65536) -> None:
+        """Removes an unterminated last line, e.g. of a crashed run, otherwise
+        the next appended unit would be corrupted as well"""
+        with path.open("rb+") as f:
+            size = f.seek(0, os.SEEK_END)
+            end = size
+            while end > 0:
+                start = max(0, end - chunk_size)
+                f.seek(start)
+                newline = f.read(end - start).rfind(b"\n")
+                if newline >= 0:
+                    end = start + newline + 1
+                    break
+                end = start
+            if end < size:
+                logger.warning(f"Removing the incomplete last line of journal `{path}`")
+                f.truncate(end)
+
+    def get(self, unit: EvalUnit) -> ModelEvalResult | None:
+        return self.completed.get(unit.key, None)
+
+    def append(self, unit: EvalUnit, result: ModelEvalResult) -> None:
+        taskset, task, model = unit.key
+        line = json.dumps(
+            {"taskset": taskset, "task": task, "model": model, "result": asdict(result)}
+        )
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        self._file.close()
@@ -0,0 +1,174 @@
+# SPDX-FileCopyrightText: Copyright 2024 Siemens AG
+# SPDX-License-Identifier: MIT
+
+from dataclasses import dataclass
+from typing import Any
+from .image_preprocessing import detect_mime_type
+import hashlib
+import mmap
+import os
+import struct
+import threading
+
+MIME_TYPES = {
+    "png": "image/png",
+    "jpeg": "image/jpeg",
+    "gif": "image/gif",
+    "webp": "image/webp",
+}
+
+# JPEG start of frame markers, which carry the dimensions of the image
+_JPEG_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE}
+
+
+def image_info(data: Any) -> tuple[str | None, int | None, int | None]:
+    """Format, width and height of an image, read from the header of its bytes"""
+    try:
+        if data[:8] == b"\x89PNG\r\n\x1a\n":
+            width, height = struct.unpack(">II", data[16:24])
+            return "png", width, height
+        if data[:6] in (b"GIF87a", b"GIF89a"):
+            width, height = struct.unpack("<HH", data[6:10])
+            return "gif", width, height
+        if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+            chunk = data[12:16]
+            if chunk == b"VP8X":
+                width = int.from_bytes(data[24:27], "little") + 1
+                height = int.from_bytes(data[27:30], "little") + 1
+            elif chunk == b"VP8L":
+                bits = int.from_bytes(data[21:25], "little")
+                width = (bits & 0x3FFF) + 1
+                height = ((bits >> 14) & 0x3FFF) + 1
+            else:
+                width, height = struct.unpack("<HH", data[26:30])
+                width, height = width & 0x3FFF, height & 0x3FFF
+            return "webp", width, height
+        if data[:2] == b"\xff\xd8":
+            offset = 2
+            while offset + 4 <= len(data):
+                if data[offset] != 0xFF:
+                    offset += 1
+                    continue
+                marker = data[offset + 1]
+                if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7 or marker == 0xFF:
+                    offset += 1 if marker == 0xFF else 2
+                    continue
+                (length,) = struct.unpack(">H", data[offset + 2 : offset + 4])
+                if marker in _JPEG_SOF:
+                    height, width = struct.unpack(">HH", data[offset + 5 : offset + 9])
+                    return "jpeg", width, height
+                offset += 2 + length
+            return "jpeg", None, None
+    except (struct.error, IndexError):
+        pass
+    return None, None, None
+
+
+@dataclass(frozen=True)
+class MediaAsset:
+    """A unique media file, identified by the hash of its content. Its bytes are
+    only read when needed."""
+
+    digest: str
+    path: str
+    size: int
+    format: str | None
+    mime_type: str
+    width: int | None
+    height: int | None
+
+    def read(self) -> bytes:
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    def mmap(self) -> mmap.mmap:
+        """Read only memory map of the file, to be closed by the caller"""
+        with open(self.path, "rb") as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _describe(path: str) -> MediaAsset:
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            data: Any = b""
+        else:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            digest = hashlib.sha256(data).hexdigest()
+            image_format, width, height = image_info(data)
+            mime_type = MIME_TYPES.get(image_format or "", None) or detect_mime_type(
+                bytes(data[:16])
+            )
+        finally:
+            if size:
+                data.close()
+    return MediaAsset(digest, path, size, image_format, mime_type, width, height)
+
+
+class MediaRegistry:
+    """Registry of the media files referenced by the prompts. Every file is hashed
+    once and files with identical content share one canonical asset, the first
+    registered one."""
+
+    def __init__(self) -> None:
+        self._by_file: dict[tuple[str, int, int], MediaAsset] = {}
+        self._by_digest: dict[str, MediaAsset] = {}
+        self._lock = threading.Lock()
+        self.references = 0
+        self.duplicate_files = 0
+
+    def _resolve(self, path: str, count: bool) -> MediaAsset:
+        stat = os.stat(path)
+        key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            if count:
+                self.references += 1
+            asset = self._by_file.get(key, None)
+            if asset is not None:
+                return asset
+
+        described = _describe(path)
+        with self._lock:
+            asset = self._by_file.get(key, None)
+            if asset is not None:
+                return asset
+            asset = self._by_digest.get(described.digest, None)
+            if asset is None:
+                asset = described
+                self._by_digest[asset.digest] = asset
+            else:
+                self.duplicate_files += 1
+            self._by_file[key] = asset
+            return asset
+
+    def register(self, path: str) -> MediaAsset:
+        """Canonical asset of the file referenced by a prompt"""
+        return self._resolve(path, True)
+
+    def asset(self, path: str) -> MediaAsset:
+        """Canonical asset of the file, without counting it as reference"""
+        return self._resolve(path, False)
+
+    def assets(self) -> list[MediaAsset]:
+        with self._lock:
+            return list(self._by_digest.values())
+
+    def clear(self) -> None:
+        with self._lock:
+            self._by_file.clear()
+            self._by_digest.clear()
+            self.references = 0
+            self.duplicate_files = 0
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "assets": len(self._by_digest),
+                "references": self.references,
+                "duplicate_files": self.duplicate_files,
+                "bytes": sum(asset.size for asset in self._by_digest.values()),
+            }
+
+
+media_registry = MediaRegistry()
@@ -0,0 +1,172 @@
+# SPDX-FileCopyrightText: Copyright 2024 Siemens AG
+# SPDX-License-Identifier: MIT
+
+from typing import Any
+from .metrics import summarize
+from .models import ModelEvalResult
+from .tasks import TaskEvalResult
+import json
+import statistics
+
+# sections of the result files which are statistics of the single runs, their
+# counters are summed, also per model or host, and their lists concatenated
+_STATS = (
+    "response_cache",
+    "verdict_cache",
+    "image_cache",
+    "payloads",
+    "batch",
+    "swaps",
+)
+
+
+def _canonical(value: Any) -> str:
+    return json.dumps(value, sort_keys=True)
+
+
+def _check_selections(results: list[dict[str, Any]]) -> None:
+    selections = [result.get("selection", None) or {} for result in results]
+    filters = {_canonical(selection.get("filters", [])) for selection in selections}
+    if len(filters) > 1:
+        raise ValueError("The results were created with different filters")
+
+    shards = [selection["shard"] for selection in selections if selection.get("shard")]
+    if not shards:
+        return
+    counts = {int(shard.split("/")[1]) for shard in shards}
+    if len(counts) > 1 or len(shards) != len(results):
+        raise ValueError("The results were created with different numbers of shards")
+    if len(set(shards)) != len(shards):
+        raise ValueError("A shard is contained more than once")
+    count = counts.pop()
+    missing = sorted(set(range(1, count + 1)) - {int(s.split("/")[0]) for s in shards})
+    if missing:
+        raise ValueError(
+            f"Missing shards {', '.join(f'{index}/{count}' for index in missing)}"
+        )
+
+
+def _sum_stats(sections: list[dict[str, Any]]) -> dict[str, Any]:
+    merged: dict[str, Any] = {}
+    for section in sections:
+        for key, value in section.items():
+            if isinstance(value, dict):
+                merged[key] = _sum_stats([merged.get(key, {}), value])
+            elif isinstance(value, list):
+                merged[key] = merged.get(key, []) + value
+            elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                merged[key] = merged.get(key, 0) + value
+            else:
+                merged.setdefault(key, value)
+    return merged
+
+
+def _merge_budget(sections: list[dict[str, Any]]) -> dict[str, Any]:
+    """Sums the estimates, the spent usage and the skipped evaluations, the
+    budgets are the same in all runs"""
+    merged = _sum_stats(sections)
+    merged["run"]["budget"] = sections[0]["run"]["budget"]
+    for name, entry in merged["models"].items():
+        entry["budget"] = next(
+            section["models"][name]["budget"]
+            for section in sections
+            if name in section["models"]
+        )
+    return merged
+
+
+def _merge_preflight(sections: list[dict[str, Any]]) -> dict[str, Any]:
+    """Probes of all runs per model, a model failed if it failed in any run"""
+    probes: dict[str, list[dict[str, Any]]] = {}
+    for section in sections:
+        for name, probe in section.items():
+            probes.setdefault(name, []).append(probe)
+    merged: dict[str, Any] = {}
+    for name, results in probes.items():
+        latencies = [value for result in results for value in result["latencies"]]
+        ok = all(result["ok"] for result in results)
+        merged[name] = {
+            "model": name,
+            "ok": ok,
+            "latency": statistics.median(latencies) if ok and latencies else None,
+            "latencies": latencies,
+            "error": next(
+                (result["error"] for result in results if result["error"]), None
+            ),
+        }
+    return merged
+
+
+def _merge_media(sections: list[dict[str, Any]]) -> dict[str, Any]:
+    files: dict[str, Any] = {}
+    for section in sections:
+        files.update(section.get("files", {}))
+    return {
+        "assets": len(files),
+        "references": sum(section.get("references", 0) for section in sections),
+        "duplicate_files": sum(
+            section.get("duplicate_files", 0) for section in sections
+        ),
+        "bytes": sum(asset["size"] for asset in files.values()),
+        "files": files,
+    }
+
+
+def merge_results(results: list[dict[str, Any]]) -> dict[str, Any]:
+    """Combines the result files of shards of the same benchmark into the result of
+    a single run"""
+    if not results:
+        raise ValueError("No results to merge")
+
+    config = results[0]["config"]
+    if any(_canonical(result["config"]) != _canonical(config) for result in results):
+        raise ValueError("The results were created with different configurations")
+    _check_selections(results)
+
+    # the order of the models of each task as in a single run
+    model_order: dict[str, dict[str, list[str]]] = {
+        taskset_name: {task["name"]: task["models"] for task in taskset["tasks"]}
+        for taskset_name, taskset in config["tasksets"].items()
+    }
+
+    evaluation: dict[str, dict[str, TaskEvalResult]] = {}
+    for taskset_name, tasks in results[0]["evaluation"].items():
+        evaluation[taskset_name] = {
+            task_name: TaskEvalResult(task_name, {}) for task_name in tasks
+        }
+
+    collected: dict[tuple[str, str, str], ModelEvalResult] = {}
+    for result in results:
+        for taskset_name, tasks in result["evaluation"].items():
+            for task_name, task in tasks.items():
+                for model_name, model in task["models"].items():
+                    key = (taskset_name, task_name, model_name)
+                    if key in collected:
+                        raise ValueError(f"Evaluation {'/'.join(key)} is duplicated")
+                    collected[key] = ModelEvalResult.from_dict(model)
+
+    for taskset_name, tasks in evaluation.items():
+        for task_name, task in tasks.items():
+            for model_name in model_order[taskset_name][task_name]:
+                model = collected.get((taskset_name, task_name, model_name), None)
+                if model is not None:
+                    task.models[model_name] = model
+
+    output: dict[str, Any] = {"config": config, "evaluation": evaluation}
+    filters = (results[0].get("selection", None) or {}).get("filters", [])
+    if filters:
+        output["selection"] = {"shard": None, "filters": filters}
+    output["metrics"] = summarize(evaluation)
+    if any("media" in result for result in results):
+        output["media"] = _merge_media([result.get("media", {}) for result in results])
+    for section in _STATS:
+        stats = [result[section] for result in results if section in result]
+        if stats:
+            output[section] = _sum_stats(stats)
+    preflight = [result["preflight"] for result in results if "preflight" in result]
+    if preflight:
+        output["preflight"] = _merge_preflight(preflight)
+    budgets = [result["budget"] for result in results if "budget" in result]
+    if budgets:
+        output["budget"] = _merge_budget(budgets)
+    return output
@@ -0,0 +1,126 @@
+# SPDX-FileCopyrightText: Copyright 2024 Siemens AG
+# SPDX-License-Identifier: MIT
+
+from dataclasses import dataclass, field
+from typing import Iterable
+from .models import ModelEvalResult
+from .tasks import TaskEvalResult
+import threading
+
+
+def percentile(values: list[float], q: float) -> float | None:
+    """Percentile `q` (0-100) of the values with linear interpolation"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100.0
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+@dataclass(frozen=True)
+class ModelMetrics:
+    """Performance of a model over all its evaluations. Latencies, tokens and
+    throughput only cover answers requested from the model, not cached ones."""
+
+    evaluations: int
+    cached: int
+    latency_p50: float | None
+    latency_p90: float | None
+    latency_p99: float | None
+    prompt_tokens: int
+    completion_tokens: int
+    total_tokens: int
+    # completion tokens per second of request latency
+    tokens_per_second: float | None
+    retries: int
+    throttled: float
+    grading_duration: float
+
+    @staticmethod
+    def of(results: list[ModelEvalResult]) -> "ModelMetrics":
+        totals = _Totals()
+        for result in results:
+            totals.add(result)
+        return totals.metrics()
+
+
+@dataclass
+class _Totals:
+    """Running totals of the results of a model"""
+
+    evaluations: int = 0
+    cached: int = 0
+    latencies: list[float] = field(default_factory=list)
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    total_tokens: int = 0
+    retries: int = 0
+    throttled: float = 0.0
+    grading_duration: float = 0.0
+
+    def add(self, result: ModelEvalResult) -> None:
+        self.evaluations += 1
+        self.grading_duration += result.grading_duration
+        if result.cached:
+            self.cached += 1
+            return
+        self.latencies.append(result.duration)
+        self.prompt_tokens += result.prompt_tokens
+        self.completion_tokens += result.completion_tokens
+        self.total_tokens += result.total_tokens
+        self.retries += result.retries
+        self.throttled += result.throttled
+
+    def metrics(self) -> ModelMetrics:
+        latency = sum(self.latencies)
+        return ModelMetrics(
+            self.evaluations,
+            self.cached,
+            percentile(self.latencies, 50),
+            percentile(self.latencies, 90),
+            percentile(self.latencies, 99),
+            self.prompt_tokens,
+            self.completion_tokens,
+            self.total_tokens,
+            self.completion_tokens / latency if latency > 0 else None,
+            self.retries,
+            self.throttled,
+            self.grading_duration,
+        )
+
+
+class MetricsCollector:
+    """Collects the metrics of results one by one, so that the results need not
+    be kept until the end of the run. Only the latencies are kept, one number
+    per requested answer."""
+
+    def __init__(self, models: Iterable[str] = ()) -> None:
+        self._lock = threading.Lock()
+        # the metrics are given in the order of the models
+        self._totals: dict[str, _Totals] = {name: _Totals() for name in models}
+
+    def add(self, model_name: str, result: ModelEvalResult) -> None:
+        with self._lock:
+            self._totals.setdefault(model_name, _Totals()).add(result)
+
+    def metrics(self) -> dict[str, ModelMetrics]:
+        with self._lock:
+            return {
+                name: totals.metrics()
+                for name, totals in self._totals.items()
+                if totals.evaluations
+            }
+
+
+def summarize(
+    evaluation: dict[str, dict[str, TaskEvalResult]],
+) -> dict[str, ModelMetrics]:
+    """Metrics per model of the evaluation of a benchmark"""
+    results: dict[str, list[ModelEvalResult]] = {}
+    for tasks in evaluation.values():
+        for task in tasks.values():
+            for model_name, result in task.models.items():
+                results.setdefault(model_name, []).append(result)
+    return {name: ModelMetrics.of(values) for name, values in results.items()}
@@ -0,0 +1,240 @@
+# SPDX-FileCopyrightText: Copyright 2024 Siemens AG
+# SPDX-License-Identifier: MIT
+
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+import json
+import math
+import random
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+DISTRIBUTIONS = ("constant", "uniform", "normal", "lognormal", "exponential")
+
+
+@dataclass(frozen=True)
+class MockBehaviour:
+    """How the mock server answers: the latency distribution (mean and spread in
+    seconds), the share of requests rejected with HTTP 429 and the answer. With
+    `swap_time` it behaves like a host loading models on demand: a request for a
+    model not among the `max_loaded_models` recently used ones loads it first."""
+
+    latency: float = 0.0
+    distribution: str = "constant"
+    spread: float = 0.0
+    rate_limit_probability: float = 0.0
+    retry_after: float = 1.0
+    answer: str = "This is a mock answer."
+    seed: int | None = None
+    swap_time: float = 0.0
+    max_loaded_models: int = 1
+
+    def __post_init__(self) -> None:
+        if self.distribution not in DISTRIBUTIONS:
+            raise ValueError(f"Unsupported latency distribution `{self.distribution}`")
+
+    def sample_latency(self, rng: random.Random) -> float:
+        mean = self.latency
+        if self.distribution == "uniform":
+            value = rng.uniform(mean - self.spread, mean + self.spread)
+        elif self.distribution == "normal":
+            value = rng.gauss(mean, self.spread)
+        elif self.distribution == "lognormal" and mean > 0:
+            # parameters of the underlying normal distribution for the given mean
+            # and standard deviation
+            sigma = math.sqrt(math.log(1 + (self.spread / mean) ** 2))
+            value = rng.lognormvariate(math.log(mean) - sigma**2 / 2, sigma)
+        elif self.distribution == "exponential" and mean > 0:
+            value = rng.expovariate(1 / mean)
+        else:
+            value = mean
+        return max(0.0, value)
+
+
+class MockServer(ThreadingHTTPServer):
+    """Local stand-in for an OpenAI compatible `/chat/completions` endpoint, e.g. to
+    measure the overhead of the benchmark or to exercise retries without costs"""
+
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        behaviour: MockBehaviour | None = None,
+    ) -> None:
+        super().__init__((host, port), _MockHandler)
+        self.behaviour = behaviour or MockBehaviour()
+        self.requests = 0
+        self.rate_limited = 0
+        self.swaps = 0
+        # loaded models, least recently used first
+        self._loaded: list[str] = []
+        self._random = random.Random(self.behaviour.seed)
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1/chat/completions"
+
+    def start(self) -> str:
+        """Serves in a background thread and returns the endpoint URL"""
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self.url
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _draw(self) -> tuple[float, bool]:
+        """Latency of the next request and whether it is rate limited"""
+        with self._lock:
+            self.requests += 1
+            latency = self.behaviour.sample_latency(self._random)
+            limited = self._random.random() < self.behaviour.rate_limit_probability
+            if limited:
+                self.rate_limited += 1
+            return latency, limited
+
+    def _use(self, model: str) -> float:
+        """Seconds to load the model, if it is not loaded yet"""
+        if self.behaviour.swap_time <= 0:
+            return 0.0
+        with self._lock:
+            if model in self._loaded:
+                self._loaded.remove(model)
+                self._loaded.append(model)
+                return 0.0
+            self.swaps += 1
+            self._loaded.append(model)
+            del self._loaded[: -self.behaviour.max_loaded_models]
+            return self.behaviour.swap_time
+
+    def _unload(self, model: str) -> None:
+        with self._lock:
+            if model in self._loaded:
+                self._loaded.remove(model)
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "rate_limited": self.rate_limited,
+                "swaps": self.swaps,
+            }
+
+
+class _MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: MockServer
+
+    def log_message(self, format: str, *args: Any) -> None:
+        logger.debug(format % args)
+
+    def _send(self, status: int, body: dict[str, Any], headers: dict[str, str]) -> None:
+        content = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_GET(self) -> None:
+        if self.path == "/stats":
+            self._send(200, self.server.stats(), {})
+        else:
+            self._send(404, {"error": {"message": "Not found"}}, {})
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get("Content-Length", 0))
+        raw = self.rfile.read(length)
+        try:
+            payload = json.loads(raw)
+        except ValueError:
+            self._send(400, {"error": {"message": "Invalid JSON"}}, {})
+            return
+
+        model = str(payload.get("model", "mock"))
+        if self.path == "/api/generate":
+            # native Ollama API, a request without prompt loads or unloads
+            if payload.get("keep_alive", None) in (0, "0"):
+                self.server._unload(model)
+            else:
+                time.sleep(self.server._use(model))
+            self._send(200, {"model": model, "response": "", "done": True}, {})
+            return
+
+        behaviour = self.server.behaviour
+        latency, limited = self.server._draw()
+        if limited:
+            self._send(
+                429,
+                {"error": {"code": "429", "message": "Rate limit exceeded"}},
+                {"Retry-After": f"{behaviour.retry_after:g}"},
+            )
+            return
+
+        time.sleep(self.server._use(model) + latency)
+
+        words = behaviour.answer.split(" ")
+        choices = max(1, int(payload.get("n", 1)))
+        # rough estimate of the prompt tokens, four bytes per token
+        usage = {
+            "prompt_tokens": max(1, len(raw) // 4),
+            "completion_tokens": len(words) * choices,
+            "total_tokens": max(1, len(raw) // 4) + len(words) * choices,
+        }
+        if payload.get("stream", False):
+            self._stream(payload, words, usage)
+            return
+
+        self._send(
+            200,
+            {
+                "object": "chat.completion",
+                "model": payload.get("model", "mock"),
+                "choices": [
+                    {
+                        "index": index,
+                        "message": {"role": "assistant", "content": behaviour.answer},
+                        "finish_reason": "stop",
+                    }
+                    for index in range(choices)
+                ],
+                "usage": usage,
+            },
+            {},
+        )
+
+    def _stream(
+        self, payload: dict[str, Any], words: list[str], usage: dict[str, int]
+    ) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def send(data: str) -> None:
+            event = f"data: {data}\n\n".encode("utf-8")
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(event), event))
+            self.wfile.flush()
+
+        for index, word in enumerate(words):
+            content = word if index == 0 else f" {word}"
+            send(json.dumps({"choices": [{"index": 0, "delta": {"content": content}}]}))
+        if payload.get("stream_options", {}).get("include_usage", False):
+            send(json.dumps({"choices": [], "usage": usage}))
+        send("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
@@ -1,13 +1,36 @@
 # SPDX-FileCopyrightText: Copyright 2024 Siemens AG
 # SPDX-License-Identifier: MIT
 
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
-from typing import Any
+from typing import Any, AsyncIterator, TYPE_CHECKING
 from .implementations import Implementation
 from .parse_context import ParseContext
-import base64
+import asyncio
+import math
+import statistics
 import time
+import threading
+from contextlib import asynccontextmanager, nullcontext, AbstractContextManager
+from .budget import (
+    Budget,
+    DEFAULT_COMPLETION_TOKENS,
+    Pricing,
+    Usage,
+    estimate_prompt_tokens,
+)
 from .graders import GraderHolders, GraderResults
+from .image_cache import image_cache
+from .image_preprocessing import ImagePreprocessing
+
+if TYPE_CHECKING:
+    from .batch import BatchAnswers, BatchApi
+    from .payloads import RequestBody
+    from .response_cache import ResponseCache
+
+# seconds between two attempts of an asynchronous prompt to take a slot
+SLOT_POLL_INTERVAL = 0.01
 
 
 @dataclass
@@ -17,6 +40,73 @@ class Answer:
     prompt_tokens: int
     total_tokens: int
     duration: float
+    cached: bool = False
+    retries: int = 0
+    throttled: float = 0.0
+    time_to_first_token: float | None = None
+    inter_token_latency: float | None = None
+    tokens_per_second: float | None = None
+    # requests sent for the answer, including retries
+    requests: int = 1
+
+
+def pass_at_k(n: int, c: int, k: int) -> float:
+    """Unbiased estimate of the probability that at least one of `k` samples
+    passes, given `c` of `n` samples passed"""
+    if n - c < k:
+        return 1.0
+    return 1.0 - math.comb(n - c, k) / math.comb(n, k)
+
+
+@dataclass(frozen=True)
+class Sample:
+    """One of several answers sampled for the same prompt, graded on its own"""
+
+    answer: str
+    grader_result: GraderResults
+
+    @staticmethod
+    def from_dict(value: dict[str, Any]) -> "Sample":
+        return Sample(value["answer"], GraderResults.from_dict(value["grader_result"]))
+
+
+@dataclass(frozen=True)
+class SampleStatistics:
+    """Reliability of a model over the samples of a prompt. `pass_at_k` is
+    estimated for `k` samples, all of them unless configured otherwise. The scores
+    leave out samples whose grading failed with an error, `agreement` is the
+    share of samples giving the most common answer."""
+
+    samples: int
+    passed: int
+    pass_at_1: float
+    pass_at_k: float
+    mean_score: float | None
+    stddev_score: float | None
+    agreement: float
+    k: int | None = None
+
+    @staticmethod
+    def of(samples: list[Sample], k: int | None = None) -> "SampleStatistics":
+        n = len(samples)
+        k = min(k or n, n)
+        passed = sum(1 for sample in samples if sample.grader_result.status == "pass")
+        scores = [
+            sample.grader_result.combined_result
+            for sample in samples
+            if sample.grader_result.status != "error"
+        ]
+        answers = Counter(" ".join(sample.answer.split()).lower() for sample in samples)
+        return SampleStatistics(
+            n,
+            passed,
+            pass_at_k(n, passed, 1),
+            pass_at_k(n, passed, k),
+            statistics.fmean(scores) if scores else None,
+            statistics.pstdev(scores) if scores else None,
+            answers.most_common(1)[0][1] / n,
+            k,
+        )
 
 
 @dataclass(frozen=True)
@@ -25,11 +115,129 @@ class ModelEvalResult:
     answer: str
     duration: float
     grader_result: GraderResults
+    cached: bool = False
+    image_bytes_original: int = 0
+    image_bytes_sent: int = 0
+    time_to_first_token: float | None = None
+    inter_token_latency: float | None = None
+    tokens_per_second: float | None = None
+    completion_tokens: int = 0
+    prompt_tokens: int = 0
+    total_tokens: int = 0
+    retries: int = 0
+    throttled: float = 0.0
+    grading_duration: float = 0.0
+    # with several samples, `answer` and `grader_result` are those of the first
+    samples: list[Sample] | None = None
+    sampling: SampleStatistics | None = None
+    # requests sent to the model, without answers from the response cache
+    requests: int = 0
+
+    @staticmethod
+    def from_dict(value: dict[str, Any]) -> "ModelEvalResult":
+        samples = value.get("samples", None)
+        sampling = value.get("sampling", None)
+        return ModelEvalResult(
+            **(
+                value
+                | {
+                    "grader_result": GraderResults.from_dict(value["grader_result"]),
+                    "samples": [Sample.from_dict(sample) for sample in samples]
+                    if samples is not None
+                    else None,
+                    "sampling": SampleStatistics(**sampling)
+                    if sampling is not None
+                    else None,
+                }
+            )
+        )
+
+
+def parse_samples(value: Any) -> int | None:
+    """Number of answers sampled per prompt, as configured with `samples`"""
+    if value is None:
+        return None
+    samples = int(value)
+    if samples < 1:
+        raise ValueError("`samples` must be at least 1")
+    return samples
+
+
+def parse_pass_k(value: Any) -> int | None:
+    """Number of samples pass@k is estimated for, as configured with `pass_k`"""
+    if value is None:
+        return None
+    k = int(value)
+    if k < 1:
+        raise ValueError("`pass_k` must be at least 1")
+    return k
 
 
 class Model:
     def __init__(self, name: str) -> None:
         self.name = name
+        self.samples: int | None = None
+        self.pass_k: int | None = None
+        # seconds a request may take before it is retried, None for no limit
+        self.timeout: float | None = None
+        # timeout derived from the preflight round trip, not part of the config
+        self._derived_timeout: float | None = None
+        # models of the same loading host which fit into its memory at once
+        self.max_loaded_models: int = 1
+        self.max_concurrency: int | None = None
+        self._slots: threading.BoundedSemaphore | None = None
+        self.max_grader_concurrency: int | None = None
+        self._grading_slots: threading.BoundedSemaphore | None = None
+        self.image_preprocessing: ImagePreprocessing | None = None
+        self.pricing: Pricing | None = None
+        self.budget: Budget | None = None
+        self._response_cache: "ResponseCache | BatchAnswers | None" = None
+
+    def derive_timeout(self, timeout: float) -> None:
+        """Sets the timeout used if no `timeout` is configured"""
+        self._derived_timeout = timeout
+
+    def request_timeout(self) -> float | None:
+        """Seconds a request may take, None for no limit"""
+        return self.timeout if self.timeout is not None else self._derived_timeout
+
+    def limit_concurrency(self, max_concurrency: int | None) -> None:
+        """Limits the number of prompts executed in parallel against this model"""
+        if max_concurrency is not None and max_concurrency < 1:
+            raise ValueError("`max_concurrency` must be at least 1")
+        self.max_concurrency = max_concurrency
+        self._slots = (
+            threading.BoundedSemaphore(max_concurrency) if max_concurrency else None
+        )
+
+    def limit_grader_concurrency(self, max_concurrency: int | None) -> None:
+        """Limits the number of graders using this model in parallel"""
+        if max_concurrency is not None and max_concurrency < 1:
+            raise ValueError("`max_grader_concurrency` must be at least 1")
+        self.max_grader_concurrency = max_concurrency
+        self._grading_slots = (
+            threading.BoundedSemaphore(max_concurrency) if max_concurrency else None
+        )
+
+    def grading_slot(self) -> AbstractContextManager:
+        """Has to be held by graders while they use this model"""
+        return self._grading_slots or nullcontext()
+
+    def use_response_cache(self, cache: "ResponseCache | BatchAnswers | None") -> None:
+        self._response_cache = cache
+
+    def cache_identity(self) -> dict[str, Any]:
+        """Identifies the model behind this definition for the response cache"""
+        return {
+            "class": type(self).__qualname__,
+            "name": self.name,
+        } | self._preprocessing_identity()
+
+    def _preprocessing_identity(self) -> dict[str, Any]:
+        if self.image_preprocessing is None:
+            return {}
+        preprocessing = self.image_preprocessing
+        return {"image_preprocessing": [preprocessing.key, preprocessing.detail]}
 
     def request_answer(self, system_prompt: str, prompts: list[tuple[str, str]]) -> str:
         raise
@@ -52,6 +260,45 @@ class Model:
                             model_instance = impl.parsing_invoke(
                                 pc, {"name": key, "config": value}
                             )
+                            max_concurrency = value.get("max_concurrency", None)
+                            if max_concurrency is not None:
+                                model_instance.limit_concurrency(int(max_concurrency))
+                            max_grader_concurrency = value.get(
+                                "max_grader_concurrency", None
+                            )
+                            if max_grader_concurrency is not None:
+                                model_instance.limit_grader_concurrency(
+                                    int(max_grader_concurrency)
+                                )
+                            model_instance.samples = parse_samples(
+                                value.get("samples", None)
+                            )
+                            model_instance.pass_k = parse_pass_k(
+                                value.get("pass_k", None)
+                            )
+                            timeout = value.get("timeout", None)
+                            if timeout is not None:
+                                model_instance.timeout = float(timeout)
+                            model_instance.image_preprocessing = (
+                                ImagePreprocessing.parse(
+                                    pc, value.get("image_preprocessing", None)
+                                )
+                            )
+                            with pc.context("pricing") as pc:
+                                model_instance.pricing = Pricing.parse(
+                                    pc, value.get("pricing", None)
+                                )
+                            with pc.context("budget") as pc:
+                                model_instance.budget = Budget.parse(
+                                    pc, value.get("budget", None)
+                                )
+                            budget = model_instance.budget
+                            if budget and budget.cost is not None:
+                                if model_instance.pricing is None:
+                                    raise ValueError(
+                                        "A `cost` budget requires the `pricing` "
+                                        "of the model"
+                                    )
                             result[name] = model_instance
                         except Exception as e:
                             pc.raise_error(cause=e)
@@ -68,11 +315,232 @@ class Model:
     ) -> Answer:
         raise NotImplementedError
 
+    async def execute_prompt_async(
+        self,
+        ec: ParseContext,
+        system_prompt: dict[str, str],
+        user_prompts: list[tuple[str, str]],
+    ) -> Answer:
+        """Asynchronous `execute_prompt`, executed in a worker thread by default"""
+        return await asyncio.to_thread(
+            self.execute_prompt, ec, system_prompt, user_prompts
+        )
+
+    @asynccontextmanager
+    async def _async_slot(self) -> AsyncIterator[None]:
+        # the slots are shared with the threads of `prompt`, waiting for one must
+        # not block the event loop
+        slots = self._slots
+        if slots is None:
+            yield
+            return
+        while not slots.acquire(blocking=False):
+            await asyncio.sleep(SLOT_POLL_INTERVAL)
+        try:
+            yield
+        finally:
+            slots.release()
+
+    async def prompt_async(
+        self,
+        ec: ParseContext,
+        system_prompt: dict[str, str],
+        user_prompts: list[tuple[str, str]],
+        sample: int = 0,
+    ) -> Answer:
+        """Asynchronous `prompt`, using the same response cache and `max_concurrency`
+        slots. Many prompts can be in flight on one event loop."""
+        cache = self._response_cache
+        if cache is not None:
+            key = cache.key(self, system_prompt, user_prompts, sample)
+            answer = cache.get(key)
+            if answer is not None:
+                ec.report("Using cached answer")
+                return answer
+
+        async with self._async_slot():
+            answer = await self.execute_prompt_async(ec, system_prompt, user_prompts)
+
+        if cache is not None:
+            cache.put(key, answer)
+        return answer
+
+    def prompt(
+        self,
+        ec: ParseContext,
+        system_prompt: dict[str, str],
+        user_prompts: list[tuple[str, str]],
+        sample: int = 0,
+    ) -> Answer:
+        """Executes the prompt while respecting the `max_concurrency` of the model.
+        The answer is taken from the response cache, if one is used and contains it.
+        Every `sample` of a prompt has its own cache entry."""
+        cache = self._response_cache
+        if cache is not None:
+            key = cache.key(self, system_prompt, user_prompts, sample)
+            answer = cache.get(key)
+            if answer is not None:
+                ec.report("Using cached answer")
+                return answer
+
+        with self._slots or nullcontext():
+            answer = self.execute_prompt(ec, system_prompt, user_prompts)
+
+        if cache is not None:
+            cache.put(key, answer)
+        return answer
+
+    def prompt_samples(
+        self,
+        ec: ParseContext,
+        system_prompt: dict[str, str],
+        user_prompts: list[tuple[str, str]],
+        count: int,
+    ) -> list[Answer]:
+        """Samples `count` answers of the prompt, the ones missing in the response
+        cache are requested together by `execute_samples`"""
+        answers: list[Answer | None] = [None] * count
+        cache = self._response_cache
+        keys: list[str] = []
+        if cache is not None:
+            keys = [
+                cache.key(self, system_prompt, user_prompts, sample)
+                for sample in range(count)
+            ]
+            answers = [cache.get(key) for key in keys]
+
+        missing = [sample for sample, answer in enumerate(answers) if answer is None]
+        if len(missing) < count:
+            ec.report(f"Using {count - len(missing)} cached samples")
+        while missing:
+            sampled = self.execute_samples(
+                ec, system_prompt, user_prompts, len(missing)
+            )
+            if not sampled:
+                raise Exception(f"Received none of {len(missing)} samples")
+            if len(sampled) < len(missing):
+                ec.report(
+                    f"Received {len(sampled)} of {len(missing)} samples, "
+                    "requesting the others"
+                )
+            for sample, answer in zip(missing, sampled):
+                answers[sample] = answer
+                if cache is not None:
+                    cache.put(keys[sample], answer)
+            missing = missing[len(sampled) :]
+        return [answer for answer in answers if answer is not None]
+
+    def execute_samples(
+        self,
+        ec: ParseContext,
+        system_prompt: dict[str, str],
+        user_prompts: list[tuple[str, str]],
+        count: int,
+    ) -> list[Answer]:
+        """Executes the prompt `count` times. By default as concurrent requests,
+        models whose API returns several answers per request override this."""
+
+        def execute(ec: ParseContext) -> Answer:
+            with self._slots or nullcontext():
+                return self.execute_prompt(ec, system_prompt, user_prompts)
+
+        if count == 1:
+            return [execute(ec)]
+        with ThreadPoolExecutor(count, thread_name_prefix="sample") as executor:
+            futures = [executor.submit(execute, ec.fork()) for _ in range(count)]
+            return [future.result() for future in futures]
+
+    def probe(self, ec: ParseContext) -> Answer:
+        """Executes a tiny prompt to check that the model is reachable, bypassing
+        the response cache"""
+        return self.execute_prompt(
+            ec, {"text": "You are a health check."}, [("text", "Reply with OK.")]
+        )
+
+    def completion_limit(self) -> int | None:
+        """Completion tokens an answer may have at most, None if not limited"""
+        return None
+
+    def requests_per_prompt(self, samples: int) -> int:
+        """Number of requests sent for `samples` answers of a prompt"""
+        return samples
+
+    def usage(self, prompt_tokens: int, completion_tokens: int, requests: int) -> Usage:
+        cost = (
+            self.pricing.cost(prompt_tokens, completion_tokens) if self.pricing else 0.0
+        )
+        return Usage(prompt_tokens, completion_tokens, requests, cost)
+
+    def estimate_usage(
+        self,
+        system_prompt: dict[str, str],
+        user_prompts: list[tuple[str, str]],
+        samples: int = 1,
+    ) -> Usage:
+        """Usage of the prompt estimated without sending it. Answers are assumed to
+        use up the `completion_limit`, retries are not taken into account."""
+        prompts = [self._extract_prompt(system_prompt)] if system_prompt else []
+        prompt_tokens = estimate_prompt_tokens(
+            prompts + user_prompts, self.image_preprocessing
+        )
+        requests = self.requests_per_prompt(samples)
+        return self.usage(
+            prompt_tokens * requests,
+            (self.completion_limit() or DEFAULT_COMPLETION_TOKENS) * samples,
+            requests,
+        )
+
+    def loading_host(self) -> str | None:
+        """Host loading this model into its memory on demand, models of the same
+        host evict each other. None for models which are always available."""
+        return None
+
+    def load(self, ec: ParseContext) -> None:
+        """Loads the model on its host before its evaluations"""
+
+    def unload(self, ec: ParseContext) -> None:
+        """Frees the memory of the model on its host after its evaluations"""
+
+    def batch_api(self) -> "BatchApi | None":
+        """Batch API accepting the prompts of this model, None if its prompts can
+        only be executed one by one"""
+        return None
+
+    def batch_request(
+        self, system_prompt: dict[str, str], user_prompts: list[tuple[str, str]]
+    ) -> "RequestBody":
+        """Body of the request of the prompt in a batch file"""
+        raise NotImplementedError
+
+    def parse_batch_answer(self, body: dict[str, Any]) -> Answer:
+        """Answer of a response body of a batch output file"""
+        raise NotImplementedError
+
     def _extract_prompt(self, prompt: dict[str, str]) -> tuple[str, str]:
         key = next(iter(prompt))
         elem = prompt[key]
         return key, elem
 
+    def _prompt_tuples(
+        self, prompts: list[dict[str, str]] | list[tuple[str, str]]
+    ) -> list[tuple[str, str]]:
+        """Prompts as `(kind, value)` tuples, graders pass them as dicts"""
+        return [
+            self._extract_prompt(prompt) if isinstance(prompt, dict) else prompt
+            for prompt in prompts
+        ]
+
+    def image_sizes(self, prompts: list[tuple[str, str]]) -> tuple[int, int]:
+        """Original and sent size in bytes of the images of the prompts"""
+        original = 0
+        sent = 0
+        for key, value in prompts:
+            if key == "image":
+                image = image_cache.encoded(value, self.image_preprocessing, False)
+                original += image.original_size
+                sent += image.size
+        return original, sent
+
     def _extends(
         self, prompts: list[dict[str, str]] | list[tuple[str, str]]
     ) -> list[dict[str, Any]]:
@@ -86,14 +554,11 @@ class Model:
             if key == "text":
                 content.append({"type": "text", "text": value})
             elif key == "image":
-                with open(value, "rb") as image_file:
-                    value = base64.b64encode(image_file.read()).decode("utf-8")
-                content.append(
-                    {
-                        "type": "image_url",
-                        "image_url": {"url": f"data:image/jpeg;base64,{value}"},
-                    }
-                )
+                image = image_cache.encoded(value, self.image_preprocessing)
+                image_url = {"url": image.data_url}
+                if self.image_preprocessing and self.image_preprocessing.detail:
+                    image_url["detail"] = self.image_preprocessing.detail
+                content.append({"type": "image_url", "image_url": image_url})
 
         return content
 
@@ -104,15 +569,40 @@ class Model:
         user_prompts: list[tuple[str, str]],
         graders: GraderHolders,
         grader_context: dict[str, Any],
+        samples: int = 1,
+        pass_k: int | None = None,
     ) -> ModelEvalResult:
         try:
             start = time.time()
-            answer = self.execute_prompt(ec, system_prompt, user_prompts)
+            with ec.span("prompt"):
+                if samples > 1:
+                    answers = self.prompt_samples(
+                        ec, system_prompt, user_prompts, samples
+                    )
+                else:
+                    answers = [self.prompt(ec, system_prompt, user_prompts)]
+                ec.annotate(
+                    model=self.name,
+                    samples=samples,
+                    cached=all(answer.cached for answer in answers),
+                    prompt_tokens=sum(answer.prompt_tokens for answer in answers),
+                    completion_tokens=sum(
+                        answer.completion_tokens for answer in answers
+                    ),
+                    retries=sum(answer.retries for answer in answers),
+                )
+            budget = grader_context.get("budget", None)
+            if budget is not None:
+                # only the answers requested now, not the cached samples
+                for answer in answers:
+                    budget.charge_answer(self.name, answer)
             duration = time.time() - start
             ec.report(f"Evaluating model took {duration:.2f} seconds")
         except Exception as e:
             ec.raise_error("Failed to call llm", cause=e)
 
+        image_bytes_original, image_bytes_sent = self.image_sizes(user_prompts)
+
         context = {
             "system_prompt": system_prompt,
             "user_prompts": user_prompts,
@@ -120,9 +610,67 @@ class Model:
         }
 
         merged_context = grader_context | context
+        grader_workers = grader_context.get("grader_workers", 1)
 
         with ec.context("graders") as ec:
-            graders_result = graders.evaluate(ec, merged_context, answer.value)
+            start = time.time()
+            if len(answers) > 1 and grader_workers > 1:
+                # the graders of each sample share the grader workers
+                with ThreadPoolExecutor(
+                    min(grader_workers, len(answers)), thread_name_prefix="sample"
+                ) as executor:
+                    futures = [
+                        executor.submit(
+                            graders.evaluate,
+                            ec.fork(),
+                            merged_context,
+                            answer.value,
+                            1,
+                        )
+                        for answer in answers
+                    ]
+                    results = [future.result() for future in futures]
+            else:
+                results = [
+                    graders.evaluate(ec, merged_context, answer.value, grader_workers)
+                    for answer in answers
+                ]
+            grading_duration = time.time() - start
+            ec.annotate(status=results[0].status)
+
+            sampled = None
+            sampling = None
+            if samples > 1:
+                sampled = [
+                    Sample(answer.value, result)
+                    for answer, result in zip(answers, results)
+                ]
+                sampling = SampleStatistics.of(sampled, pass_k)
+                ec.report(
+                    f"{sampling.passed} of {samples} samples passed, "
+                    f"agreement {sampling.agreement:.2f}"
+                )
+
+            first = answers[0]
             return ModelEvalResult(
-                self.name, answer.value, answer.duration, graders_result
+                self.name,
+                first.value,
+                # all samples are requested together
+                max(answer.duration for answer in answers),
+                results[0],
+                all(answer.cached for answer in answers),
+                image_bytes_original,
+                image_bytes_sent,
+                first.time_to_first_token,
+                first.inter_token_latency,
+                first.tokens_per_second,
+                sum(answer.completion_tokens for answer in answers),
+                sum(answer.prompt_tokens for answer in answers),
+                sum(answer.total_tokens for answer in answers),
+                sum(answer.retries for answer in answers),
+                sum(answer.throttled for answer in answers),
+                grading_duration,
+                sampled,
+                sampling,
+                sum(answer.requests for answer in answers if not answer.cached),
             )
@@ -3,6 +3,7 @@
 
 from typing import Self, Generator, Callable, NoReturn, Any
 from contextlib import contextmanager
+from .tracing import Tracer, Span
 
 import logging
 
@@ -14,30 +15,72 @@ class ParseContext:
         self,
         path: str | None = None,
         reporter: Callable[["ParseContext", str], None] | None = None,
+        tracer: Tracer | None = None,
     ):
         self._path = []
         self.reporter = reporter
+        self.tracer = tracer
+        # open spans of this context, the innermost last
+        self._spans: list[Span] = []
+        # span open in the context this one was forked from
+        self._parent_span: Span | None = None
         if path is not None:
             self._path.append(path)
 
     @contextmanager
     @staticmethod
     def root(
-        path: str | None, reporter: Callable[["ParseContext", str], None] | None = None
+        path: str | None,
+        reporter: Callable[["ParseContext", str], None] | None = None,
+        tracer: Tracer | None = None,
     ) -> Generator["ParseContext", None, None]:
-        pc = ParseContext(path, reporter)
-        yield pc
+        pc = ParseContext(path, reporter, tracer)
+        with pc.span(path or "root"):
+            yield pc
 
     @contextmanager
     def context(self, context: str) -> Generator[Self, None, None]:
         try:
             self._path.append(context)
             logger.debug(f"Enter context: {context}")
-            yield self
+            with self.span(context):
+                yield self
         finally:
             self._path.pop()
             logger.debug(f"Leaving context: {context}")
 
+    @contextmanager
+    def span(self, name: str, **attributes: Any) -> Generator[Self, None, None]:
+        """Records the time spent in the block as span, if a tracer is used.
+        Unlike `context` the path of this context is not changed."""
+        if self.tracer is None:
+            yield self
+            return
+
+        parent = self._spans[-1] if self._spans else self._parent_span
+        span = self.tracer.start(name, parent, {"path": str(self)} | attributes)
+        self._spans.append(span)
+        try:
+            yield self
+        except BaseException as e:
+            span.error = repr(e)
+            raise
+        finally:
+            self._spans.pop()
+            self.tracer.end(span)
+
+    def annotate(self, **attributes: Any) -> None:
+        """Adds attributes, e.g. tokens or status, to the innermost open span"""
+        if self._spans:
+            self._spans[-1].attributes.update(attributes)
+
+    def fork(self) -> "ParseContext":
+        """Creates an independent copy of this context, e.g. for another thread"""
+        pc = ParseContext(None, self.reporter, self.tracer)
+        pc._path = list(self._path)
+        pc._parent_span = self._spans[-1] if self._spans else self._parent_span
+        return pc
+
     def __str__(self) -> str:
         return "/".join(self._path)
 
@@ -0,0 +1,208 @@
+# SPDX-FileCopyrightText: Copyright 2024 Siemens AG
+# SPDX-License-Identifier: MIT
+
+from collections import OrderedDict
+from dataclasses import dataclass, field, replace
+from typing import Any, Iterator
+from .image_cache import image_cache
+from .image_preprocessing import ImagePreprocessing
+import json
+import threading
+
+# tokens of an image in high detail, as estimated by OpenAI for 512px tiles
+IMAGE_TOKEN_ESTIMATE = 765
+
+DEFAULT_MAX_ENTRIES = 4096
+
+_KINDS = ("text", "image")
+
+
+@dataclass(frozen=True)
+class ImageRef:
+    """Image of a compiled payload, its encoded bytes are looked up in the image
+    cache when the body is sent, so compiled payloads do not pin them in memory"""
+
+    path: str
+    preprocessing: ImagePreprocessing | None
+
+
+def _dumps(value: Any) -> bytes:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+@dataclass(frozen=True)
+class CompiledMessages:
+    """The `messages` of a chat completion request, serialized once as JSON byte
+    fragments. Images are referenced and inserted as pre-encoded base64 bytes."""
+
+    fragments: tuple[bytes | ImageRef, ...]
+    text_tokens: int
+    images: int
+
+
+class RequestBody:
+    """JSON body of a request as sequence of byte fragments. It is sent fragment by
+    fragment with a known length, the fragments are never joined."""
+
+    def __init__(self, fragments: list[bytes]) -> None:
+        self.fragments = fragments
+        self._length = sum(len(fragment) for fragment in fragments)
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __iter__(self) -> Iterator[bytes]:
+        return iter(self.fragments)
+
+    def tobytes(self) -> bytes:
+        return b"".join(self.fragments)
+
+    def json(self) -> Any:
+        return json.loads(self.tobytes())
+
+
+@dataclass(frozen=True)
+class CompiledPayload:
+    """Request of a prompt: the compiled messages and the other top-level fields
+    of the body, e.g. `model`, the parameters, `stream` or `n`"""
+
+    messages: CompiledMessages
+    fields: dict[str, Any] = field(default_factory=dict)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self.fields.get(key, default)
+
+    def with_fields(self, **fields: Any) -> "CompiledPayload":
+        return replace(self, fields=self.fields | fields)
+
+    def estimate_tokens(self) -> int:
+        """Rough upper estimate of the tokens of the request for pacing"""
+        completion = self.fields.get("max_tokens", None) or self.fields.get(
+            "max_completion_tokens", 0
+        )
+        return (
+            int(completion)
+            + self.messages.text_tokens
+            + self.messages.images * IMAGE_TOKEN_ESTIMATE
+        )
+
+    def body(self) -> RequestBody:
+        fields = {key: value for key, value in self.fields.items() if key != "messages"}
+        fragments: list[bytes] = [b'{"messages":']
+        for fragment in self.messages.fragments:
+            if isinstance(fragment, ImageRef):
+                encoded = image_cache.encoded(
+                    fragment.path, fragment.preprocessing, False
+                )
+                fragments.append(encoded.payload)
+            else:
+                fragments.append(fragment)
+        if fields:
+            fragments.append(b"," + _dumps(fields)[1:])
+        else:
+            fragments.append(b"}")
+        return RequestBody(fragments)
+
+
+def _content(
+    prompts: list[tuple[str, str]], preprocessing: ImagePreprocessing | None
+) -> tuple[list[bytes | ImageRef], int, int]:
+    """Fragments of the JSON array of content parts, the estimated text tokens and
+    the number of images"""
+    fragments: list[bytes | ImageRef] = [b"["]
+    text_tokens = 0
+    images = 0
+    for index, (key, value) in enumerate(prompts):
+        if index > 0:
+            fragments.append(b",")
+        if key == "text":
+            fragments.append(_dumps({"type": "text", "text": value}))
+            text_tokens += len(value) // 4 + 1
+        elif key == "image":
+            image = image_cache.encoded(value, preprocessing)
+            fragments.append(
+                b'{"type":"image_url","image_url":{"url":"data:'
+                + image.mime_type.encode("ascii")
+                + b";base64,"
+            )
+            fragments.append(ImageRef(value, preprocessing))
+            suffix = b'"'
+            if preprocessing and preprocessing.detail:
+                suffix += b',"detail":' + _dumps(preprocessing.detail)
+            fragments.append(suffix + b"}}")
+            images += 1
+    fragments.append(b"]")
+    return fragments, text_tokens, images
+
+
+def _merge(fragments: list[bytes | ImageRef]) -> tuple[bytes | ImageRef, ...]:
+    merged: list[bytes | ImageRef] = []
+    for fragment in fragments:
+        if isinstance(fragment, bytes) and merged and isinstance(merged[-1], bytes):
+            merged[-1] += fragment
+        else:
+            merged.append(fragment)
+    return tuple(merged)
+
+
+class PayloadCompiler:
+    """Compiles the messages of prompts once and shares them between all models
+    with the same image preprocessing, for every retry and sample"""
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES) -> None:
+        self.max_entries = max_entries
+        self._entries: OrderedDict[Any, CompiledMessages] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def messages(
+        self,
+        system_prompt: list[tuple[str, str]],
+        user_prompts: list[tuple[str, str]],
+        preprocessing: ImagePreprocessing | None = None,
+    ) -> CompiledMessages:
+        # only texts and images are sent, other entries are left out as before
+        system_prompt = [prompt for prompt in system_prompt if prompt[0] in _KINDS]
+        user_prompts = [prompt for prompt in user_prompts if prompt[0] in _KINDS]
+        key = (
+            tuple(system_prompt),
+            tuple(user_prompts),
+            preprocessing.key if preprocessing else "",
+            preprocessing.detail if preprocessing else None,
+        )
+        with self._lock:
+            compiled = self._entries.get(key, None)
+            if compiled is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return compiled
+
+        system, system_tokens, system_images = _content(system_prompt, preprocessing)
+        user, user_tokens, user_images = _content(user_prompts, preprocessing)
+        compiled = CompiledMessages(
+            _merge(
+                [b'[{"role":"system","content":', *system]
+                + [b'},{"role":"user","content":', *user, b"}]"]
+            ),
+            system_tokens + user_tokens,
+            system_images + user_images,
+        )
+
+        with self._lock:
+            self.misses += 1
+            self._entries[key] = compiled
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return compiled
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+
+payload_compiler = PayloadCompiler()
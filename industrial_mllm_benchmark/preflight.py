@@ -0,0 +1,120 @@
+# SPDX-FileCopyrightText: Copyright 2024 Siemens AG
+# SPDX-License-Identifier: MIT
+
+from dataclasses import dataclass, field
+from .models import Model
+from .parse_context import ParseContext
+import statistics
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# the answer of a probe is far shorter than the one of a task, the timeout of a
+# model defaults to a multiple of its probe latency, but at least MIN_TIMEOUT
+TIMEOUT_FACTOR = 60.0
+MIN_TIMEOUT = 120.0
+
+
+@dataclass(frozen=True)
+class ProbeResult:
+    """Outcome of probing a model, `latency` is the median round trip"""
+
+    model: str
+    ok: bool
+    latency: float | None = None
+    latencies: list[float] = field(default_factory=list)
+    error: str | None = None
+
+
+def _probe(ec: ParseContext, model: Model, rounds: int) -> ProbeResult:
+    latencies: list[float] = []
+    try:
+        # the first round also opens the connections used by the run
+        for _ in range(rounds):
+            start = time.time()
+            model.probe(ec)
+            latencies.append(time.time() - start)
+    except Exception as e:
+        return ProbeResult(model.name, False, None, latencies, str(e) or repr(e))
+    return ProbeResult(model.name, True, statistics.median(latencies), latencies)
+
+
+def probe_models(
+    ec: ParseContext,
+    models: dict[str, Model],
+    rounds: int = 2,
+    timeout: float = 60.0,
+) -> dict[str, ProbeResult]:
+    """Probes all models concurrently with `rounds` tiny prompts each. Models not
+    answering within `timeout` seconds fail."""
+    if rounds < 1:
+        raise ValueError("The number of probe rounds must be at least 1")
+
+    results: dict[str, ProbeResult] = {}
+    lock = threading.Lock()
+
+    def run(name: str, model: Model, ec: ParseContext) -> None:
+        with ec.span("probe", model=name):
+            result = _probe(ec, model, rounds)
+        with lock:
+            results[name] = result
+
+    # daemon threads, a hanging endpoint must not block the exit
+    threads = [
+        threading.Thread(
+            target=run, args=(name, model, ec.fork()), name=f"probe-{name}", daemon=True
+        )
+        for name, model in models.items()
+    ]
+    for thread in threads:
+        thread.start()
+    deadline = time.time() + timeout
+    for thread in threads:
+        thread.join(max(0.0, deadline - time.time()))
+
+    with lock:
+        return {
+            name: results.get(
+                name,
+                ProbeResult(name, False, error=f"No answer within {timeout:g} seconds"),
+            )
+            for name in models
+        }
+
+
+def default_timeout(latency: float) -> float:
+    return max(MIN_TIMEOUT, TIMEOUT_FACTOR * latency)
+
+
+def apply_baselines(
+    models: dict[str, Model], results: dict[str, ProbeResult]
+) -> dict[str, float]:
+    """Derives the timeout of the models without configured `timeout` from their
+    probe latency, the config is left unchanged. Returns the latencies of the
+    models which answered."""
+    latencies: dict[str, float] = {}
+    for name, result in results.items():
+        if not result.ok or result.latency is None:
+            continue
+        latencies[name] = result.latency
+        model = models[name]
+        if model.timeout is None:
+            model.derive_timeout(default_timeout(result.latency))
+    return latencies
+
+
+def report_probes(ec: ParseContext, results: dict[str, ProbeResult]) -> list[str]:
+    """Reports the results and returns the names of the failed models"""
+    failed = []
+    for name, result in results.items():
+        if result.ok:
+            ec.report(
+                f"{name}: ok, round trip {result.latency:.2f}s "
+                f"({', '.join(f'{value:.2f}s' for value in result.latencies)})"
+            )
+        else:
+            failed.append(name)
+            ec.report(f"{name}: FAILED, {result.error}")
+    return failed
@@ -0,0 +1,201 @@
+# SPDX-FileCopyrightText: Copyright 2024 Siemens AG
+# SPDX-License-Identifier: MIT
+
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from typing import Any, Self
+import random
+import re
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+_DURATION = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def parse_duration(value: str) -> float | None:
+    """Parses durations like `20ms`, `6s`, `1m30s` or plain seconds"""
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+
+def parse_retry_after(headers: dict[str, str], message: str = "") -> float | None:
+    """Seconds to wait as requested by the server, either via the `Retry-After`
+    headers or via the error message"""
+    if "retry-after-ms" in headers:
+        try:
+            return float(headers["retry-after-ms"]) / 1000.0
+        except ValueError:
+            pass
+    if "retry-after" in headers:
+        value = headers["retry-after"]
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+    match = re.search(r"retry after (\d+) seconds?", message, re.IGNORECASE)
+    if match:
+        return float(match.group(1))
+    return None
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """Bounded exponential backoff with full jitter"""
+
+    max_retries: int = 8
+    backoff: float = 1.0
+    max_backoff: float = 60.0
+
+    def delay(self, attempt: int, retry_after: float | None = None) -> float:
+        backoff = random.uniform(0, min(self.max_backoff, self.backoff * 2**attempt))
+        if retry_after is None:
+            return backoff
+        # honour the server, the jitter spreads the retries of concurrent requests
+        return retry_after + min(backoff, 1.0)
+
+
+class RateLimiter:
+    """Paces the requests to one endpoint to its requests and tokens per minute quota.
+
+    Each request reserves its estimated tokens before it is sent, the reservation is
+    corrected with the actual usage of the response. Rate limit headers of the
+    responses pause the endpoint until the server accepts requests again."""
+
+    _shared: dict[str, "RateLimiter"] = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(
+        self,
+        requests_per_minute: float | None = None,
+        tokens_per_minute: float | None = None,
+    ) -> None:
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._requests = requests_per_minute or 0.0
+        self._tokens = tokens_per_minute or 0.0
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def shared(
+        cls,
+        endpoint: str,
+        requests_per_minute: float | None = None,
+        tokens_per_minute: float | None = None,
+    ) -> Self:
+        """Limiter shared by all models using the endpoint, the strictest quota wins"""
+        with cls._shared_lock:
+            limiter = cls._shared.get(endpoint, None)
+            if limiter is None:
+                limiter = cls(requests_per_minute, tokens_per_minute)
+                cls._shared[endpoint] = limiter
+            else:
+                limiter._restrict(requests_per_minute, tokens_per_minute)
+            return limiter
+
+    @staticmethod
+    def from_config(
+        endpoint: str, config: dict[str, Any] | None
+    ) -> tuple["RateLimiter", RetryPolicy]:
+        """Shared limiter of the endpoint and the retry policy of a `rate_limit`
+        model configuration"""
+        config = config or {}
+        limiter = RateLimiter.shared(
+            endpoint,
+            config.get("requests_per_minute", None),
+            config.get("tokens_per_minute", None),
+        )
+        defaults = RetryPolicy()
+        policy = RetryPolicy(
+            int(config.get("max_retries", defaults.max_retries)),
+            float(config.get("backoff", defaults.backoff)),
+            float(config.get("max_backoff", defaults.max_backoff)),
+        )
+        return limiter, policy
+
+    def _restrict(
+        self, requests_per_minute: float | None, tokens_per_minute: float | None
+    ) -> None:
+        with self._lock:
+            if requests_per_minute is not None:
+                self.requests_per_minute = min(
+                    requests_per_minute, self.requests_per_minute or requests_per_minute
+                )
+                self._requests = min(self._requests, self.requests_per_minute)
+            if tokens_per_minute is not None:
+                self.tokens_per_minute = min(
+                    tokens_per_minute, self.tokens_per_minute or tokens_per_minute
+                )
+                self._tokens = min(self._tokens, self.tokens_per_minute)
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self._updated
+        self._updated = now
+        if self.requests_per_minute:
+            self._requests = min(
+                self.requests_per_minute,
+                self._requests + elapsed * self.requests_per_minute / 60.0,
+            )
+        if self.tokens_per_minute:
+            self._tokens = min(
+                self.tokens_per_minute,
+                self._tokens + elapsed * self.tokens_per_minute / 60.0,
+            )
+
+    def reserve(self, tokens: int) -> float:
+        """Reserves capacity for a request and returns the seconds the caller has
+        to wait before sending it"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            wait = max(0.0, self._blocked_until - now)
+            if self.requests_per_minute:
+                self._requests -= 1
+                wait = max(wait, -self._requests * 60.0 / self.requests_per_minute)
+            if self.tokens_per_minute:
+                self._tokens -= min(tokens, self.tokens_per_minute)
+                wait = max(wait, -self._tokens * 60.0 / self.tokens_per_minute)
+            return wait
+
+    def commit(self, reserved: int, used: int) -> None:
+        """Corrects a reservation by the tokens actually used by the request"""
+        if self.tokens_per_minute:
+            with self._lock:
+                self._tokens += min(reserved, self.tokens_per_minute) - used
+
+    def pause(self, seconds: float) -> None:
+        """Holds back all requests to the endpoint for the given time"""
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+    def update(self, headers: dict[str, str]) -> None:
+        """Pauses the endpoint when the `x-ratelimit-*` headers report an exhausted
+        quota"""
+        for kind in ("requests", "tokens"):
+            remaining = headers.get(f"x-ratelimit-remaining-{kind}", None)
+            reset = headers.get(f"x-ratelimit-reset-{kind}", None)
+            if remaining is None or reset is None:
+                continue
+            try:
+                exhausted = float(remaining) <= 0
+            except ValueError:
+                continue
+            seconds = parse_duration(reset)
+            if exhausted and seconds:
+                logger.debug(f"Quota of {kind} exhausted, pausing for {seconds}s")
+                self.pause(seconds)
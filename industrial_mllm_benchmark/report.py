@@ -0,0 +1,323 @@
+# SPDX-FileCopyrightText: Copyright 2024 Siemens AG
+# SPDX-License-Identifier: MIT
+
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from functools import cache
+from pathlib import Path
+from typing import Any
+from .media import media_registry
+from .metrics import percentile
+from .parse_context import ParseContext
+import math
+import os
+import re
+
+THUMBNAIL_SIZE = (320, 240)
+
+
+@dataclass(frozen=True)
+class Aggregate:
+    """Leaderboard figures of a model over a set of evaluations. The mean score
+    leaves out evaluations whose grading failed with an error, pass@k and the
+    agreement are averaged over the evaluations with several samples."""
+
+    evaluations: int
+    passed: int
+    failed: int
+    errors: int
+    pass_rate: float | None
+    mean_score: float | None
+    latency_p50: float | None
+    latency_p90: float | None
+    total_tokens: int
+    mean_tokens: float | None
+    pass_at_k: float | None = None
+    agreement: float | None = None
+
+    @staticmethod
+    def of(results: list[dict[str, Any]]) -> "Aggregate":
+        statuses = [result["grader_result"]["status"] for result in results]
+        scores = [
+            result["grader_result"]["combined_result"]
+            for result in results
+            if result["grader_result"]["status"] != "error"
+        ]
+        requested = [result for result in results if not result.get("cached", False)]
+        latencies = [result["duration"] for result in requested]
+        tokens = [result.get("total_tokens", 0) for result in requested]
+        sampled = [result["sampling"] for result in results if result.get("sampling")]
+        return Aggregate(
+            len(results),
+            statuses.count("pass"),
+            statuses.count("fail"),
+            statuses.count("error"),
+            statuses.count("pass") / len(results) if results else None,
+            sum(scores) / len(scores) if scores else None,
+            percentile(latencies, 50),
+            percentile(latencies, 90),
+            sum(tokens),
+            sum(tokens) / len(tokens) if tokens else None,
+            sum(value["pass_at_k"] for value in sampled) / len(sampled)
+            if sampled
+            else None,
+            sum(value["agreement"] for value in sampled) / len(sampled)
+            if sampled
+            else None,
+        )
+
+
+def aggregate(result: dict[str, Any]) -> dict[str, Any]:
+    """Aggregates of every model over the whole result (`models`) and per taskset
+    (`tasksets`), in the order of the models in the configuration"""
+    order = list(result["config"]["models"])
+    overall: dict[str, list[dict[str, Any]]] = {}
+    tasksets: dict[str, dict[str, Aggregate]] = {}
+    for taskset_name, tasks in result["evaluation"].items():
+        per_model: dict[str, list[dict[str, Any]]] = {}
+        for task in tasks.values():
+            for model_name, model in task["models"].items():
+                per_model.setdefault(model_name, []).append(model)
+                overall.setdefault(model_name, []).append(model)
+        tasksets[taskset_name] = {
+            name: Aggregate.of(per_model[name]) for name in order if name in per_model
+        }
+    return {
+        "models": {
+            name: Aggregate.of(overall[name]) for name in order if name in overall
+        },
+        "tasksets": tasksets,
+    }
+
+
+def _slug(value: str) -> str:
+    return re.sub(r"[^\w.-]+", "_", value).strip("_") or "taskset"
+
+
+def page_name(index: int, taskset_name: str, page: int) -> str:
+    suffix = f"-{page}" if page > 1 else ""
+    return f"{index:03d}-{_slug(taskset_name)}{suffix}"
+
+
+def thumbnail(source: str, dest: Path, size: tuple[int, int] = THUMBNAIL_SIZE) -> Path:
+    """Stores a downscaled JPEG of the image, unless it exists already"""
+    if dest.exists():
+        return dest
+    from PIL import Image
+
+    with Image.open(source) as image:
+        image.thumbnail(size)
+        temp = dest.with_suffix(f".{os.getpid()}.tmp")
+        image.convert("RGB").save(temp, "JPEG", quality=80)
+    # other reports may create the same thumbnail concurrently
+    os.replace(temp, dest)
+    return dest
+
+
+@cache
+def _environment(searchpath: str) -> Any:
+    from jinja2 import Environment, FileSystemLoader
+
+    return Environment(loader=FileSystemLoader(searchpath=searchpath))
+
+
+def render(searchpath: str, template: str, dest: Path, context: dict[str, Any]) -> Path:
+    """Renders a template of the directory into a file, the environment is created
+    once per process"""
+    content = _environment(searchpath).get_template(template).render(**context)
+    with dest.open("w", encoding="utf8") as f:
+        f.write(content)
+    return dest
+
+
+def _has_pillow() -> bool:
+    try:
+        import PIL  # noqa: F401
+
+        return True
+    except ImportError:
+        return False
+
+
+def _page_images(tasks: list[dict[str, Any]], links: dict[str, str]) -> dict[str, str]:
+    return {
+        value: links[value]
+        for entry in tasks
+        for kind, value in entry["task"]["user_prompt"]
+        if kind == "image"
+    }
+
+
+# state shared by the pages, handed to every worker process once
+_shared: dict[str, Any] = {}
+
+
+def _share(state: dict[str, Any]) -> None:
+    _shared.clear()
+    _shared.update(state)
+
+
+def _render_taskset_page(
+    searchpath: str, template: str, dest: Path, taskset_name: str, page: int
+) -> Path:
+    result = _shared["result"]
+    page_size = _shared["page_size"]
+    evaluation = result["evaluation"].get(taskset_name, {})
+    tasks = [
+        {"task": task, "evaluation": evaluation.get(task["name"], None)}
+        for task in result["config"]["tasksets"][taskset_name]["tasks"][
+            (page - 1) * page_size : page * page_size
+        ]
+    ]
+    return render(
+        searchpath,
+        template,
+        dest,
+        {
+            "taskset": taskset_name,
+            "tasks": tasks,
+            "offset": (page - 1) * page_size,
+            "page": page,
+            "pages": _shared["pages"][taskset_name],
+            "index": _shared["index"],
+            "aggregates": _shared["aggregates"][taskset_name],
+            "thumbnails": _page_images(tasks, _shared["thumbnails"]),
+            "originals": _page_images(tasks, _shared["originals"]),
+        },
+    )
+
+
+def render_pages(
+    rc: ParseContext,
+    result: dict[str, Any],
+    templates: Path,
+    extension: str,
+    dest_dir: Path,
+    page_size: int = 50,
+    workers: int = 1,
+) -> Path:
+    """Renders the result as index page with the leaderboard and paginated pages
+    per taskset from the templates `index.<ext>.j2` and `taskset.<ext>.j2` of the
+    directory. Prompt images are shown as thumbnails, shared by all pages."""
+    if page_size < 1:
+        raise ValueError("The page size must be at least 1")
+
+    with rc.context("aggregate") as rc:
+        aggregates = aggregate(result)
+        rc.report(f"Aggregated {len(aggregates['models'])} models")
+    by_taskset = {
+        taskset_name: {name: asdict(value) for name, value in models.items()}
+        for taskset_name, models in aggregates["tasksets"].items()
+    }
+
+    dest_dir.mkdir(parents=True, exist_ok=True)
+    thumbnail_dir = dest_dir / "thumbnails"
+    pillow = _has_pillow()
+
+    images: set[str] = set()
+    for taskset in result["config"]["tasksets"].values():
+        for task in taskset["tasks"]:
+            images.update(
+                value for kind, value in task["user_prompt"] if kind == "image"
+            )
+    if not pillow and images:
+        rc.report("Pillow is not installed, linking the original images")
+
+    # one thumbnail per unique image, named by the hash of its content
+    digests: dict[str, str] = {
+        asset["path"]: digest
+        for digest, asset in result.get("media", {}).get("files", {}).items()
+    }
+    thumbnails: dict[str, str] = {}
+    originals: dict[str, str] = {}
+    sources: dict[str, str] = {}
+    for path in sorted(images):
+        originals[path] = Path(
+            os.path.relpath(Path(path).resolve(), dest_dir.resolve())
+        ).as_posix()
+        if not pillow or not os.path.exists(path):
+            thumbnails[path] = originals[path]
+            continue
+        digest = digests.get(path, None) or media_registry.asset(path).digest
+        thumbnails[path] = f"thumbnails/{digest}.jpg"
+        sources.setdefault(digest, path)
+
+    tasksets: list[dict[str, Any]] = []
+    pages: dict[str, list[str]] = {}
+    for index, (taskset_name, taskset) in enumerate(
+        result["config"]["tasksets"].items(), start=1
+    ):
+        count = max(1, math.ceil(len(taskset["tasks"]) / page_size))
+        pages[taskset_name] = [
+            f"{page_name(index, taskset_name, page)}.{extension}"
+            for page in range(1, count + 1)
+        ]
+        tasksets.append(
+            {
+                "name": taskset_name,
+                "tasks": len(taskset["tasks"]),
+                "page": pages[taskset_name][0],
+            }
+        )
+
+    index_file = dest_dir / f"index.{extension}"
+    searchpath = str(templates.resolve())
+    shared = {
+        "result": result,
+        "page_size": page_size,
+        "pages": pages,
+        "index": index_file.name,
+        "aggregates": by_taskset,
+        "thumbnails": thumbnails,
+        "originals": originals,
+    }
+
+    if sources:
+        thumbnail_dir.mkdir(exist_ok=True)
+
+    # rendering templates is bound by the interpreter, pages are rendered in
+    # processes which receive the result once instead of with every page
+    executor: Executor = (
+        ProcessPoolExecutor(workers, initializer=_share, initargs=(shared,))
+        if workers > 1
+        else ThreadPoolExecutor(1, initializer=_share, initargs=(shared,))
+    )
+    with executor:
+        pending: list[Future] = [
+            executor.submit(thumbnail, path, thumbnail_dir / f"{digest}.jpg")
+            for digest, path in sources.items()
+        ]
+        for taskset_name, names in pages.items():
+            for page, name in enumerate(names, start=1):
+                pending.append(
+                    executor.submit(
+                        _render_taskset_page,
+                        searchpath,
+                        f"taskset.{extension}.j2",
+                        dest_dir / name,
+                        taskset_name,
+                        page,
+                    )
+                )
+
+        render(
+            searchpath,
+            index_file.name + ".j2",
+            index_file,
+            {
+                "config": result["config"],
+                "tasksets": tasksets,
+                "models": {
+                    name: asdict(value) for name, value in aggregates["models"].items()
+                },
+                "by_taskset": by_taskset,
+                "metrics": result.get("metrics", None),
+            },
+        )
+        for future in pending:
+            future.result()
+
+    rc.report(
+        f"Rendered {len(pending) - len(sources) + 1} pages, {len(sources)} thumbnails"
+    )
+    return index_file
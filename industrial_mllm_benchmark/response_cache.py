@@ -0,0 +1,168 @@
+# SPDX-FileCopyrightText: Copyright 2024 Siemens AG
+# SPDX-License-Identifier: MIT
+
+from dataclasses import asdict, replace
+from pathlib import Path
+from typing import Any
+from .models import Model, Answer
+from .media import media_registry
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _canonical_prompts(
+    prompts: list[dict[str, str]] | list[tuple[str, str]],
+) -> list[Any]:
+    result: list[Any] = []
+    for prompt in prompts:
+        if isinstance(prompt, dict):
+            key = next(iter(prompt))
+            value = prompt[key]
+        else:
+            key, value = prompt[0], prompt[1]
+
+        if key == "image":
+            value = {"sha256": media_registry.asset(value).digest}
+        result.append([key, value])
+    return result
+
+
+def prompt_key(
+    model: Model,
+    system_prompt: dict[str, Any],
+    user_prompts: list[tuple[str, str]],
+    sample: int = 0,
+) -> str:
+    """Identifies the answer of a prompt by the identity of the model, the system
+    prompt, the user prompts and the number of the sample"""
+    content: dict[str, Any] = {
+        "model": model.cache_identity(),
+        "system_prompt": system_prompt,
+        "user_prompts": _canonical_prompts(user_prompts),
+    }
+    # the first sample shares the entry of a single answer
+    if sample > 0:
+        content["sample"] = sample
+    encoded = json.dumps(content, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Content addressed on-disk cache of model answers.
+
+    The key of an entry is a hash over the identity of the model (endpoint, model,
+    parameters), the system prompt and the user prompts, where images are
+    represented by the hash of their content instead of their path."""
+
+    def __init__(
+        self,
+        directory: Path,
+        max_size: int | None = None,
+        max_age: float | None = None,
+    ) -> None:
+        self.directory = directory
+        self.max_size = max_size
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        directory.mkdir(parents=True, exist_ok=True)
+
+    def key(
+        self,
+        model: Model,
+        system_prompt: dict[str, Any],
+        user_prompts: list[tuple[str, str]],
+        sample: int = 0,
+    ) -> str:
+        return prompt_key(model, system_prompt, user_prompts, sample)
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.json"
+
+    def __contains__(self, key: str) -> bool:
+        """Whether the cache holds an entry, without counting a hit or miss"""
+        try:
+            created = self._path(key).stat().st_mtime
+        except FileNotFoundError:
+            return False
+        return self.max_age is None or time.time() - created <= self.max_age
+
+    def get(self, key: str) -> Answer | None:
+        path = self._path(key)
+        answer = None
+        try:
+            with path.open("r", encoding="utf-8") as f:
+                entry = json.load(f)
+            if self.max_age is None or time.time() - entry["created"] <= self.max_age:
+                answer = replace(Answer(**entry["answer"]), cached=True)
+                # the access time is used for least recently used eviction
+                os.utime(path, (time.time(), path.stat().st_mtime))
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable cache entry `{path}`: {e}")
+
+        with self._lock:
+            if answer is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return answer
+
+    def put(self, key: str, answer: Answer) -> None:
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+        entry = {
+            "created": time.time(),
+            "answer": asdict(replace(answer, cached=False)),
+        }
+        # unique per process and thread, processes may share the cache directory
+        with tempfile.NamedTemporaryFile(
+            "w", encoding="utf-8", dir=path.parent, suffix=".tmp", delete=False
+        ) as f:
+            json.dump(entry, f)
+        os.replace(f.name, path)
+
+    def evict(self) -> int:
+        """Removes expired entries and the least recently used entries exceeding
+        the maximum size. Returns the number of removed entries."""
+        entries = []
+        for path in self.directory.glob("*/*.json"):
+            try:
+                stat = path.stat()
+                entries.append((stat.st_atime, stat.st_mtime, stat.st_size, path))
+            except FileNotFoundError:
+                continue
+
+        removed = 0
+        now = time.time()
+        if self.max_age is not None:
+            expired = [e for e in entries if now - e[1] > self.max_age]
+            for entry in expired:
+                entry[3].unlink(missing_ok=True)
+            removed += len(expired)
+            entries = [e for e in entries if now - e[1] <= self.max_age]
+
+        if self.max_size is not None:
+            entries.sort(key=lambda e: e[0])
+            total = sum(e[2] for e in entries)
+            for entry in entries:
+                if total <= self.max_size:
+                    break
+                entry[3].unlink(missing_ok=True)
+                total -= entry[2]
+                removed += 1
+
+        return removed
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
@@ -0,0 +1,136 @@
+# SPDX-FileCopyrightText: Copyright 2024 Siemens AG
+# SPDX-License-Identifier: MIT
+
+from dataclasses import asdict
+from pathlib import Path
+from typing import Any, Iterable
+from .implementations import PythonImplementation
+from .metrics import MetricsCollector, ModelMetrics
+from .models import ModelEvalResult
+from .tasks import EvalUnit
+import json
+import threading
+
+try:
+    from orjson import loads as _loads
+except ImportError:
+    # orjson only speeds up loading large results
+    from json import loads as _loads
+
+FORMATS = ("json", "compact", "jsonl")
+EXTENSIONS = {"json": "json", "compact": "json", "jsonl": "jsonl"}
+
+
+def sanitize_json_output(o) -> Any:
+    """Removes function type and private runtime state from json output"""
+    temp = {key: value for key, value in vars(o).items() if not key.startswith("_")}
+    if type(o) == PythonImplementation:
+        if "func" in temp:
+            del temp["func"]
+    elif "access_token" in temp:
+        temp["access_token"] = "### REDACTED ###"
+
+    return temp
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, default=sanitize_json_output, separators=(",", ":"))
+
+
+def dump_result(output: dict[str, Any], path: Path, format: str = "json") -> None:
+    """Stores a result as indented (`json`) or as `compact` JSON"""
+    with path.open("w", encoding="utf-8") as f:
+        if format == "compact":
+            json.dump(output, f, default=sanitize_json_output, separators=(",", ":"))
+        else:
+            json.dump(output, f, default=sanitize_json_output, indent=2)
+
+
+class ResultStream:
+    """Writes a result as JSON lines while the benchmark is evaluated: first the
+    configuration, then every evaluation as soon as it completed and finally the
+    summary sections (metrics, statistics). The metrics of the `models` are
+    collected from the streamed evaluations, which need not be kept."""
+
+    def __init__(self, path: Path, config: Any, models: Iterable[str] = ()) -> None:
+        self.path = path
+        self._metrics = MetricsCollector(models)
+        self._lock = threading.Lock()
+        self._file = path.open("w", encoding="utf-8")
+        self._write({"type": "config", "config": config})
+
+    def _write(self, entry: dict[str, Any]) -> None:
+        line = _dumps(entry)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def append(self, unit: EvalUnit, result: ModelEvalResult) -> None:
+        taskset, task, model = unit.key
+        self._metrics.add(model, result)
+        self._write(
+            {
+                "type": "evaluation",
+                "taskset": taskset,
+                "task": task,
+                "model": model,
+                "result": asdict(result),
+            }
+        )
+
+    def metrics(self) -> dict[str, ModelMetrics]:
+        """Metrics per model of the evaluations appended so far"""
+        return self._metrics.metrics()
+
+    def finish(self, sections: dict[str, Any]) -> None:
+        for name, value in sections.items():
+            self._write({"type": name, name: value})
+        self.close()
+
+    def close(self) -> None:
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+
+def _load_lines(path: Path) -> dict[str, Any]:
+    config: dict[str, Any] | None = None
+    evaluations: dict[tuple[str, str, str], Any] = {}
+    sections: dict[str, Any] = {}
+    with path.open("rb") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = _loads(line)
+            kind = entry["type"]
+            if kind == "config":
+                config = entry["config"]
+            elif kind == "evaluation":
+                key = (entry["taskset"], entry["task"], entry["model"])
+                evaluations[key] = entry["result"]
+            else:
+                sections[kind] = entry[kind]
+    if config is None:
+        raise ValueError(f"`{path}` contains no configuration")
+
+    # evaluations are stored in completion order, restore the order of the config
+    evaluation: dict[str, Any] = {}
+    for taskset_name, taskset in config["tasksets"].items():
+        tasks = evaluation.setdefault(taskset_name, {})
+        for task in taskset["tasks"]:
+            models = {}
+            for model_name in task["models"]:
+                result = evaluations.get((taskset_name, task["name"], model_name))
+                if result is not None:
+                    models[model_name] = result
+            tasks[task["name"]] = {"name": task["name"], "models": models}
+
+    return {"config": config, "evaluation": evaluation} | sections
+
+
+def load_result(path: Path) -> dict[str, Any]:
+    """Loads a result file in any of the output formats"""
+    if path.suffix == ".jsonl":
+        return _load_lines(path)
+    with path.open("rb") as f:
+        return _loads(f.read())
@@ -0,0 +1,329 @@
+# SPDX-FileCopyrightText: Copyright 2024 Siemens AG
+# SPDX-License-Identifier: MIT
+
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from collections import deque
+from dataclasses import dataclass
+from typing import Any
+from .budget import BudgetTracker, Usage
+from .models import Model, ModelEvalResult
+from .tasks import EvalUnit
+from .parse_context import ParseContext
+from .journal import Journal
+from .results import ResultStream
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# `order` follows the order of the units, `affinity` evaluates the models of a
+# loading host (e.g. Ollama) one after another
+POLICIES = ("order", "affinity")
+
+
+@dataclass
+class SwapStats:
+    """Model changes on a host loading its models on demand. Every evaluation
+    started for another model than the previous one of the host is a `switch`,
+    which may evict and reload the weights. Loading and unloading is explicit
+    with the `affinity` policy only."""
+
+    switches: int = 0
+    loads: int = 0
+    load_duration: float = 0.0
+    unloads: int = 0
+    unload_duration: float = 0.0
+
+
+class Scheduler:
+    """Executes evaluation units, bounded by a global number of workers and the
+    `max_concurrency` of each model. The results keep the order of the units.
+
+    With the `latencies` of the models, e.g. measured by the preflight, free
+    workers are given to the model with the longest expected remaining work, so
+    slow models do not end up as the tail of the run.
+
+    With the `affinity` policy the units of models sharing a loading host are
+    grouped: at most `max_loaded_models` of them are evaluated at the same time,
+    each model is loaded before its first and unloaded after its last unit.
+
+    With a `budget` the remaining units of a model are skipped as soon as the
+    estimated usage of its next unit would exceed its budget or the one of the
+    run. Skipped units have no result.
+
+    With a `writer` every result is streamed to it and not kept in memory, the
+    results returned are None."""
+
+    def __init__(
+        self,
+        max_workers: int = 1,
+        journal: Journal | None = None,
+        grader_workers: int = 1,
+        writer: ResultStream | None = None,
+        latencies: dict[str, float] | None = None,
+        policy: str = "order",
+        budget: BudgetTracker | None = None,
+    ) -> None:
+        if max_workers < 1 or grader_workers < 1:
+            raise ValueError("The number of workers must be at least 1")
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown scheduling policy `{policy}`")
+        self.max_workers = max_workers
+        self.journal = journal
+        self.grader_workers = grader_workers
+        self.writer = writer
+        self.latencies = latencies or {}
+        self.policy = policy
+        self.budget = budget
+        self.swaps: dict[str, SwapStats] = {}
+        self._last: dict[str, str] = {}
+        self._loaded: set[str] = set()
+        self._load_locks: dict[str, threading.Lock] = {}
+        # guards the swap statistics, models are loaded by the workers
+        self._lock = threading.Lock()
+
+    def _switch(self, host: str | None, name: str) -> None:
+        """Counts the start of an evaluation of the model on its host"""
+        if host is None:
+            return
+        with self._lock:
+            stats = self.swaps.setdefault(host, SwapStats())
+            if self._last.get(host, name) != name:
+                stats.switches += 1
+            self._last[host] = name
+
+    def _load(self, ec: ParseContext, model: Model, host: str) -> None:
+        with self._lock:
+            load_lock = self._load_locks.setdefault(model.name, threading.Lock())
+        with load_lock:
+            if model.name in self._loaded:
+                return
+            start = time.time()
+            try:
+                model.load(ec)
+                duration = time.time() - start
+                with self._lock:
+                    stats = self.swaps.setdefault(host, SwapStats())
+                    stats.loads += 1
+                    stats.load_duration += duration
+                ec.report(f"Loaded model `{model.name}` in {duration:.2f}s")
+            except Exception as e:
+                # the first request loads the model as well
+                ec.report(f"Loading model `{model.name}` failed: {e}")
+            self._loaded.add(model.name)
+
+    def _unload(self, ec: ParseContext, model: Model, host: str) -> None:
+        start = time.time()
+        try:
+            model.unload(ec)
+            duration = time.time() - start
+            with self._lock:
+                stats = self.swaps.setdefault(host, SwapStats())
+                stats.unloads += 1
+                stats.unload_duration += duration
+        except Exception as e:
+            ec.report(f"Unloading model `{model.name}` failed: {e}")
+
+    def _evaluate(
+        self,
+        unit: EvalUnit,
+        ec: ParseContext,
+        models: dict[str, Model],
+        grader_context: dict[str, Any],
+        host: str | None = None,
+        estimate: Usage | None = None,
+    ) -> ModelEvalResult | None:
+        if host is not None and self.policy == "affinity":
+            self._load(ec, models[unit.model], host)
+        try:
+            result = unit.evaluate(ec, models, grader_context)
+        finally:
+            if self.budget and estimate is not None:
+                self.budget.release(unit.model, estimate)
+        if self.journal:
+            self.journal.append(unit, result)
+        if self.writer:
+            self.writer.append(unit, result)
+            return None
+        return result
+
+    def _reserve(
+        self, ec: ParseContext, unit: EvalUnit, models: dict[str, Model]
+    ) -> tuple[bool, Usage | None]:
+        """Reserves the estimated usage of the unit, False if it exceeds a budget"""
+        if self.budget is None:
+            return True, None
+        if self.budget.refused(unit):
+            ec.report(f"Stopping model `{unit.model}`, its batch exceeded its budget")
+            return False, None
+        estimate = self.budget.take(unit)
+        if estimate is not None:
+            return True, estimate
+        estimate = unit.estimate_usage(models)
+        exceeded = self.budget.reserve(unit.model, estimate)
+        if exceeded is not None:
+            ec.report(f"Stopping model `{unit.model}`, it would exceed the {exceeded}")
+            return False, None
+        return True, estimate
+
+    def run(
+        self,
+        ec: ParseContext,
+        units: list[EvalUnit],
+        models: dict[str, Model],
+        grader_context: dict[str, Any],
+    ) -> list[ModelEvalResult | None]:
+        grader_context = grader_context | {"grader_workers": self.grader_workers}
+        if self.budget:
+            # the models and LLM judges charge their answers to the budgets
+            grader_context["budget"] = self.budget
+
+        results: list[Any] = [None] * len(units)
+        pending: list[int] = []
+        for index, unit in enumerate(units):
+            completed = self.journal.get(unit) if self.journal else None
+            if completed is None:
+                pending.append(index)
+            elif self.writer:
+                self.writer.append(unit, completed)
+            else:
+                results[index] = completed
+
+        if len(pending) < len(units):
+            ec.report(f"Skipping {len(units) - len(pending)} units found in journal")
+
+        hosts: dict[str, str | None] = {
+            name: model.loading_host() for name, model in models.items()
+        }
+
+        if self.max_workers == 1 and self.policy == "order":
+            stopped: set[str] = set()
+            for index in pending:
+                name = units[index].model
+                if name not in stopped:
+                    admitted, estimate = self._reserve(ec, units[index], models)
+                    if not admitted:
+                        stopped.add(name)
+                if name in stopped and self.budget:
+                    self.budget.skip(name, 1)
+                    continue
+                self._switch(hosts.get(name, None), name)
+                results[index] = self._evaluate(
+                    units[index], ec, models, grader_context, None, estimate
+                )
+            return results
+
+        # per model queue of unit indices, each in the order of the units
+        queues: dict[str, deque[int]] = {}
+        for index in pending:
+            queues.setdefault(units[index].model, deque()).append(index)
+
+        # models being evaluated per loading host and how many fit at once
+        resident: dict[str, set[str]] = {}
+        capacity: dict[str, int] = {}
+        for name in queues:
+            host = hosts.get(name, None)
+            if host is not None:
+                resident.setdefault(host, set())
+                limit = models[name].max_loaded_models
+                capacity[host] = min(capacity.get(host, limit), limit)
+
+        active: dict[str, int] = {name: 0 for name in queues}
+        running: dict[Future, int] = {}
+        # models without measured latency are assumed to be average
+        fallback = (
+            sum(self.latencies.values()) / len(self.latencies)
+            if self.latencies
+            else 1.0
+        )
+
+        def priority(name: str) -> tuple[float, int]:
+            queue = queues[name]
+            if not self.latencies:
+                return (0.0, queue[0])
+            return (-len(queue) * self.latencies.get(name, fallback), queue[0])
+
+        def admissible() -> str | None:
+            """Model with free capacity owning the earliest pending unit, or the
+            longest expected remaining work if the latencies are known"""
+            candidate = None
+            for name, queue in queues.items():
+                if not queue:
+                    continue
+                model = models.get(name, None)
+                limit = model.max_concurrency if model else None
+                if limit is not None and active[name] >= limit:
+                    continue
+                host = hosts.get(name, None)
+                if (
+                    self.policy == "affinity"
+                    and host is not None
+                    and name not in resident[host]
+                    and len(resident[host]) >= capacity[host]
+                ):
+                    continue
+                if candidate is None or priority(name) < priority(candidate):
+                    candidate = name
+            return candidate
+
+        def release(name: str) -> None:
+            """Frees the host of the model once all its units completed"""
+            host = hosts.get(name, None)
+            if host is not None and not queues[name] and active[name] == 0:
+                # the memory is free for the next model of the host
+                if name in resident[host]:
+                    resident[host].discard(name)
+                    if self.policy == "affinity":
+                        self._unload(ec, models[name], host)
+
+        executor = ThreadPoolExecutor(
+            self.max_workers, thread_name_prefix="benchmark-worker"
+        )
+        try:
+            while running or any(queues.values()):
+                while len(running) < self.max_workers:
+                    name = admissible()
+                    if name is None:
+                        break
+                    admitted, estimate = self._reserve(
+                        ec, units[queues[name][0]], models
+                    )
+                    if not admitted:
+                        if self.budget:
+                            self.budget.skip(name, len(queues[name]))
+                        queues[name].clear()
+                        release(name)
+                        continue
+                    index = queues[name].popleft()
+                    active[name] += 1
+                    host = hosts.get(name, None)
+                    if host is not None:
+                        resident[host].add(name)
+                    self._switch(host, name)
+                    future = executor.submit(
+                        self._evaluate,
+                        units[index],
+                        ec.fork(),
+                        models,
+                        grader_context,
+                        host,
+                        estimate,
+                    )
+                    running[future] = index
+
+                if not running:
+                    continue
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index = running.pop(future)
+                    name = units[index].model
+                    active[name] -= 1
+                    results[index] = future.result()
+                    release(name)
+        finally:
+            if running:
+                logger.debug(f"Waiting for {len(running)} running evaluation units")
+            executor.shutdown(wait=True, cancel_futures=True)
+
+        return results
@@ -0,0 +1,127 @@
+# SPDX-FileCopyrightText: Copyright 2024 Siemens AG
+# SPDX-License-Identifier: MIT
+
+from dataclasses import dataclass
+from fnmatch import fnmatchcase
+from typing import Any
+from .tasks import EvalUnit
+import hashlib
+import re
+
+_EXPRESSION = re.compile(r"^\s*([\w.]+)\s*(!=|>=|<=|=|<|>|~)\s*(.*?)\s*$")
+_NAMES = ("taskset", "task", "model")
+
+
+@dataclass(frozen=True)
+class Shard:
+    """Part `index` (1 based) of `count` parts of the evaluation units"""
+
+    index: int
+    count: int
+
+    @staticmethod
+    def parse(value: str) -> "Shard":
+        try:
+            index, count = (int(part) for part in value.split("/"))
+        except ValueError:
+            raise ValueError(f"Invalid shard `{value}`, expected `i/N`")
+        if count < 1 or not 1 <= index <= count:
+            raise ValueError(f"Invalid shard `{value}`, expected 1 <= i <= N")
+        return Shard(index, count)
+
+    def __str__(self) -> str:
+        return f"{self.index}/{self.count}"
+
+    def contains(self, unit: EvalUnit) -> bool:
+        # stable across runs and machines, unlike `hash()`
+        digest = hashlib.sha256("\0".join(unit.key).encode("utf-8")).digest()
+        return int.from_bytes(digest[:8], "big") % self.count == self.index - 1
+
+
+def _compare(operator: str, actual: Any, expected: str) -> bool:
+    if operator == "=":
+        return fnmatchcase(str(actual), expected)
+    if operator == "~":
+        return re.search(expected, str(actual)) is not None
+    try:
+        actual_number = float(actual)
+        expected_number = float(expected)
+    except (TypeError, ValueError):
+        return False
+    if operator == "<":
+        return actual_number < expected_number
+    if operator == "<=":
+        return actual_number <= expected_number
+    if operator == ">":
+        return actual_number > expected_number
+    return actual_number >= expected_number
+
+
+@dataclass(frozen=True)
+class Filter:
+    """Condition on the names of a unit (`taskset`, `task`, `model`) or on the
+    metadata of its task, e.g. `task_type=extraction`, `complexity.input_amount>=2`.
+    `=` and `!=` compare with shell patterns, `~` searches a regular expression and
+    `<`, `<=`, `>`, `>=` compare numbers. List values match if any element does."""
+
+    key: str
+    operator: str
+    value: str
+
+    @staticmethod
+    def parse(expression: str) -> "Filter":
+        match = _EXPRESSION.match(expression)
+        if match is None:
+            raise ValueError(
+                f"Invalid filter `{expression}`, expected e.g. `task_type=extraction`"
+            )
+        key, operator, value = match.groups()
+        if operator == "~":
+            re.compile(value)
+        return Filter(key.removeprefix("metadata."), operator, value)
+
+    def __str__(self) -> str:
+        return f"{self.key}{self.operator}{self.value}"
+
+    def _lookup(self, unit: EvalUnit) -> tuple[bool, Any]:
+        if self.key in _NAMES:
+            return True, dict(zip(_NAMES, unit.key))[self.key]
+        value: Any = unit.task.metadata
+        for part in self.key.split("."):
+            if not isinstance(value, dict) or part not in value:
+                return False, None
+            value = value[part]
+        return True, value
+
+    def matches(self, unit: EvalUnit) -> bool:
+        found, value = self._lookup(unit)
+        values = value if isinstance(value, list) else [value]
+        if self.operator == "!=":
+            return not found or not any(
+                _compare("=", item, self.value) for item in values
+            )
+        return found and any(
+            _compare(self.operator, item, self.value) for item in values
+        )
+
+
+@dataclass(frozen=True)
+class Selection:
+    """Units of a benchmark selected by filters, all have to match, and a shard"""
+
+    filters: tuple[Filter, ...] = ()
+    shard: Shard | None = None
+
+    def contains(self, unit: EvalUnit) -> bool:
+        if self.shard is not None and not self.shard.contains(unit):
+            return False
+        return all(unit_filter.matches(unit) for unit_filter in self.filters)
+
+    def select(self, units: list[EvalUnit]) -> list[EvalUnit]:
+        return [unit for unit in units if self.contains(unit)]
+
+    def describe(self) -> dict[str, Any]:
+        return {
+            "shard": str(self.shard) if self.shard else None,
+            "filters": [str(unit_filter) for unit_filter in self.filters],
+        }
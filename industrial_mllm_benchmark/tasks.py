@@ -4,12 +4,14 @@
 from .implementations import Implementation
 from dataclasses import dataclass
 from .graders import Grader, GraderHolders
-from .models import Model, ModelEvalResult
+from .models import Model, ModelEvalResult, parse_pass_k, parse_samples
+from .budget import Usage
 from typing import Any, Self
 from pathlib import Path
 import os
 from .system_prompts import parse_system_prompt, merge_system_prompts
 from .parse_context import ParseContext
+from .media import media_registry
 
 
 @dataclass(frozen=True)
@@ -26,6 +28,10 @@ class Task:
     user_prompt: list[tuple[str, str]]
     graders: GraderHolders
     metadata: dict[str, Any]
+    # number of answers sampled per model, None for the default of the model
+    samples: int | None = None
+    # number of samples pass@k is estimated for, None for the default of the model
+    pass_k: int | None = None
 
     @staticmethod
     def parse(
@@ -35,6 +41,8 @@ class Task:
         models: dict[str, Model],
         tasksets_models: list[str],
         graders: dict[str, Grader],
+        tasksets_samples: int | None = None,
+        tasksets_pass_k: int | None = None,
     ) -> list["Task"]:
         result: list["Task"] = []
         for task in tasks:
@@ -72,6 +80,8 @@ class Task:
                         )
 
                     metadata = task.get("metadata", None)
+                    samples = parse_samples(task.get("samples", None))
+                    pass_k = parse_pass_k(task.get("pass_k", None))
                     result.append(
                         Task(
                             name,
@@ -80,6 +90,8 @@ class Task:
                             user_prompt,
                             task_graders,
                             metadata or {},
+                            samples or tasksets_samples,
+                            pass_k or tasksets_pass_k,
                         )
                     )
 
@@ -88,38 +100,72 @@ class Task:
 
         return result
 
-    def evaluate(
-        self: Self,
-        ec: ParseContext,
-        parent_system_prompts: dict[str, dict[str, str]],
-        models: dict[str, Model],
-        grader_context: dict[str, Any],
-    ) -> TaskEvalResult:
-        model_results = {}
-
+    def units(
+        self: Self, taskset_name: str, parent_system_prompts: dict[str, dict[str, str]]
+    ) -> list["EvalUnit"]:
         resolved_system_prompt = merge_system_prompts(
             parent_system_prompts,
             self.system_prompts,
         )
 
-        with ec.context("models") as ec:
-            for model_name in self.models:
-                with ec.context(f"[{model_name}]") as ec:
-                    ec.report("Evaluating model")
-
-                    model = models[model_name]
-                    if model is None:
-                        ec.raise_error("Could not find model")
-
-                    model_results[model.name] = model.evaluate(
-                        ec,
-                        resolved_system_prompt,
-                        self.user_prompt,
-                        self.graders,
-                        grader_context,
-                    )
+        return [
+            EvalUnit(taskset_name, self, model_name, resolved_system_prompt)
+            for model_name in self.models
+        ]
+
+
+@dataclass(frozen=True)
+class EvalUnit:
+    """A single evaluation of a task of a taskset against one model"""
+
+    taskset: str
+    task: Task
+    model: str
+    system_prompts: dict[str, dict[str, str]]
+
+    @property
+    def key(self) -> tuple[str, str, str]:
+        return (self.taskset, self.task.name, self.model)
 
-        return TaskEvalResult(self.name, model_results)
+    def evaluate(
+        self: Self,
+        ec: ParseContext,
+        models: dict[str, Model],
+        grader_context: dict[str, Any],
+    ) -> ModelEvalResult:
+        with (
+            ec.context("tasksets"),
+            ec.context(f"[{self.taskset}]"),
+            ec.context("task"),
+            ec.context(f"[{self.task.name}]"),
+            ec.context("models"),
+            ec.context(f"[{self.model}]"),
+        ):
+            ec.report("Evaluating model")
+
+            model = models.get(self.model, None)
+            if model is None:
+                ec.raise_error("Could not find model")
+
+            return model.evaluate(
+                ec,
+                self.system_prompts,
+                self.task.user_prompt,
+                self.task.graders,
+                grader_context,
+                self.samples(model),
+                self.task.pass_k or model.pass_k,
+            )
+
+    def samples(self, model: Model) -> int:
+        return self.task.samples or model.samples or 1
+
+    def estimate_usage(self, models: dict[str, Model]) -> Usage:
+        """Usage of the evaluation estimated without sending a request"""
+        model = models[self.model]
+        return model.estimate_usage(
+            self.system_prompts, self.task.user_prompt, self.samples(model)
+        )
 
 
 def _extract_user_prompt(prompt: dict[str, str]) -> tuple[str, str]:
@@ -141,6 +187,8 @@ def _parse_user_prompt(
                     impl = Implementation.parse(pc, {"python": value})
                     prompts = impl.invoke()
                     for prompt in prompts:
+                        if prompt[0] == "image":
+                            prompt = ("image", media_registry.register(prompt[1]).path)
                         temp.append(prompt)
                 elif key == "image":
                     if not os.path.isabs(value):
@@ -148,7 +196,8 @@ def _parse_user_prompt(
                     path = Path(value)
                     if not path.exists():
                         pc.raise_error(f"File '{path.resolve()}' does not exist")
-                    temp.append(("image", value))
+                    # files with identical content share the path of one asset
+                    temp.append(("image", media_registry.register(value).path))
                 else:
                     temp.append((key, value))
 
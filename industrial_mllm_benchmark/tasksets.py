@@ -2,9 +2,9 @@
 # SPDX-License-Identifier: MIT
 
 from dataclasses import dataclass
-from .models import Model
+from .models import Model, parse_pass_k, parse_samples
 from .graders import Grader
-from .tasks import Task, TaskEvalResult
+from .tasks import Task, EvalUnit
 from pathlib import Path
 from .system_prompts import parse_system_prompt, merge_system_prompts
 from .parse_context import ParseContext
@@ -16,6 +16,8 @@ class Tasksets:
     name: str
     system_prompts: dict[str, str]
     tasks: list[Task]
+    samples: int | None = None
+    pass_k: int | None = None
 
     @staticmethod
     def parse(
@@ -39,37 +41,34 @@ class Tasksets:
                 if taskset_models is None:
                     taskset_models = list(models.keys())
 
+                samples = parse_samples(taskset.get("samples", None))
+                pass_k = parse_pass_k(taskset.get("pass_k", None))
+
                 tasks = pc.get_value(taskset, "tasks")
                 with pc.context("tasks") as pc:
                     pc.report("Parsing tasks")
                     tasks = Task.parse(
-                        pc, config_parent, tasks, models, taskset_models, graders
+                        pc,
+                        config_parent,
+                        tasks,
+                        models,
+                        taskset_models,
+                        graders,
+                        samples,
+                        pass_k,
                     )
 
-                result[name] = Tasksets(name, system_prompt, tasks)
+                result[name] = Tasksets(name, system_prompt, tasks, samples, pass_k)
 
         return result
 
-    def evaluate(
-        self,
-        ec: ParseContext,
-        parent_system_prompts: dict[str, dict[str, str]],
-        models: dict[str, Model],
-    ) -> dict[str, TaskEvalResult]:
-        ec.report("Evaluating tasksets")
-        task_result = {}
-
-        grader_context = {"models": models}
+    def units(self, parent_system_prompts: dict[str, dict[str, str]]) -> list[EvalUnit]:
+        resolved_system_prompts = merge_system_prompts(
+            parent_system_prompts, self.system_prompts
+        )
 
-        with ec.context("task") as ec:
-            for task in self.tasks:
-                with ec.context(f"[{task.name}]") as ec:
-                    ec.report("Evaluating task")
-                    resolved_system_prompts = merge_system_prompts(
-                        parent_system_prompts, self.system_prompts
-                    )
-                    task_result[task.name] = task.evaluate(
-                        ec, resolved_system_prompts, models, grader_context
-                    )
+        units: list[EvalUnit] = []
+        for task in self.tasks:
+            units.extend(task.units(self.name, resolved_system_prompts))
 
-        return task_result
+        return units
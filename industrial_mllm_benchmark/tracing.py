@@ -0,0 +1,170 @@
+# SPDX-FileCopyrightText: Copyright 2024 Siemens AG
+# SPDX-License-Identifier: MIT
+
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+import asyncio
+import itertools
+import json
+import os
+import threading
+import time
+
+TRACE_FORMATS = ("chrome", "otlp")
+
+
+@dataclass
+class Span:
+    name: str
+    span_id: int
+    parent_id: int | None
+    # nanoseconds since the epoch
+    start: int
+    thread: str
+    attributes: dict[str, Any] = field(default_factory=dict)
+    end: int = 0
+    error: str | None = None
+
+
+def _execution() -> str:
+    """Name of the thread, or of the asyncio task, executing the caller"""
+    name = threading.current_thread().name
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:
+        task = None
+    if task is not None:
+        name = f"{name}/{task.get_name()}"
+    return name
+
+
+def _otlp_value(value: Any) -> dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class Tracer:
+    """Collects the spans of a run, e.g. of the contexts of a `ParseContext`,
+    and exports them as Chrome trace events or OTLP JSON"""
+
+    def __init__(self) -> None:
+        self.trace_id = os.urandom(16).hex()
+        self.spans: list[Span] = []
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def start(self, name: str, parent: Span | None, attributes: dict[str, Any]) -> Span:
+        with self._lock:
+            span_id = next(self._ids)
+        return Span(
+            name,
+            span_id,
+            parent.span_id if parent else None,
+            time.time_ns(),
+            _execution(),
+            attributes,
+        )
+
+    def end(self, span: Span) -> None:
+        span.end = time.time_ns()
+        with self._lock:
+            self.spans.append(span)
+
+    def chrome(self) -> dict[str, Any]:
+        """Trace event format, e.g. for `chrome://tracing` or Perfetto"""
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span.start)
+        pid = os.getpid()
+        threads: dict[str, int] = {}
+        events: list[dict[str, Any]] = []
+        for span in spans:
+            tid = threads.setdefault(span.thread, len(threads) + 1)
+            args = dict(span.attributes)
+            if span.error is not None:
+                args["error"] = span.error
+            events.append(
+                {
+                    "name": span.name,
+                    "cat": "benchmark",
+                    "ph": "X",
+                    "ts": span.start / 1000,
+                    "dur": (span.end - span.start) / 1000,
+                    "pid": pid,
+                    "tid": tid,
+                    "args": args,
+                }
+            )
+        for thread, tid in threads.items():
+            events.append(
+                {
+                    "name": "thread_name",
+                    "ph": "M",
+                    "pid": pid,
+                    "tid": tid,
+                    "args": {"name": thread},
+                }
+            )
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def otlp(self) -> dict[str, Any]:
+        """OTLP JSON encoding of the spans, as accepted by OpenTelemetry collectors"""
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span.start)
+        otlp_spans = []
+        for span in spans:
+            attributes = span.attributes | {"thread.name": span.thread}
+            otlp_span = {
+                "traceId": self.trace_id,
+                "spanId": f"{span.span_id:016x}",
+                "name": span.name,
+                "kind": 1,
+                "startTimeUnixNano": str(span.start),
+                "endTimeUnixNano": str(span.end),
+                "attributes": [
+                    {"key": key, "value": _otlp_value(value)}
+                    for key, value in attributes.items()
+                ],
+                "status": (
+                    {"code": 2, "message": span.error}
+                    if span.error is not None
+                    else {"code": 1}
+                ),
+            }
+            if span.parent_id is not None:
+                otlp_span["parentSpanId"] = f"{span.parent_id:016x}"
+            otlp_spans.append(otlp_span)
+
+        return {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": [
+                            {
+                                "key": "service.name",
+                                "value": {"stringValue": "industrial_mllm_benchmark"},
+                            }
+                        ]
+                    },
+                    "scopeSpans": [
+                        {
+                            "scope": {"name": "industrial_mllm_benchmark"},
+                            "spans": otlp_spans,
+                        }
+                    ],
+                }
+            ]
+        }
+
+    def write(self, path: Path, format: str = "chrome") -> None:
+        if format not in TRACE_FORMATS:
+            raise ValueError(f"Unsupported trace format `{format}`")
+        content = self.chrome() if format == "chrome" else self.otlp()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open("w", encoding="utf-8") as f:
+            json.dump(content, f, default=str)
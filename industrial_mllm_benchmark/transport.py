@@ -0,0 +1,268 @@
+# SPDX-FileCopyrightText: Copyright 2024 Siemens AG
+# SPDX-License-Identifier: MIT
+
+from dataclasses import dataclass, field
+from typing import Any, Self, Iterator
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
+from .payloads import RequestBody
+import asyncio
+import json
+import requests
+import ssl
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POOL_SIZE = 10
+
+
+@dataclass(frozen=True)
+class HttpResponse:
+    status: int
+    headers: dict[str, str]
+    body: bytes
+    # lines of a server-sent event stream, read while iterating
+    lines: Iterator[bytes] | None = None
+    # response the lines are read from, holding its pooled connection
+    stream: requests.Response | None = field(default=None, repr=False)
+
+    def json(self) -> Any:
+        return json.loads(self.body)
+
+    def close(self) -> None:
+        """Returns the connection of an unread event stream to the pool"""
+        if self.stream is not None:
+            self.stream.close()
+
+
+def _origin(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+class HttpTransport:
+    """Pool of keep-alive connections to the origin of an endpoint"""
+
+    _shared: dict[tuple[str, int], "HttpTransport"] = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, pool_size: int = DEFAULT_POOL_SIZE) -> None:
+        self.pool_size = pool_size
+        adapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=pool_size, pool_block=True
+        )
+        self._session = requests.Session()
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+
+    @classmethod
+    def shared(cls, endpoint: str, pool_size: int = DEFAULT_POOL_SIZE) -> Self:
+        """Transport shared by all models using the same origin and pool size"""
+        key = (_origin(endpoint), pool_size)
+        with cls._shared_lock:
+            if key not in cls._shared:
+                cls._shared[key] = cls(pool_size)
+            return cls._shared[key]
+
+    def post(
+        self,
+        url: str,
+        headers: dict[str, Any],
+        payload: dict[str, Any] | RequestBody,
+        stream: bool = False,
+        timeout: float | None = None,
+    ) -> HttpResponse:
+        """Sends the request, with `stream` an event stream response is not read
+        upfront but provided as `lines`. A `RequestBody` is sent fragment by
+        fragment. Raises a `TimeoutError` if the server does not respond within
+        `timeout` seconds."""
+        try:
+            if isinstance(payload, RequestBody):
+                response = self._session.post(
+                    url,
+                    headers={"Content-Type": "application/json"} | headers,
+                    data=payload,
+                    stream=stream,
+                    timeout=timeout,
+                )
+            else:
+                response = self._session.post(
+                    url, headers=headers, json=payload, stream=stream, timeout=timeout
+                )
+        except requests.Timeout as e:
+            raise TimeoutError(
+                f"No response from `{url}` within {timeout} seconds"
+            ) from e
+        response_headers = {
+            key.lower(): value for key, value in response.headers.items()
+        }
+        content_type = response_headers.get("content-type", "")
+        if stream and content_type.startswith("text/event-stream"):
+            return HttpResponse(
+                response.status_code,
+                response_headers,
+                b"",
+                _iter_lines(response),
+                response,
+            )
+
+        return HttpResponse(response.status_code, response_headers, response.content)
+
+
+def _iter_lines(response: requests.Response) -> Iterator[bytes]:
+    try:
+        # without chunk size the lines are provided as soon as they arrive
+        yield from response.iter_lines(chunk_size=None)
+    finally:
+        response.close()
+
+
+class AsyncHttpTransport:
+    """Pool of keep-alive HTTP/1.1 connections to the origin of an endpoint,
+    implemented on asyncio streams. A single event loop can keep many requests
+    in flight without a thread per request."""
+
+    _shared: dict[tuple[str, int], "AsyncHttpTransport"] = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, pool_size: int = DEFAULT_POOL_SIZE) -> None:
+        self.pool_size = pool_size
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._slots: asyncio.Semaphore | None = None
+        self._idle: dict[tuple[str, int, bool], list[tuple[Any, Any]]] = {}
+
+    @classmethod
+    def shared(cls, endpoint: str, pool_size: int = DEFAULT_POOL_SIZE) -> Self:
+        """Transport shared by all models using the same origin and pool size"""
+        key = (_origin(endpoint), pool_size)
+        with cls._shared_lock:
+            if key not in cls._shared:
+                cls._shared[key] = cls(pool_size)
+            return cls._shared[key]
+
+    def _bind(self) -> asyncio.Semaphore:
+        # connections can not be used across event loops
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop or self._slots is None:
+            self._loop = loop
+            self._slots = asyncio.Semaphore(self.pool_size)
+            self._idle = {}
+        return self._slots
+
+    async def _connect(
+        self, host: str, port: int, secure: bool
+    ) -> tuple[Any, Any, bool]:
+        idle = self._idle.setdefault((host, port, secure), [])
+        while idle:
+            reader, writer = idle.pop()
+            if not writer.is_closing() and not reader.at_eof():
+                return reader, writer, True
+            writer.close()
+
+        context = ssl.create_default_context() if secure else None
+        reader, writer = await asyncio.open_connection(host, port, ssl=context)
+        return reader, writer, False
+
+    async def post(
+        self,
+        url: str,
+        headers: dict[str, Any],
+        payload: dict[str, Any] | RequestBody,
+        timeout: float | None = None,
+    ) -> HttpResponse:
+        try:
+            return await asyncio.wait_for(
+                self._post(url, headers, payload), timeout=timeout
+            )
+        except asyncio.TimeoutError as e:
+            raise TimeoutError(
+                f"No response from `{url}` within {timeout} seconds"
+            ) from e
+
+    async def _post(
+        self, url: str, headers: dict[str, Any], payload: dict[str, Any] | RequestBody
+    ) -> HttpResponse:
+        parts = urlsplit(url)
+        secure = parts.scheme == "https"
+        host = parts.hostname or ""
+        port = parts.port or (443 if secure else 80)
+        target = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+
+        if isinstance(payload, RequestBody):
+            body = payload
+        else:
+            body = RequestBody([json.dumps(payload).encode("utf-8")])
+        request_headers = {"Content-Type": "application/json"} | headers
+        request_headers |= {
+            "Host": parts.netloc,
+            "Content-Length": str(len(body)),
+            "Connection": "keep-alive",
+        }
+        head = f"POST {target} HTTP/1.1\r\n" + "".join(
+            f"{key}: {value}\r\n" for key, value in request_headers.items()
+        )
+        request = [head.encode("latin-1") + b"\r\n", *body]
+
+        async with self._bind():
+            while True:
+                reader, writer, reused = await self._connect(host, port, secure)
+                try:
+                    writer.writelines(request)
+                    await writer.drain()
+                    response, keep_alive = await _read_response(reader)
+                except (ConnectionError, asyncio.IncompleteReadError) as e:
+                    writer.close()
+                    if reused:
+                        # the server closed an idle connection, use a new one
+                        logger.debug(f"Reconnecting to {host}:{port} after {e!r}")
+                        continue
+                    raise
+                except asyncio.CancelledError:
+                    # e.g. by the timeout, the state of the connection is unknown
+                    writer.close()
+                    raise
+
+                if keep_alive:
+                    self._idle[(host, port, secure)].append((reader, writer))
+                else:
+                    writer.close()
+                return response
+
+
+async def _read_response(reader: asyncio.StreamReader) -> tuple[HttpResponse, bool]:
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError("Connection closed by server")
+    version, status, *_ = status_line.decode("latin-1").split(" ", 2)
+
+    headers: dict[str, str] = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    keep_alive = (
+        version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+    )
+
+    if headers.get("transfer-encoding", "").lower() == "chunked":
+        body = bytearray()
+        while True:
+            size = int((await reader.readline()).split(b";")[0], 16)
+            if size == 0:
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass
+                break
+            body += await reader.readexactly(size)
+            await reader.readexactly(2)
+    elif "content-length" in headers:
+        body = bytearray(await reader.readexactly(int(headers["content-length"])))
+    else:
+        body = bytearray(await reader.read())
+        keep_alive = False
+
+    return HttpResponse(int(status), headers, bytes(body)), keep_alive
@@ -0,0 +1,82 @@
+# SPDX-FileCopyrightText: Copyright 2024 Siemens AG
+# SPDX-License-Identifier: MIT
+
+from pathlib import Path
+from typing import Any
+import hashlib
+import json
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _normalize(text: str) -> str:
+    return " ".join(text.split())
+
+
+class VerdictCache:
+    """Persistent cache of the verdicts of LLM judges, shared by all tasks,
+    tasksets and runs using the same file. Each verdict is appended as a JSON line."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._verdicts: dict[str, str] = {}
+        self._lock = threading.Lock()
+        if path.exists():
+            self._load()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = path.open("a", encoding="utf-8")
+
+    def _load(self) -> None:
+        with self.path.open("r", encoding="utf-8") as f:
+            for number, line in enumerate(f, start=1):
+                try:
+                    entry = json.loads(line)
+                    self._verdicts[entry["key"]] = entry["verdict"]
+                except Exception as e:
+                    logger.warning(f"Ignoring line {number} of `{self.path}`: {e}")
+
+    @staticmethod
+    def key(
+        actual_answer: str,
+        expected_answer: str,
+        grader_model: str,
+        system_prompt: str,
+        user_prompt: str,
+        model_identity: dict[str, Any] | None = None,
+    ) -> str:
+        content = [
+            _normalize(actual_answer),
+            _normalize(expected_answer),
+            grader_model,
+            model_identity,
+            _normalize(system_prompt),
+            _normalize(user_prompt),
+        ]
+        encoded = json.dumps(content, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            verdict = self._verdicts.get(key, None)
+            if verdict is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return verdict
+
+    def put(self, key: str, verdict: str) -> None:
+        with self._lock:
+            self._verdicts[key] = verdict
+            self._file.write(json.dumps({"key": key, "verdict": verdict}) + "\n")
+            self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {"judge_calls_avoided": self.hits, "judge_calls": self.misses}
@@ -0,0 +1,320 @@
+# SPDX-FileCopyrightText: Copyright 2024 Siemens AG
+# SPDX-License-Identifier: MIT
+
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import asdict
+from pathlib import Path
+from typing import Any, Generator
+from .models import Model, ModelEvalResult
+from .parse_context import ParseContext
+from .tasks import EvalUnit
+import json
+import sqlite3
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS units (
+    taskset TEXT NOT NULL,
+    task TEXT NOT NULL,
+    model TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    state TEXT NOT NULL,
+    worker TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    result TEXT,
+    PRIMARY KEY (taskset, task, model)
+);
+CREATE INDEX IF NOT EXISTS units_state ON units (state, position);
+"""
+
+UnitKey = tuple[str, str, str]
+
+
+class WorkQueue:
+    """Queue of evaluation units in a SQLite database, shared by a coordinator and
+    any number of worker processes, also on several hosts with a shared file system.
+
+    Workers lease units for a limited time and renew the lease while they evaluate
+    them. Units of crashed workers are leased again once their lease expired."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._local = threading.local()
+        self._connection().executescript(_SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        # connections can not be shared between threads
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+            self._local.connection = connection
+        return connection
+
+    @contextmanager
+    def _transaction(self) -> Generator[sqlite3.Connection, None, None]:
+        connection = self._connection()
+        # take the write lock upfront, two workers must not lease the same unit
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    def get_meta(self, key: str) -> str | None:
+        row = (
+            self._connection()
+            .execute("SELECT value FROM meta WHERE key = ?", (key,))
+            .fetchone()
+        )
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: str) -> None:
+        with self._transaction() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value)
+            )
+
+    def add(self, units: list[EvalUnit]) -> int:
+        """Adds the units not yet in the queue and returns their number"""
+        with self._transaction() as connection:
+            before = connection.total_changes
+            connection.executemany(
+                "INSERT OR IGNORE INTO units (taskset, task, model, position, state) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [(*unit.key, position, PENDING) for position, unit in enumerate(units)],
+            )
+            return connection.total_changes - before
+
+    def lease(self, worker: str, duration: float) -> UnitKey | None:
+        """Leases the earliest pending unit, or one whose lease expired"""
+        now = time.time()
+        with self._transaction() as connection:
+            row = connection.execute(
+                "SELECT taskset, task, model FROM units "
+                "WHERE state = ? OR (state = ? AND lease_expires < ?) "
+                "ORDER BY position LIMIT 1",
+                (PENDING, LEASED, now),
+            ).fetchone()
+            if row is None:
+                return None
+            connection.execute(
+                "UPDATE units SET state = ?, worker = ?, lease_expires = ? "
+                "WHERE taskset = ? AND task = ? AND model = ?",
+                (LEASED, worker, now + duration, *row),
+            )
+            return row
+
+    def renew(self, worker: str, duration: float) -> None:
+        """Extends all leases of the worker"""
+        with self._transaction() as connection:
+            connection.execute(
+                "UPDATE units SET lease_expires = ? WHERE state = ? AND worker = ?",
+                (time.time() + duration, LEASED, worker),
+            )
+
+    def complete(self, key: UnitKey, worker: str, result: ModelEvalResult) -> bool:
+        """Stores the result of a unit leased by the worker. Returns False if the
+        worker no longer holds the lease, e.g. because it expired and the unit was
+        leased by another worker."""
+        with self._transaction() as connection:
+            cursor = connection.execute(
+                "UPDATE units SET state = ?, result = ?, lease_expires = NULL "
+                "WHERE taskset = ? AND task = ? AND model = ? AND state = ? "
+                "AND worker = ?",
+                (DONE, json.dumps(asdict(result)), *key, LEASED, worker),
+            )
+            return cursor.rowcount > 0
+
+    def fail(
+        self, key: UnitKey, worker: str, error: str, max_attempts: int
+    ) -> str | None:
+        """Returns the unit leased by the worker to the queue, unless it failed
+        `max_attempts` times. Returns the new state of the unit (`pending` or
+        `failed`), None if the worker no longer holds the lease."""
+        with self._transaction() as connection:
+            cursor = connection.execute(
+                "UPDATE units SET attempts = attempts + 1, error = ?, worker = NULL, "
+                "lease_expires = NULL, "
+                "state = CASE WHEN attempts + 1 >= ? THEN ? ELSE ? END "
+                "WHERE taskset = ? AND task = ? AND model = ? AND state = ? "
+                "AND worker = ?",
+                (error, max_attempts, FAILED, PENDING, *key, LEASED, worker),
+            )
+            if cursor.rowcount == 0:
+                return None
+            row = connection.execute(
+                "SELECT state FROM units WHERE taskset = ? AND task = ? AND model = ?",
+                key,
+            ).fetchone()
+            return row[0]
+
+    def counts(self) -> dict[str, int]:
+        """Number of units per state, leases which expired count as pending"""
+        counts = {PENDING: 0, LEASED: 0, DONE: 0, FAILED: 0}
+        rows = (
+            self._connection()
+            .execute(
+                "SELECT CASE WHEN state = ? AND lease_expires < ? THEN ? ELSE state END, "
+                "COUNT(*) FROM units GROUP BY 1",
+                (LEASED, time.time(), PENDING),
+            )
+            .fetchall()
+        )
+        for state, count in rows:
+            counts[state] = count
+        return counts
+
+    def results(self) -> dict[UnitKey, ModelEvalResult]:
+        rows = (
+            self._connection()
+            .execute(
+                "SELECT taskset, task, model, result FROM units WHERE state = ?",
+                (DONE,),
+            )
+            .fetchall()
+        )
+        return {
+            (taskset, task, model): ModelEvalResult.from_dict(json.loads(result))
+            for taskset, task, model, result in rows
+        }
+
+    def failures(self) -> dict[UnitKey, str]:
+        rows = (
+            self._connection()
+            .execute(
+                "SELECT taskset, task, model, error FROM units WHERE state = ?",
+                (FAILED,),
+            )
+            .fetchall()
+        )
+        return {(taskset, task, model): error for taskset, task, model, error in rows}
+
+    def close(self) -> None:
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+
+class Worker:
+    """Evaluates units leased from a work queue with a number of threads until the
+    queue is drained"""
+
+    def __init__(
+        self,
+        queue: WorkQueue,
+        name: str,
+        threads: int = 1,
+        lease_time: float = 600.0,
+        max_attempts: int = 3,
+        poll_interval: float = 5.0,
+    ) -> None:
+        if threads < 1:
+            raise ValueError("The number of threads must be at least 1")
+        self.queue = queue
+        self.name = name
+        self.threads = threads
+        self.lease_time = lease_time
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.evaluated = 0
+        self.failed = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def _heartbeat(self) -> None:
+        while not self._stop.wait(self.lease_time / 3):
+            try:
+                self.queue.renew(self.name, self.lease_time)
+            except sqlite3.Error as e:
+                logger.warning(f"Renewing the leases of `{self.name}` failed: {e}")
+
+    def _work(
+        self,
+        ec: ParseContext,
+        units: dict[UnitKey, EvalUnit],
+        models: dict[str, Model],
+        grader_context: dict[str, Any],
+    ) -> None:
+        while not self._stop.is_set():
+            key = self.queue.lease(self.name, self.lease_time)
+            if key is None:
+                counts = self.queue.counts()
+                if counts[PENDING] == 0 and counts[LEASED] == 0:
+                    return
+                # units leased by other workers may still be released
+                self._stop.wait(self.poll_interval)
+                continue
+
+            unit = units.get(key, None)
+            try:
+                if unit is None:
+                    raise ValueError("Unit is not part of the benchmark of this worker")
+                result = unit.evaluate(ec.fork(), models, grader_context)
+            except Exception as e:
+                state = self.queue.fail(key, self.name, str(e), self.max_attempts)
+                if state is None:
+                    ec.report(
+                        f"Evaluation of {'/'.join(key)} failed: {e}, its lease "
+                        "was taken over by another worker"
+                    )
+                else:
+                    ec.report(
+                        f"Evaluation of {'/'.join(key)} failed"
+                        f"{', giving up' if state == FAILED else ''}: {e}"
+                    )
+                with self._lock:
+                    self.failed += 1
+                continue
+
+            if not self.queue.complete(key, self.name, result):
+                ec.report(
+                    f"Discarding the result of {'/'.join(key)}, its lease expired "
+                    "and was taken over by another worker"
+                )
+                continue
+            with self._lock:
+                self.evaluated += 1
+
+    def run(
+        self,
+        ec: ParseContext,
+        units: list[EvalUnit],
+        models: dict[str, Model],
+        grader_context: dict[str, Any],
+    ) -> None:
+        by_key = {unit.key: unit for unit in units}
+        heartbeat = threading.Thread(target=self._heartbeat, daemon=True)
+        heartbeat.start()
+        try:
+            with ThreadPoolExecutor(
+                self.threads, thread_name_prefix="benchmark-worker"
+            ) as executor:
+                futures = [
+                    executor.submit(self._work, ec, by_key, models, grader_context)
+                    for _ in range(self.threads)
+                ]
+                try:
+                    for future in futures:
+                        future.result()
+                except BaseException:
+                    self._stop.set()
+                    raise
+        finally:
+            self._stop.set()
+            heartbeat.join()
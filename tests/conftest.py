@@ -0,0 +1,105 @@
+# SPDX-FileCopyrightText: Copyright 2024 Siemens AG
+# SPDX-License-Identifier: MIT
+
+from pathlib import Path
+from typing import Any, Iterator
+from click.testing import CliRunner
+from industrial_mllm_benchmark.__main__ import cli
+from industrial_mllm_benchmark.mock_server import MockBehaviour, MockServer
+import json
+import pytest
+
+
+@pytest.fixture
+def mock_server() -> Iterator[MockServer]:
+    """Mock endpoint answering `1`, which the LLM judge reads as full score"""
+    server = MockServer(behaviour=MockBehaviour(answer="1"))
+    server.start()
+    yield server
+    server.stop()
+
+
+def model_config(endpoint: str, name: str = "mock", **extra: Any) -> dict[str, Any]:
+    return {
+        "implementation": {
+            "language": "python",
+            "module": "industrial_mllm_benchmark",
+            "class": "OllamaModel",
+            "function": "parse_instance",
+        },
+        "endpoint": endpoint,
+        "model": name,
+        "rate_limit": {"backoff": 0.01, "max_backoff": 0.1},
+    } | extra
+
+
+def write_config(
+    directory: Path,
+    endpoint: str,
+    tasks: int = 2,
+    models: dict[str, dict[str, Any]] | None = None,
+    grader: str = "contains",
+    **extra: Any,
+) -> Path:
+    """Benchmark of `tasks` text tasks against the models behind `endpoint`,
+    graded by `contains` or by the `expected_answer` judge"""
+    models = models or {"mock": model_config(endpoint)}
+    judge = next(iter(models))
+    config = {
+        "models": models,
+        "graders": {
+            "contains": {
+                "description": "contains",
+                "implementation": {
+                    "language": "python",
+                    "module": "industrial_mllm_benchmark",
+                    "function": "contains",
+                },
+            },
+            "expected_answer": {
+                "description": "judge",
+                "implementation": {
+                    "language": "python",
+                    "module": "industrial_mllm_benchmark",
+                    "function": "expected_answer",
+                    "args": {
+                        "grader_model": judge,
+                        "system_prompt": "Rate the similarity from 0 to 1.",
+                        "user_prompt": "One: {actual_answer} Two: {expected_answer}",
+                    },
+                },
+            },
+        },
+        "system_prompts": {"default": "Answer briefly."},
+        "tasksets": [
+            {
+                "name": "set",
+                "models": list(models),
+                "tasks": [
+                    {
+                        "name": f"task-{index}",
+                        "user_prompt": [{"text": f"Question {index}"}],
+                        "graders": {
+                            "threshold": 0.5,
+                            "use": [{"name": grader, "weight": 1, "answer": "1"}],
+                        },
+                    }
+                    for index in range(tasks)
+                ],
+            }
+        ],
+    } | extra
+    path = directory / "benchmark.yml"
+    path.write_text(json.dumps(config), encoding="utf-8")
+    return path
+
+
+def invoke(*args: str) -> None:
+    result = CliRunner().invoke(cli, ["-x", "--reporter", "none", *args])
+    assert result.exit_code == 0, result.exception
+
+
+def execute(config: Path, dest_dir: Path, *args: str) -> Path:
+    invoke("execute", "-c", str(config), "-d", str(dest_dir), *args)
+    (path,) = dest_dir.glob("*.json")
+    return path
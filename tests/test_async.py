@@ -0,0 +1,103 @@
+# SPDX-FileCopyrightText: Copyright 2024 Siemens AG
+# SPDX-License-Identifier: MIT
+
+from pathlib import Path
+from industrial_mllm_benchmark import OllamaModel
+from industrial_mllm_benchmark.mock_server import MockBehaviour, MockServer
+from industrial_mllm_benchmark.parse_context import ParseContext
+from industrial_mllm_benchmark.response_cache import ResponseCache
+import asyncio
+import threading
+import time
+
+PROMPT = [("text", "question")]
+
+
+def client_threads() -> int:
+    # the mock server handles every connection in a thread of its own
+    return sum("process_request" not in thread.name for thread in threading.enumerate())
+
+
+def model(endpoint: str, pool_size: int = 100, **rate_limit: float) -> OllamaModel:
+    return OllamaModel(
+        "mock",
+        endpoint,
+        "m",
+        {},
+        pool_size,
+        {"backoff": 0.01, "max_backoff": 0.05} | rate_limit,
+    )
+
+
+def run(model: OllamaModel, count: int) -> list:
+    async def prompts() -> list:
+        with ParseContext.root("[test]") as pc:
+            return await asyncio.gather(
+                *(
+                    model.prompt_async(pc.fork(), {"text": "s"}, PROMPT)
+                    for _ in range(count)
+                )
+            )
+
+    return asyncio.run(prompts())
+
+
+def test_many_prompts_in_flight_on_one_thread() -> None:
+    server = MockServer(behaviour=MockBehaviour(latency=0.3, answer="ok"))
+    server.start()
+    try:
+        threads = client_threads()
+        start = time.time()
+        answers = run(model(server.url), 100)
+        elapsed = time.time() - start
+        added = client_threads() - threads
+    finally:
+        server.stop()
+
+    assert [answer.value for answer in answers] == ["ok"] * 100
+    # sequentially they would take 30 seconds
+    assert elapsed < 3.0
+    assert added == 0
+
+
+def test_max_concurrency_is_respected() -> None:
+    server = MockServer(behaviour=MockBehaviour(latency=0.1))
+    server.start()
+    try:
+        limited = model(server.url)
+        limited.limit_concurrency(2)
+        start = time.time()
+        run(limited, 6)
+        elapsed = time.time() - start
+    finally:
+        server.stop()
+
+    assert elapsed >= 0.3
+
+
+def test_answers_are_cached(tmp_path: Path, mock_server: MockServer) -> None:
+    cached = model(mock_server.url)
+    cached.use_response_cache(ResponseCache(tmp_path))
+
+    (first,) = run(cached, 1)
+    (second,) = run(cached, 1)
+
+    assert not first.cached
+    assert second.cached and second.value == first.value
+    assert mock_server.stats()["requests"] == 1
+
+
+def test_rate_limited_prompts_are_retried() -> None:
+    server = MockServer(
+        behaviour=MockBehaviour(rate_limit_probability=0.5, retry_after=0.01, seed=1)
+    )
+    server.start()
+    try:
+        answers = run(model(server.url), 10)
+        stats = server.stats()
+    finally:
+        server.stop()
+
+    assert stats["rate_limited"] > 0
+    assert sum(answer.retries for answer in answers) == stats["rate_limited"]
+    assert sum(answer.requests for answer in answers) == stats["requests"]
@@ -0,0 +1,168 @@
+# SPDX-FileCopyrightText: Copyright 2024 Siemens AG
+# SPDX-License-Identifier: MIT
+
+from pathlib import Path
+from typing import Any
+from industrial_mllm_benchmark.benchmark import Benchmark
+from industrial_mllm_benchmark.budget import BudgetTracker, Usage, image_tokens
+from industrial_mllm_benchmark.mock_server import MockBehaviour, MockServer
+from industrial_mllm_benchmark.parse_context import ParseContext
+from industrial_mllm_benchmark.response_cache import ResponseCache
+from industrial_mllm_benchmark.results import load_result
+from industrial_mllm_benchmark.scheduler import Scheduler
+from industrial_mllm_benchmark.tasks import EvalUnit
+from conftest import execute, model_config, write_config
+import pytest
+
+
+def evaluate(
+    config: Path, workers: int = 1, cache: ResponseCache | None = None
+) -> tuple[BudgetTracker, dict[str, Any]]:
+    with ParseContext.root("[test]") as pc:
+        benchmark = Benchmark.parse(pc, config)
+        for model in benchmark.models.values():
+            model.use_response_cache(cache)
+        tracker = BudgetTracker(benchmark.models, benchmark.budget)
+        result = benchmark.evaluate(pc, Scheduler(workers, budget=tracker))
+    return tracker, result
+
+
+def test_image_tokens() -> None:
+    # fitted to 768x994, 2x2 tiles
+    assert image_tokens(800, 1035, None) == 765
+    assert image_tokens(800, 1035, "low") == 85
+    assert image_tokens(None, None, "low") == 85
+
+
+def test_estimate_per_unit(tmp_path: Path, mock_server: MockServer) -> None:
+    config = write_config(
+        tmp_path,
+        mock_server.url,
+        models={"mock": model_config(mock_server.url, parameters={"max_tokens": 100})},
+    )
+    with ParseContext.root("[test]") as pc:
+        benchmark = Benchmark.parse(pc, config)
+    tracker = BudgetTracker(benchmark.models)
+    estimate = tracker.estimate_units(benchmark.units())["mock"]
+
+    assert estimate.requests == 2
+    assert estimate.completion_tokens == 200
+    assert estimate.prompt_tokens > 0
+    assert mock_server.stats()["requests"] == 0
+
+
+def test_requests_budget_skips_evaluations(
+    tmp_path: Path, mock_server: MockServer
+) -> None:
+    model = model_config(mock_server.url, budget={"requests": 2})
+    config = write_config(tmp_path, mock_server.url, tasks=3, models={"mock": model})
+
+    tracker, result = evaluate(config)
+
+    assert mock_server.stats()["requests"] == 2
+    assert tracker.spent["mock"].requests == 2
+    assert tracker.skipped == {"mock": 1}
+    assert sum("mock" in task.models for task in result["set"].values()) == 2
+
+
+def test_retries_are_charged(tmp_path: Path) -> None:
+    server = MockServer(
+        behaviour=MockBehaviour(rate_limit_probability=0.5, retry_after=0.01, seed=3)
+    )
+    server.start()
+    try:
+        config = write_config(tmp_path, server.url, tasks=4)
+        tracker, _ = evaluate(config)
+        stats = server.stats()
+    finally:
+        server.stop()
+
+    assert stats["rate_limited"] > 0
+    assert tracker.spent["mock"].requests == stats["requests"]
+
+
+def test_reservation_released_on_failure(
+    tmp_path: Path, mock_server: MockServer, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    model = model_config(mock_server.url, budget={"requests": 1})
+    config = write_config(tmp_path, mock_server.url, tasks=1, models={"mock": model})
+    with ParseContext.root("[test]") as pc:
+        benchmark = Benchmark.parse(pc, config)
+    tracker = BudgetTracker(benchmark.models)
+    estimate = Usage(requests=1)
+
+    def fail(*args: Any) -> None:
+        raise RuntimeError("evaluation failed")
+
+    monkeypatch.setattr(EvalUnit, "evaluate", fail)
+    with pytest.raises(RuntimeError):
+        with ParseContext.root("[test]") as pc:
+            benchmark.evaluate(pc, Scheduler(1, budget=tracker))
+
+    # the failed evaluation no longer holds the only request of the budget
+    assert tracker.reserve("mock", estimate) is None
+
+
+def test_llm_judge_is_charged(tmp_path: Path, mock_server: MockServer) -> None:
+    model = model_config(mock_server.url, budget={"requests": 2})
+    config = write_config(
+        tmp_path,
+        mock_server.url,
+        tasks=2,
+        models={"mock": model},
+        grader="expected_answer",
+    )
+
+    tracker, result = evaluate(config)
+
+    # the answer and the judge of the first task use up the budget
+    assert mock_server.stats()["requests"] == 2
+    assert tracker.spent["mock"].requests == 2
+    assert tracker.skipped == {"mock": 1}
+    (graded,) = [task for task in result["set"].values() if "mock" in task.models]
+    assert graded.models["mock"].grader_result.status == "pass"
+
+
+def test_cached_samples_are_free(tmp_path: Path, mock_server: MockServer) -> None:
+    cache = ResponseCache(tmp_path / "cache")
+    single = write_config(tmp_path, mock_server.url, tasks=1)
+    first, _ = evaluate(single, cache=cache)
+
+    model = model_config(mock_server.url, samples=3)
+    config = write_config(tmp_path, mock_server.url, tasks=1, models={"mock": model})
+    tracker, _ = evaluate(config, cache=cache)
+
+    # the first sample shares the cached answer of the single run
+    assert mock_server.stats()["requests"] == 3
+    assert tracker.spent["mock"].requests == 2
+    assert tracker.spent["mock"].prompt_tokens == 2 * first.spent["mock"].prompt_tokens
+
+
+def test_batches_leave_out_units_exceeding_the_budget(
+    tmp_path: Path, mock_server: MockServer
+) -> None:
+    model = model_config(
+        mock_server.url.removesuffix("/v1/chat/completions"),
+        implementation={
+            "language": "python",
+            "module": "industrial_mllm_benchmark",
+            "class": "OpenAIModel",
+            "function": "parse_instance",
+        },
+        access_token="token",
+        version="1",
+        budget={"requests": 2},
+    )
+    config = write_config(tmp_path, mock_server.url, tasks=3, models={"mock": model})
+    dest = tmp_path / "results"
+
+    result = load_result(execute(config, dest, "--batch", "--batch-backend", "local"))
+
+    (batch,) = result["batch"]["batches"]
+    assert batch["requests"] == 2
+    assert mock_server.stats()["requests"] == 2
+    assert result["budget"]["models"]["mock"]["skipped"] == 1
+    assert result["budget"]["models"]["mock"]["spent"]["requests"] == 2
+    assert (
+        sum(bool(task["models"]) for task in result["evaluation"]["set"].values()) == 2
+    )
@@ -0,0 +1,68 @@
+# SPDX-FileCopyrightText: Copyright 2024 Siemens AG
+# SPDX-License-Identifier: MIT
+
+from pathlib import Path
+from industrial_mllm_benchmark.benchmark import Benchmark
+from industrial_mllm_benchmark.mock_server import MockServer
+from industrial_mllm_benchmark.parse_context import ParseContext
+from industrial_mllm_benchmark.results import load_result
+from industrial_mllm_benchmark.scheduler import Scheduler
+from conftest import execute, model_config, write_config
+import pytest
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_llm_judge_grades_answers(
+    tmp_path: Path, mock_server: MockServer, workers: int
+) -> None:
+    config = write_config(tmp_path, mock_server.url, grader="expected_answer")
+    with ParseContext.root("[test]") as pc:
+        benchmark = Benchmark.parse(pc, config)
+        result = benchmark.evaluate(pc, Scheduler(workers))
+
+    for task in result["set"].values():
+        grading = task.models["mock"].grader_result
+        assert grading.status == "pass"
+        assert grading.combined_result == 1.0
+    # one request for the answer and one for the judge per task
+    assert mock_server.stats()["requests"] == 4
+
+
+def test_batch_run_requests_ollama_one_by_one(
+    tmp_path: Path, mock_server: MockServer
+) -> None:
+    config = write_config(tmp_path, mock_server.url)
+    result = load_result(execute(config, tmp_path / "results", "--batch"))
+
+    for task in result["evaluation"]["set"].values():
+        assert task["models"]["mock"]["grader_result"]["status"] == "pass"
+    assert mock_server.stats()["requests"] == 2
+
+
+def test_batch_files_of_similar_model_names_are_kept_apart(
+    tmp_path: Path, mock_server: MockServer
+) -> None:
+    def openai(name: str) -> dict:
+        return model_config(
+            mock_server.url.removesuffix("/v1/chat/completions"),
+            name=name,
+            implementation={
+                "language": "python",
+                "module": "industrial_mllm_benchmark",
+                "class": "OpenAIModel",
+                "function": "parse_instance",
+            },
+            access_token="token",
+            version="1",
+        )
+
+    # both names are written as `mock_a` into file names
+    models = {"mock/a": openai("a"), "mock a": openai("b")}
+    config = write_config(tmp_path, mock_server.url, tasks=1, models=models)
+    dest = tmp_path / "results"
+    result = load_result(execute(config, dest, "--batch", "--batch-backend", "local"))
+
+    assert len(list((dest / "benchmark.batches").glob("mock_a-*-1.jsonl"))) == 2
+    assert result["batch"]["batches"][0]["requests"] == 1
+    (task,) = result["evaluation"]["set"].values()
+    assert set(task["models"]) == {"mock/a", "mock a"}
@@ -0,0 +1,136 @@
+# SPDX-FileCopyrightText: Copyright 2024 Siemens AG
+# SPDX-License-Identifier: MIT
+
+from typing import Any
+from industrial_mllm_benchmark import OllamaModel
+from industrial_mllm_benchmark.graders import Grader, GraderHolder, GraderHolders
+from industrial_mllm_benchmark.implementations import PythonImplementation
+from industrial_mllm_benchmark.mock_server import MockBehaviour, MockServer
+from industrial_mllm_benchmark.parse_context import ParseContext
+import threading
+import time
+
+
+class Concurrency:
+    """Counts how many calls are running at the same time"""
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.active = 0
+        self.peak = 0
+
+    def __enter__(self) -> None:
+        with self.lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+
+    def __exit__(self, *args: Any) -> None:
+        with self.lock:
+            self.active -= 1
+
+
+class Delayed:
+    """Grader implementation returning its result after a delay"""
+
+    def __init__(self, delay: float, result: float, running: Concurrency) -> None:
+        self.delay = delay
+        self.result = result
+        self.running = running
+
+    def invoke(self, args: dict[str, Any]) -> float:
+        with self.running:
+            time.sleep(self.delay)
+        return self.result
+
+
+def holders(graders: list[tuple[str, Any, float]]) -> GraderHolders:
+    return GraderHolders(
+        0.5,
+        [
+            GraderHolder(Grader(name, name, implementation), weight, "1")
+            for name, implementation, weight in graders
+        ],
+    )
+
+
+def test_graders_fan_out_in_order() -> None:
+    running = Concurrency()
+    graders = holders(
+        [
+            ("slow", Delayed(0.3, 1.0, running), 1.0),
+            ("fast", Delayed(0.05, 0.0, running), 2.0),
+            ("medium", Delayed(0.1, 0.5, running), 1.0),
+        ]
+    )
+    with ParseContext.root("[test]") as pc:
+        sequential = graders.evaluate(pc, {}, "1")
+        start = time.time()
+        concurrent = graders.evaluate(pc, {}, "1", max_workers=3)
+        elapsed = time.time() - start
+
+    # the results are combined in the order of the graders, not of completion
+    assert [r.name for r in concurrent.results] == ["slow", "fast", "medium"]
+    assert concurrent.results == sequential.results
+    assert concurrent.combined_result == sequential.combined_result == 0.375
+    assert concurrent.status == sequential.status == "fail"
+    assert running.peak == 3
+    assert elapsed < 0.35
+
+
+def test_failing_grader_is_an_error_in_parallel() -> None:
+    class Failing:
+        def invoke(self, args: dict[str, Any]) -> float:
+            raise RuntimeError("grader failed")
+
+    running = Concurrency()
+    graders = holders(
+        [("ok", Delayed(0.0, 1.0, running), 1.0), ("failing", Failing(), 1.0)]
+    )
+    with ParseContext.root("[test]") as pc:
+        result = graders.evaluate(pc, {}, "1", max_workers=2)
+
+    assert (result.status, result.combined_result) == ("error", -1.0)
+    assert [r.result for r in result.results] == [1.0, 0.0]
+
+
+def judges(count: int) -> GraderHolders:
+    implementation = PythonImplementation(
+        "industrial_mllm_benchmark",
+        "",
+        "expected_answer",
+        {
+            "grader_model": "judge",
+            "system_prompt": "Rate the similarity from 0 to 1.",
+            "user_prompt": "One: {actual_answer} Two: {expected_answer}",
+        },
+    )
+    return holders([(f"judge-{index}", implementation, 1.0) for index in range(count)])
+
+
+def judge_concurrency(max_grader_concurrency: int | None) -> int:
+    server = MockServer(behaviour=MockBehaviour(latency=0.1, answer="1"))
+    server.start()
+    try:
+        model = OllamaModel("judge", server.url, "m", {})
+        model.limit_grader_concurrency(max_grader_concurrency)
+        running = Concurrency()
+        execute = model.execute_prompt
+
+        def counted(*args: Any) -> Any:
+            with running:
+                return execute(*args)
+
+        model.execute_prompt = counted
+        with ParseContext.root("[test]") as pc:
+            result = judges(4).evaluate(pc, {"models": {"judge": model}}, "1", 4)
+    finally:
+        server.stop()
+
+    assert result.status == "pass"
+    return running.peak
+
+
+def test_max_grader_concurrency_of_a_judge() -> None:
+    assert judge_concurrency(None) == 4
+    assert judge_concurrency(2) == 2
+    assert judge_concurrency(1) == 1
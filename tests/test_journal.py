@@ -0,0 +1,76 @@
+# SPDX-FileCopyrightText: Copyright 2024 Siemens AG
+# SPDX-License-Identifier: MIT
+
+from pathlib import Path
+from industrial_mllm_benchmark.graders import GraderHolders, GraderResults
+from industrial_mllm_benchmark.journal import Journal
+from industrial_mllm_benchmark.mock_server import MockServer
+from industrial_mllm_benchmark.models import ModelEvalResult
+from industrial_mllm_benchmark.results import load_result
+from industrial_mllm_benchmark.tasks import EvalUnit, Task
+from conftest import execute, write_config
+import json
+import logging
+
+
+def _unit(name: str) -> EvalUnit:
+    task = Task(name, ["m"], {}, [], GraderHolders(0.5, []), {})
+    return EvalUnit("set", task, "m", {})
+
+
+def _result(answer: str) -> ModelEvalResult:
+    return ModelEvalResult("m", answer, 0.1, GraderResults(0.5, 1.0, "pass", []))
+
+
+def test_resume_loads_the_completed_units(tmp_path: Path) -> None:
+    path = tmp_path / "run.journal.jsonl"
+    journal = Journal(path)
+    journal.append(_unit("a"), _result("first"))
+    journal.append(_unit("b"), _result("second"))
+    journal.close()
+
+    resumed = Journal(path, resume=True)
+    resumed.close()
+    assert resumed.get(_unit("a")) == _result("first")
+    assert resumed.get(_unit("b")) == _result("second")
+    assert resumed.get(_unit("c")) is None
+
+
+def test_partial_last_line_is_removed_before_appending(tmp_path: Path, caplog) -> None:
+    path = tmp_path / "run.journal.jsonl"
+    journal = Journal(path)
+    journal.append(_unit("a"), _result("first"))
+    journal.close()
+    # a crash while writing the second unit
+    with path.open("a", encoding="utf-8") as f:
+        f.write('{"taskset": "set", "task": "b", "mo')
+
+    with caplog.at_level(logging.WARNING):
+        resumed = Journal(path, resume=True)
+    resumed.append(_unit("c"), _result("third"))
+    resumed.close()
+
+    assert "Ignoring line 2" in caplog.text
+    lines = path.read_text(encoding="utf-8").splitlines()
+    assert [json.loads(line)["task"] for line in lines] == ["a", "c"]
+    completed = Journal.load(path)
+    assert set(completed) == {("set", "a", "m"), ("set", "c", "m")}
+
+
+def test_execute_resumes_an_interrupted_run(
+    tmp_path: Path, mock_server: MockServer
+) -> None:
+    config = write_config(tmp_path, mock_server.url, tasks=4)
+    dest = tmp_path / "out"
+    execute(config, dest)
+    journal = dest / "benchmark.journal.jsonl"
+    lines = journal.read_text(encoding="utf-8").splitlines(keepends=True)
+    journal.write_text(lines[0] + lines[1][:20], encoding="utf-8")
+    requests = mock_server.stats()["requests"]
+
+    result = load_result(execute(config, dest, "--resume"))
+
+    # only the units missing in the journal are requested again
+    assert mock_server.stats()["requests"] - requests == 3
+    assert all(task["models"] for task in result["evaluation"]["set"].values())
+    assert len(Journal.load(journal)) == 4
@@ -0,0 +1,69 @@
+# SPDX-FileCopyrightText: Copyright 2024 Siemens AG
+# SPDX-License-Identifier: MIT
+
+from pathlib import Path
+from typing import Any
+from industrial_mllm_benchmark.merge import merge_results
+from industrial_mllm_benchmark.mock_server import MockServer
+from industrial_mllm_benchmark.results import load_result
+from conftest import execute, invoke, model_config, write_config
+import pytest
+
+
+def _answers(result: dict[str, Any]) -> dict[tuple[str, str, str], str]:
+    return {
+        (taskset_name, task_name, model_name): model["answer"]
+        for taskset_name, tasks in result["evaluation"].items()
+        for task_name, task in tasks.items()
+        for model_name, model in task["models"].items()
+    }
+
+
+def test_merged_shards_equal_a_single_run(
+    tmp_path: Path, mock_server: MockServer
+) -> None:
+    models = {
+        name: model_config(
+            mock_server.url,
+            name,
+            pricing={"prompt_tokens": 1.0, "completion_tokens": 2.0},
+        )
+        for name in ("a", "b")
+    }
+    config = write_config(tmp_path, mock_server.url, tasks=6, models=models)
+    shards = [
+        execute(
+            config, tmp_path / f"shard-{index}", "--shard", f"{index}/2", "--preflight"
+        )
+        for index in (1, 2)
+    ]
+    single = load_result(execute(config, tmp_path / "single", "--preflight"))
+
+    invoke("merge", "-o", str(tmp_path / "merged.json"), *map(str, shards))
+    merged = load_result(tmp_path / "merged.json")
+
+    assert _answers(merged) == _answers(single)
+    assert list(merged["evaluation"]["set"]) == list(single["evaluation"]["set"])
+    for name in ("a", "b"):
+        assert (
+            merged["metrics"][name]["evaluations"]
+            == single["metrics"][name]["evaluations"]
+        )
+        assert merged["budget"]["models"][name]["spent"] == pytest.approx(
+            single["budget"]["models"][name]["spent"]
+        )
+        assert merged["preflight"][name]["ok"]
+        assert len(merged["preflight"][name]["latencies"]) == 4
+    assert merged["budget"]["run"]["estimate"] == pytest.approx(
+        single["budget"]["run"]["estimate"]
+    )
+    assert merged["budget"]["run"]["budget"] is None
+    for section in ("payloads", "image_cache", "media", "swaps"):
+        assert section in merged
+
+
+def test_missing_shard_is_rejected(tmp_path: Path, mock_server: MockServer) -> None:
+    config = write_config(tmp_path, mock_server.url)
+    shard = load_result(execute(config, tmp_path / "shard", "--shard", "1/2"))
+    with pytest.raises(ValueError, match="Missing shards 2/2"):
+        merge_results([shard])
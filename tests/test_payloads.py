@@ -0,0 +1,56 @@
+# SPDX-FileCopyrightText: Copyright 2024 Siemens AG
+# SPDX-License-Identifier: MIT
+
+from pathlib import Path
+from industrial_mllm_benchmark import OllamaModel
+from industrial_mllm_benchmark.image_cache import image_cache
+from industrial_mllm_benchmark.payloads import PayloadCompiler
+import base64
+
+IMAGE = Path(__file__).parents[1] / "examples" / "images" / "datasheet.jpg"
+
+
+def _model() -> OllamaModel:
+    return OllamaModel("mock", "http://127.0.0.1:1/v1/chat/completions", "m", {})
+
+
+def test_compiled_payload_matches_the_message_structure() -> None:
+    model = _model()
+    payload = model._compile_payload(
+        {"text": "system"}, [("text", "question"), ("image", str(IMAGE))]
+    )
+    body = payload.body()
+    assert len(body) == len(body.tobytes())
+    value = body.json()
+    assert value["model"] == "m"
+    system, user = value["messages"]
+    assert system == {"role": "system", "content": [{"type": "text", "text": "system"}]}
+    text, image = user["content"]
+    assert text == {"type": "text", "text": "question"}
+    prefix, encoded = image["image_url"]["url"].split(",", 1)
+    assert prefix == "data:image/jpeg;base64"
+    assert base64.b64decode(encoded) == IMAGE.read_bytes()
+    image_cache.clear()
+
+
+def test_dict_prompts_of_graders_are_compiled_like_tuples() -> None:
+    model = _model()
+    from_dicts = model._compile_payload({"text": "s"}, [{"text": "judge this"}])
+    from_tuples = model._compile_payload({"text": "s"}, [("text", "judge this")])
+    assert from_dicts.body().tobytes() == from_tuples.body().tobytes()
+
+
+def test_messages_are_compiled_once() -> None:
+    compiler = PayloadCompiler()
+    first = compiler.messages([("text", "s")], [("text", "q")])
+    second = compiler.messages([("text", "s")], [("text", "q")])
+    assert first is second
+    assert compiler.stats() == {"hits": 1, "misses": 1}
+
+
+def test_entries_are_bounded() -> None:
+    compiler = PayloadCompiler(max_entries=2)
+    for index in range(3):
+        compiler.messages([("text", "s")], [("text", str(index))])
+    compiler.messages([("text", "s")], [("text", "0")])
+    assert compiler.stats() == {"hits": 0, "misses": 4}
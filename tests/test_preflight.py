@@ -0,0 +1,36 @@
+# SPDX-FileCopyrightText: Copyright 2024 Siemens AG
+# SPDX-License-Identifier: MIT
+
+from industrial_mllm_benchmark import OllamaModel
+from industrial_mllm_benchmark.preflight import ProbeResult, apply_baselines
+from industrial_mllm_benchmark.results import sanitize_json_output
+import json
+
+
+def model(timeout: float | None = None) -> OllamaModel:
+    model = OllamaModel("mock", "http://127.0.0.1:1/v1/chat/completions", "m", {})
+    model.timeout = timeout
+    return model
+
+
+def dumped(model: OllamaModel) -> str:
+    return json.dumps(model, default=sanitize_json_output, sort_keys=True)
+
+
+def test_derived_timeouts_are_not_part_of_the_config() -> None:
+    # the same model probed by two shards with different round trips
+    first, second = model(), model()
+    config = dumped(first)
+
+    apply_baselines({"mock": first}, {"mock": ProbeResult("mock", True, 3.0)})
+    apply_baselines({"mock": second}, {"mock": ProbeResult("mock", True, 4.0)})
+
+    assert (first.request_timeout(), second.request_timeout()) == (180.0, 240.0)
+    assert first.timeout is None
+    assert dumped(first) == dumped(second) == config
+
+
+def test_configured_timeouts_are_kept() -> None:
+    configured = model(30.0)
+    apply_baselines({"mock": configured}, {"mock": ProbeResult("mock", True, 3.0)})
+    assert configured.request_timeout() == 30.0
@@ -0,0 +1,149 @@
+# SPDX-FileCopyrightText: Copyright 2024 Siemens AG
+# SPDX-License-Identifier: MIT
+
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+from industrial_mllm_benchmark import OllamaModel
+from industrial_mllm_benchmark.mock_server import MockBehaviour, MockServer
+from industrial_mllm_benchmark.parse_context import ParseContext
+from industrial_mllm_benchmark.rate_limit import (
+    RateLimiter,
+    RetryPolicy,
+    parse_duration,
+    parse_retry_after,
+)
+from industrial_mllm_benchmark import rate_limit
+import pytest
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch: pytest.MonkeyPatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr(rate_limit.time, "monotonic", clock)
+    return clock
+
+
+def test_parse_retry_after() -> None:
+    assert parse_retry_after({"retry-after-ms": "250"}) == 0.25
+    assert parse_retry_after({"retry-after": "3"}) == 3.0
+    # milliseconds are more precise than the seconds of the same response
+    assert parse_retry_after({"retry-after-ms": "1500", "retry-after": "2"}) == 1.5
+    later = datetime.now(timezone.utc) + timedelta(seconds=30)
+    seconds = parse_retry_after({"retry-after": format_datetime(later, usegmt=True)})
+    assert seconds is not None and 28.0 < seconds <= 30.0
+    past = datetime.now(timezone.utc) - timedelta(seconds=30)
+    assert parse_retry_after({"retry-after": format_datetime(past, usegmt=True)}) == 0
+    assert parse_retry_after({}, "Please retry after 7 seconds.") == 7.0
+    assert parse_retry_after({"retry-after": "soon"}, "Rate limit exceeded") is None
+
+
+def test_parse_duration() -> None:
+    assert parse_duration("20ms") == 0.02
+    assert parse_duration("1m30s") == 90.0
+    assert parse_duration("6") == 6.0
+    assert parse_duration("later") is None
+
+
+def test_backoff_is_bounded_and_jittered() -> None:
+    policy = RetryPolicy(backoff=1.0, max_backoff=5.0)
+
+    delays = [policy.delay(attempt) for attempt in range(10) for _ in range(20)]
+    assert all(0.0 <= delay <= 5.0 for delay in delays)
+    assert len(set(delays)) > 1
+    assert all(0.0 <= policy.delay(1) <= 2.0 for _ in range(20))
+    # the jitter added to the wait requested by the server is at most a second
+    assert all(10.0 <= policy.delay(5, 10.0) <= 11.0 for _ in range(20))
+
+
+def test_requests_per_minute(clock: Clock) -> None:
+    limiter = RateLimiter(requests_per_minute=60)
+    assert limiter.reserve(0) == 0.0
+    # the bucket starts full
+    for _ in range(59):
+        assert limiter.reserve(0) == 0.0
+    assert limiter.reserve(0) == pytest.approx(1.0)
+
+    # one request per second is refilled, the first one is already reserved
+    clock.now += 3.0
+    assert limiter.reserve(0) == 0.0
+    assert limiter.reserve(0) == 0.0
+    assert limiter.reserve(0) == pytest.approx(1.0)
+
+
+def test_tokens_are_corrected_by_the_usage(clock: Clock) -> None:
+    limiter = RateLimiter(tokens_per_minute=600)
+    assert limiter.reserve(600) == 0.0
+    assert limiter.reserve(100) == pytest.approx(10.0)
+
+    # the requests used less than estimated
+    limiter.commit(600, 100)
+    limiter.commit(100, 0)
+    assert limiter.reserve(500) == 0.0
+    # a bucket never holds more than the quota of a minute
+    clock.now += 3600.0
+    assert limiter.reserve(600) == 0.0
+
+
+def test_pause_and_rate_limit_headers(clock: Clock) -> None:
+    limiter = RateLimiter()
+    assert limiter.reserve(0) == 0.0
+
+    limiter.pause(5.0)
+    limiter.pause(2.0)
+    assert limiter.reserve(0) == 5.0
+
+    clock.now += 5.0
+    limiter.update(
+        {"x-ratelimit-remaining-tokens": "0", "x-ratelimit-reset-tokens": "1m30s"}
+    )
+    assert limiter.reserve(0) == 90.0
+    # remaining quota does not pause
+    clock.now += 90.0
+    limiter.update(
+        {"x-ratelimit-remaining-requests": "3", "x-ratelimit-reset-requests": "6s"}
+    )
+    assert limiter.reserve(0) == 0.0
+
+
+def test_shared_limiters_use_the_strictest_quota() -> None:
+    endpoint = "http://127.0.0.1:1/test-shared"
+    first = RateLimiter.shared(endpoint, requests_per_minute=100)
+    second = RateLimiter.shared(endpoint, requests_per_minute=10, tokens_per_minute=50)
+
+    assert first is second
+    assert (first.requests_per_minute, first.tokens_per_minute) == (10, 50)
+
+
+def test_rate_limited_requests_are_retried() -> None:
+    server = MockServer(
+        behaviour=MockBehaviour(
+            rate_limit_probability=0.5, retry_after=0.01, answer="ok", seed=2
+        )
+    )
+    server.start()
+    try:
+        model = OllamaModel(
+            "mock", server.url, "m", {}, 1, {"backoff": 0.01, "max_backoff": 0.05}
+        )
+        with ParseContext.root("[test]") as pc:
+            answers = [
+                model.prompt(pc, {"text": "s"}, [("text", f"q{index}")])
+                for index in range(10)
+            ]
+        stats = server.stats()
+    finally:
+        server.stop()
+
+    assert [answer.value for answer in answers] == ["ok"] * 10
+    assert stats["rate_limited"] > 0
+    assert sum(answer.retries for answer in answers) == stats["rate_limited"]
+    assert sum(answer.requests for answer in answers) == stats["requests"]
+    assert sum(answer.throttled for answer in answers) >= 0.01 * stats["rate_limited"]
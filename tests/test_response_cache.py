@@ -0,0 +1,106 @@
+# SPDX-FileCopyrightText: Copyright 2024 Siemens AG
+# SPDX-License-Identifier: MIT
+
+from pathlib import Path
+from industrial_mllm_benchmark import OllamaModel
+from industrial_mllm_benchmark.models import Answer
+from industrial_mllm_benchmark.response_cache import ResponseCache
+import os
+import threading
+import time
+
+SYSTEM = {"text": "s"}
+ENDPOINT = "http://127.0.0.1:1/v1/chat/completions"
+
+
+def answer(value: str) -> Answer:
+    return Answer(value, 1, 2, 3, 0.5)
+
+
+def test_key_identifies_model_prompts_and_sample(tmp_path: Path) -> None:
+    cache = ResponseCache(tmp_path / "cache")
+    model = OllamaModel("mock", ENDPOINT, "m", {})
+    prompts = [("text", "q")]
+    key = cache.key(model, SYSTEM, prompts)
+
+    # the name of the definition does not matter, the model behind it does
+    assert cache.key(OllamaModel("other", ENDPOINT, "m", {}), SYSTEM, prompts) == key
+    assert cache.key(model, SYSTEM, [{"text": "q"}]) == key
+    assert cache.key(model, SYSTEM, prompts, 0) == key
+    assert cache.key(model, SYSTEM, prompts, 1) != key
+    assert cache.key(model, SYSTEM, [("text", "other")]) != key
+    assert cache.key(model, {"text": "other"}, prompts) != key
+    assert cache.key(OllamaModel("mock", ENDPOINT, "n", {}), SYSTEM, prompts) != key
+    hot = OllamaModel("mock", ENDPOINT, "m", {"temperature": 1.0})
+    assert cache.key(hot, SYSTEM, prompts) != key
+
+
+def test_images_are_identified_by_their_content(tmp_path: Path) -> None:
+    cache = ResponseCache(tmp_path / "cache")
+    model = OllamaModel("mock", ENDPOINT, "m", {})
+    first, copy, other = tmp_path / "a.png", tmp_path / "b.png", tmp_path / "c.png"
+    first.write_bytes(b"image")
+    copy.write_bytes(b"image")
+    other.write_bytes(b"other image")
+
+    key = cache.key(model, SYSTEM, [("image", str(first))])
+    assert cache.key(model, SYSTEM, [("image", str(copy))]) == key
+    assert cache.key(model, SYSTEM, [("image", str(other))]) != key
+
+
+def test_hits_and_misses(tmp_path: Path) -> None:
+    cache = ResponseCache(tmp_path / "cache")
+
+    assert cache.get("ab12") is None
+    assert "ab12" not in cache
+    cache.put("ab12", answer("stored"))
+    assert "ab12" in cache
+    cached = cache.get("ab12")
+
+    assert cached is not None and cached.cached
+    assert (cached.value, cached.total_tokens) == ("stored", 3)
+    assert cache.stats() == {"hits": 1, "misses": 1}
+    # another process opening the directory finds the entry
+    assert ResponseCache(tmp_path / "cache").get("ab12") is not None
+
+
+def test_expired_entries_are_misses(tmp_path: Path) -> None:
+    cache = ResponseCache(tmp_path / "cache", max_age=60)
+    cache.put("ab12", answer("old"))
+    path = next((tmp_path / "cache").glob("*/ab12.json"))
+    os.utime(path, (time.time() - 120, time.time() - 120))
+
+    assert "ab12" not in cache
+    assert cache.evict() == 1
+    assert cache.get("ab12") is None
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path: Path) -> None:
+    cache = ResponseCache(tmp_path / "cache")
+    for index, key in enumerate(["aa01", "bb02", "cc03"]):
+        cache.put(key, answer(key))
+        path = next((tmp_path / "cache").glob(f"*/{key}.json"))
+        os.utime(path, (time.time() - 100 + index, time.time()))
+    size = sum(path.stat().st_size for path in (tmp_path / "cache").glob("*/*.json"))
+    # reading the oldest entry makes it the most recently used one
+    cache.get("aa01")
+
+    cache.max_size = size - 1
+    assert cache.evict() == 1
+    assert "bb02" not in cache
+    assert "aa01" in cache and "cc03" in cache
+
+
+def test_concurrent_writes_leave_no_temporary_files(tmp_path: Path) -> None:
+    cache = ResponseCache(tmp_path / "cache")
+    threads = [
+        threading.Thread(target=cache.put, args=("ab12", answer(str(index))))
+        for index in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert cache.get("ab12") is not None
+    assert not list((tmp_path / "cache").glob("*/*.tmp"))
@@ -0,0 +1,29 @@
+# SPDX-FileCopyrightText: Copyright 2024 Siemens AG
+# SPDX-License-Identifier: MIT
+
+from pathlib import Path
+from industrial_mllm_benchmark.benchmark import Benchmark
+from industrial_mllm_benchmark.mock_server import MockServer
+from industrial_mllm_benchmark.parse_context import ParseContext
+from industrial_mllm_benchmark.results import ResultStream, load_result
+from industrial_mllm_benchmark.scheduler import Scheduler
+from conftest import write_config
+
+
+def test_streamed_results_are_not_kept(tmp_path: Path, mock_server: MockServer) -> None:
+    config = write_config(tmp_path, mock_server.url, tasks=3)
+    path = tmp_path / "benchmark.jsonl"
+    with ParseContext.root("[test]") as pc:
+        benchmark = Benchmark.parse(pc, config)
+        writer = ResultStream(path, benchmark, benchmark.models)
+        result = benchmark.evaluate(pc, Scheduler(2, writer=writer))
+    metrics = writer.metrics()
+    writer.finish({"metrics": metrics})
+
+    assert all(not task.models for task in result["set"].values())
+    stored = load_result(path)
+    results = [task["models"]["mock"] for task in stored["evaluation"]["set"].values()]
+    assert len(results) == 3
+    assert metrics["mock"].evaluations == 3
+    assert metrics["mock"].total_tokens == sum(r["total_tokens"] for r in results)
+    assert stored["metrics"]["mock"]["evaluations"] == 3
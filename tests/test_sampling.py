@@ -0,0 +1,67 @@
+# SPDX-FileCopyrightText: Copyright 2024 Siemens AG
+# SPDX-License-Identifier: MIT
+
+from pathlib import Path
+from industrial_mllm_benchmark.benchmark import Benchmark
+from industrial_mllm_benchmark.graders import GraderResults
+from industrial_mllm_benchmark.mock_server import MockServer
+from industrial_mllm_benchmark.models import Answer, Model, Sample, SampleStatistics
+from industrial_mllm_benchmark.parse_context import ParseContext
+from industrial_mllm_benchmark.scheduler import Scheduler
+from conftest import model_config, write_config
+import pytest
+
+
+def sample(status: str) -> Sample:
+    score = 1.0 if status == "pass" else 0.0
+    return Sample(status, GraderResults(0.5, score, status, []))
+
+
+class ShortModel(Model):
+    """Model answering at most one sample per call"""
+
+    def __init__(self) -> None:
+        super().__init__("short")
+        self.calls = 0
+
+    def execute_prompt(self, ec, system_prompt, user_prompts) -> Answer:
+        self.calls += 1
+        return Answer(f"answer {self.calls}", 1, 1, 2, 0.0)
+
+    def execute_samples(self, ec, system_prompt, user_prompts, count) -> list[Answer]:
+        return [self.execute_prompt(ec, system_prompt, user_prompts)]
+
+
+def test_pass_at_k_of_configured_k() -> None:
+    samples = [sample("pass"), sample("fail"), sample("fail"), sample("fail")]
+
+    assert SampleStatistics.of(samples).pass_at_k == 1.0
+    statistics = SampleStatistics.of(samples, 2)
+    assert statistics.k == 2
+    assert statistics.pass_at_1 == 0.25
+    # 1 - C(3, 2) / C(4, 2)
+    assert statistics.pass_at_k == pytest.approx(0.5)
+    assert SampleStatistics.of(samples, 10).k == 4
+
+
+def test_missing_samples_are_requested_again() -> None:
+    model = ShortModel()
+    with ParseContext.root("[test]") as pc:
+        answers = model.prompt_samples(pc, {"text": "s"}, [("text", "q")], 3)
+
+    assert [answer.value for answer in answers] == [
+        "answer 1",
+        "answer 2",
+        "answer 3",
+    ]
+
+
+def test_pass_k_of_the_model(tmp_path: Path, mock_server: MockServer) -> None:
+    model = model_config(mock_server.url, samples=3, pass_k=2)
+    config = write_config(tmp_path, mock_server.url, tasks=1, models={"mock": model})
+    with ParseContext.root("[test]") as pc:
+        benchmark = Benchmark.parse(pc, config)
+        result = benchmark.evaluate(pc, Scheduler(1))
+
+    sampling = result["set"]["task-0"].models["mock"].sampling
+    assert (sampling.samples, sampling.k, sampling.pass_at_k) == (3, 2, 1.0)
@@ -0,0 +1,151 @@
+# SPDX-FileCopyrightText: Copyright 2024 Siemens AG
+# SPDX-License-Identifier: MIT
+
+from pathlib import Path
+from typing import Any
+from industrial_mllm_benchmark.benchmark import Benchmark
+from industrial_mllm_benchmark.mock_server import MockBehaviour, MockServer
+from industrial_mllm_benchmark.models import Model
+from industrial_mllm_benchmark.parse_context import ParseContext
+from industrial_mllm_benchmark.scheduler import Scheduler
+from conftest import model_config, write_config
+import threading
+
+
+class Recorder:
+    """Records the order and the concurrency of the prompts of models"""
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.started: list[str] = []
+        self.active: dict[str, int] = {}
+        self.peak: dict[str, int] = {}
+        self.total = 0
+        self.peak_total = 0
+
+    def record(self, model: Model) -> None:
+        execute = model.execute_prompt
+
+        def recorded(*args: Any) -> Any:
+            with self.lock:
+                self.started.append(model.name)
+                self.active[model.name] = self.active.get(model.name, 0) + 1
+                self.peak[model.name] = max(
+                    self.peak.get(model.name, 0), self.active[model.name]
+                )
+                self.total += 1
+                self.peak_total = max(self.peak_total, self.total)
+            try:
+                return execute(*args)
+            finally:
+                with self.lock:
+                    self.active[model.name] -= 1
+                    self.total -= 1
+
+        model.execute_prompt = recorded
+
+
+def server(**behaviour: Any) -> MockServer:
+    mock = MockServer(behaviour=MockBehaviour(answer="1", **behaviour))
+    mock.start()
+    return mock
+
+
+def evaluate(config: Path, scheduler: Scheduler) -> tuple[list, Recorder]:
+    recorder = Recorder()
+    with ParseContext.root("[test]") as pc:
+        benchmark = Benchmark.parse(pc, config)
+        for model in benchmark.models.values():
+            recorder.record(model)
+        units = benchmark.units()
+        results = scheduler.run(pc, units, benchmark.models, {})
+    return list(zip(units, results)), recorder
+
+
+def two_models(endpoint: str, **first: Any) -> dict[str, dict[str, Any]]:
+    return {
+        "first": model_config(endpoint, name="first", **first),
+        "second": model_config(endpoint, name="second"),
+    }
+
+
+def test_workers_evaluate_concurrently(tmp_path: Path) -> None:
+    mock = server(latency=0.2)
+    try:
+        config = write_config(tmp_path, mock.url, tasks=6)
+        _, sequential = evaluate(config, Scheduler(1))
+        _, concurrent = evaluate(config, Scheduler(3))
+    finally:
+        mock.stop()
+
+    assert sequential.peak_total == 1
+    assert concurrent.peak_total == 3
+
+
+def test_max_concurrency_of_a_model(tmp_path: Path) -> None:
+    mock = server(latency=0.1)
+    try:
+        models = two_models(mock.url, max_concurrency=1)
+        config = write_config(tmp_path, mock.url, tasks=4, models=models)
+        _, recorder = evaluate(config, Scheduler(4))
+    finally:
+        mock.stop()
+
+    # the workers not usable by the first model are given to the second
+    assert recorder.peak == {"first": 1, "second": 3}
+
+
+def test_slow_models_are_started_first(tmp_path: Path) -> None:
+    mock = server(latency=0.05)
+    try:
+        models = two_models(mock.url)
+        config = write_config(tmp_path, mock.url, tasks=3, models=models)
+        _, unordered = evaluate(config, Scheduler(2))
+        latencies = {"first": 0.1, "second": 2.0}
+        _, prioritized = evaluate(config, Scheduler(2, latencies=latencies))
+    finally:
+        mock.stop()
+
+    # without latencies the earliest units are started first
+    assert sorted(unordered.started[:2]) == ["first", "second"]
+    assert prioritized.started[:2] == ["second", "second"]
+
+
+def test_results_keep_the_order_of_the_units(tmp_path: Path) -> None:
+    # the completion order is shuffled by the latencies
+    mock = server(latency=0.05, distribution="uniform", spread=0.05, seed=1)
+    try:
+        models = two_models(mock.url)
+        config = write_config(tmp_path, mock.url, tasks=5, models=models)
+        sequential, _ = evaluate(config, Scheduler(1))
+        concurrent, _ = evaluate(config, Scheduler(4))
+    finally:
+        mock.stop()
+
+    def summary(evaluated: list) -> list:
+        return [
+            (unit.key, result.name, result.answer, result.grader_result.status)
+            for unit, result in evaluated
+        ]
+
+    assert summary(concurrent) == summary(sequential)
+    assert all(result.name == unit.model for unit, result in concurrent)
+
+
+def test_affinity_counts_the_loads_of_concurrent_workers(tmp_path: Path) -> None:
+    mock = server(latency=0.05, swap_time=0.05, max_loaded_models=2)
+    try:
+        models = {
+            name: model_config(mock.url, name=name, max_loaded_models=2)
+            for name in ("first", "second", "third")
+        }
+        config = write_config(tmp_path, mock.url, tasks=4, models=models)
+        scheduler = Scheduler(4, policy="affinity")
+        evaluated, _ = evaluate(config, scheduler)
+    finally:
+        mock.stop()
+
+    (swaps,) = scheduler.swaps.values()
+    assert (swaps.loads, swaps.unloads) == (3, 3)
+    assert swaps.load_duration >= 3 * 0.05
+    assert all(result is not None for _, result in evaluated)
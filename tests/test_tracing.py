@@ -0,0 +1,33 @@
+# SPDX-FileCopyrightText: Copyright 2024 Siemens AG
+# SPDX-License-Identifier: MIT
+
+from industrial_mllm_benchmark import OllamaModel
+from industrial_mllm_benchmark.mock_server import MockServer
+from industrial_mllm_benchmark.parse_context import ParseContext
+from industrial_mllm_benchmark.tracing import Tracer
+import asyncio
+
+
+def test_spans_of_async_prompts_record_their_task(mock_server: MockServer) -> None:
+    model = OllamaModel("mock", mock_server.url, "m", {})
+    tracer = Tracer()
+
+    async def prompt(pc: ParseContext, name: str) -> None:
+        asyncio.current_task().set_name(name)
+        await model.prompt_async(pc, {"text": "s"}, [("text", name)])
+
+    async def prompts() -> None:
+        with ParseContext.root("[test]", tracer=tracer) as pc:
+            await asyncio.gather(prompt(pc.fork(), "a"), prompt(pc.fork(), "b"))
+
+    asyncio.run(prompts())
+
+    (root,) = [span for span in tracer.spans if span.parent_id is None]
+    requests = [span for span in tracer.spans if span.name == "http"]
+    assert sorted(span.thread.rsplit("/", 1)[1] for span in requests) == ["a", "b"]
+    encodes = {span.span_id: span for span in tracer.spans if span.name == "encode"}
+    # both prompts are children of the root, not of each other
+    assert all(span.parent_id == root.span_id for span in encodes.values())
+    events = tracer.chrome()["traceEvents"]
+    threads = {event["args"]["name"] for event in events if event["ph"] == "M"}
+    assert {name.rsplit("/", 1)[1] for name in threads} >= {"a", "b"}
@@ -0,0 +1,79 @@
+# SPDX-FileCopyrightText: Copyright 2024 Siemens AG
+# SPDX-License-Identifier: MIT
+
+from typing import Any, Iterator
+from industrial_mllm_benchmark import OllamaModel
+from industrial_mllm_benchmark.mock_server import MockServer
+from industrial_mllm_benchmark.parse_context import ParseContext
+from industrial_mllm_benchmark.rate_limit import RetryPolicy
+from industrial_mllm_benchmark.transport import HttpResponse
+import json
+
+
+class Stream:
+    """Event stream of a response which records whether it was closed"""
+
+    def __init__(self) -> None:
+        self.closed = False
+
+    def lines(self) -> Iterator[bytes]:
+        yield b"data: [DONE]"
+
+    def close(self) -> None:
+        self.closed = True
+
+
+class Transport:
+    """Answers with a streamed 503 first, then with a completion"""
+
+    def __init__(self) -> None:
+        self.stream = Stream()
+        self.requests = 0
+
+    def post(self, *args: Any) -> HttpResponse:
+        self.requests += 1
+        if self.requests == 1:
+            headers = {"content-type": "text/event-stream"}
+            return HttpResponse(503, headers, b"", self.stream.lines(), self.stream)
+        body = {
+            "choices": [{"message": {"content": "answer"}}],
+            "usage": {"completion_tokens": 1, "prompt_tokens": 2, "total_tokens": 3},
+        }
+        return HttpResponse(200, {}, json.dumps(body).encode("utf-8"))
+
+
+def test_retried_stream_is_closed() -> None:
+    model = OllamaModel("mock", "http://127.0.0.1:1/v1/chat/completions", "m", {})
+    model._retry_policy = RetryPolicy(backoff=0.0, max_backoff=0.0)
+    model._transport = Transport()
+    payload = model._compile_payload({"text": "s"}, [("text", "q")])
+
+    with ParseContext.root("[test]") as pc:
+        answer = model._retrying_call_open_ai(pc, {}, payload)
+
+    assert answer.value == "answer"
+    assert answer.requests == 2
+    assert model._transport.stream.closed
+
+
+def test_usage_of_streams_is_requested(mock_server: MockServer) -> None:
+    model = OllamaModel("mock", mock_server.url, "m", {}, stream=True)
+    with ParseContext.root("[test]") as pc:
+        answer = model.prompt(pc, {"text": "s"}, [("text", "q")])
+
+    assert answer.value == "1"
+    assert answer.prompt_tokens > 0
+    assert answer.total_tokens == answer.prompt_tokens + answer.completion_tokens
+
+
+def test_unstreamed_requests_have_no_stream_options() -> None:
+    model = OllamaModel(
+        "mock", "http://127.0.0.1:1/v1/chat/completions", "m", {}, stream=True
+    )
+    payload = model._compile_payload({"text": "s"}, [("text", "q")])
+
+    assert (
+        "stream_options"
+        not in model.batch_request({"text": "s"}, [("text", "q")]).json()
+    )
+    assert "stream_options" not in payload.with_fields(n=2, stream=False).body().json()
@@ -0,0 +1,73 @@
+# SPDX-FileCopyrightText: Copyright 2024 Siemens AG
+# SPDX-License-Identifier: MIT
+
+from pathlib import Path
+from industrial_mllm_benchmark import OllamaModel
+from industrial_mllm_benchmark.base.base_graders import expected_answer
+from industrial_mllm_benchmark.mock_server import MockServer
+from industrial_mllm_benchmark.parse_context import ParseContext
+from industrial_mllm_benchmark.verdict_cache import VerdictCache
+
+SYSTEM = "Rate the similarity from 0 to 1."
+USER = "One: {actual_answer} Two: {expected_answer}"
+
+
+def test_keys_ignore_whitespace() -> None:
+    key = VerdictCache.key("the answer", "expected", "judge", SYSTEM, USER)
+
+    assert (
+        VerdictCache.key(" the\n answer ", "expected\t", "judge", SYSTEM, USER) == key
+    )
+    assert (
+        VerdictCache.key("the answer", "expected", "judge", f" {SYSTEM}", USER) == key
+    )
+    # the case and the words matter
+    assert VerdictCache.key("The answer", "expected", "judge", SYSTEM, USER) != key
+    assert VerdictCache.key("the answer", "other", "judge", SYSTEM, USER) != key
+    assert VerdictCache.key("the answer", "expected", "other", SYSTEM, USER) != key
+    assert VerdictCache.key("the answer", "expected", "judge", "Rate.", USER) != key
+    identity = {"model": "m"}
+    assert (
+        VerdictCache.key("the answer", "expected", "judge", SYSTEM, USER, identity)
+        != key
+    )
+
+
+def test_hits_and_misses_are_persisted(tmp_path: Path) -> None:
+    path = tmp_path / "verdicts.jsonl"
+    cache = VerdictCache(path)
+    assert cache.get("a") is None
+    cache.put("a", "0.5")
+    assert cache.get("a") == "0.5"
+    cache.close()
+    assert cache.stats() == {"judge_calls_avoided": 1, "judge_calls": 1}
+
+    # the verdicts are shared with later runs, broken lines are skipped
+    with path.open("a", encoding="utf-8") as f:
+        f.write('{"key": "b", "verd\n')
+    reopened = VerdictCache(path)
+    assert reopened.get("a") == "0.5"
+    assert reopened.get("b") is None
+    reopened.close()
+
+
+def test_judge_is_called_once_per_verdict(
+    tmp_path: Path, mock_server: MockServer
+) -> None:
+    cache = VerdictCache(tmp_path / "verdicts.jsonl")
+    context = {
+        "models": {"judge": OllamaModel("judge", mock_server.url, "m", {})},
+        "verdict_cache": cache,
+    }
+
+    def grade(actual: str) -> float:
+        with ParseContext.root("[test]") as pc:
+            return expected_answer(pc, context, "1", actual, "judge", SYSTEM, USER)
+
+    assert grade("one  answer") == 1.0
+    assert grade(" one answer\n") == 1.0
+    assert grade("another answer") == 1.0
+    cache.close()
+
+    assert mock_server.stats()["requests"] == 2
+    assert cache.stats() == {"judge_calls_avoided": 1, "judge_calls": 2}
@@ -0,0 +1,102 @@
+# SPDX-FileCopyrightText: Copyright 2024 Siemens AG
+# SPDX-License-Identifier: MIT
+
+from pathlib import Path
+from industrial_mllm_benchmark.benchmark import Benchmark
+from industrial_mllm_benchmark.graders import GraderResults
+from industrial_mllm_benchmark.mock_server import MockServer
+from industrial_mllm_benchmark.models import ModelEvalResult
+from industrial_mllm_benchmark.parse_context import ParseContext
+from industrial_mllm_benchmark.results import load_result
+from industrial_mllm_benchmark.tasks import EvalUnit
+from industrial_mllm_benchmark.work_queue import (
+    DONE,
+    FAILED,
+    LEASED,
+    PENDING,
+    WorkQueue,
+)
+from conftest import invoke, write_config
+
+
+def units(tmp_path: Path, endpoint: str, tasks: int = 3) -> list[EvalUnit]:
+    with ParseContext.root("[test]") as pc:
+        return Benchmark.parse(pc, write_config(tmp_path, endpoint, tasks)).units()
+
+
+def test_units_are_added_once(tmp_path: Path) -> None:
+    queue = WorkQueue(tmp_path / "queue.sqlite")
+    queued = units(tmp_path, "http://127.0.0.1:1")
+
+    assert queue.add(queued) == 3
+    assert queue.add(queued) == 0
+    assert queue.counts() == {PENDING: 3, LEASED: 0, DONE: 0, FAILED: 0}
+
+
+def test_units_are_leased_once_in_order(tmp_path: Path) -> None:
+    path = tmp_path / "queue.sqlite"
+    queued = units(tmp_path, "http://127.0.0.1:1", tasks=2)
+    WorkQueue(path).add(queued)
+    # two connections to the file, like two worker processes
+    first, second = WorkQueue(path), WorkQueue(path)
+
+    assert first.lease("a", 60) == queued[0].key
+    assert second.lease("b", 60) == queued[1].key
+    assert first.lease("a", 60) is None
+
+
+def test_expired_leases_are_leased_again(tmp_path: Path) -> None:
+    queue = WorkQueue(tmp_path / "queue.sqlite")
+    queued = units(tmp_path, "http://127.0.0.1:1", tasks=1)
+    queue.add(queued)
+
+    assert queue.lease("crashed", -1) == queued[0].key
+    assert queue.counts()[PENDING] == 1
+    assert queue.lease("other", 60) == queued[0].key
+    assert queue.counts()[LEASED] == 1
+
+
+def test_failed_units_are_given_up_after_max_attempts(tmp_path: Path) -> None:
+    queue = WorkQueue(tmp_path / "queue.sqlite")
+    queue.add(units(tmp_path, "http://127.0.0.1:1", tasks=1))
+
+    key = queue.lease("a", 60)
+    assert queue.fail(key, "a", "first", max_attempts=2) == PENDING
+    assert queue.lease("a", 60) == key
+    assert queue.fail(key, "a", "second", max_attempts=2) == FAILED
+    assert queue.lease("a", 60) is None
+    assert queue.failures() == {key: "second"}
+
+
+def test_only_the_holder_of_a_lease_completes_a_unit(tmp_path: Path) -> None:
+    queue = WorkQueue(tmp_path / "queue.sqlite")
+    queue.add(units(tmp_path, "http://127.0.0.1:1", tasks=1))
+    result = ModelEvalResult("mock", "1", 0.1, GraderResults(0.5, 1.0, "pass", []))
+
+    key = queue.lease("slow", -1)
+    # the expired lease is taken over by another worker
+    assert queue.lease("other", 60) == key
+    assert not queue.complete(key, "slow", result)
+    assert queue.fail(key, "slow", "timeout", max_attempts=1) is None
+    assert queue.counts()[LEASED] == 1
+
+    assert queue.complete(key, "other", result)
+    assert not queue.complete(key, "other", result)
+    assert queue.results() == {key: result}
+
+
+def test_workers_drain_the_queue(tmp_path: Path, mock_server: MockServer) -> None:
+    config = write_config(tmp_path, mock_server.url, tasks=3)
+    dest = tmp_path / "results"
+    queue = dest / "benchmark.queue.sqlite"
+    invoke("coordinate", "-c", str(config), "-d", str(dest), "--no-wait")
+
+    invoke("worker", "--queue", str(queue))
+    # nothing is left for a second worker
+    invoke("worker", "--queue", str(queue))
+    invoke("coordinate", "-c", str(config), "-d", str(dest))
+
+    assert mock_server.stats()["requests"] == 3
+    result = load_result(dest / "benchmark.json")
+    for task in result["evaluation"]["set"].values():
+        assert task["models"]["mock"]["grader_result"]["status"] == "pass"